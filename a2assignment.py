@@ -21,38 +21,1315 @@ This file contains the WasteWrangler class and some simple testing functions.
 """
 
 import datetime as dt
+import heapq
+import io
+import json
+import math
+import multiprocessing
+import os
 import psycopg2 as pg
 import psycopg2.extensions as pg_ext
 import psycopg2.extras as pg_extras
-from typing import Optional, TextIO
+import psycopg2.pool as pg_pool
+import psycopg2.sql as pg_sql
+import re
+import threading
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial, wraps
+from itertools import accumulate
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+from weakref import WeakKeyDictionary
+
+
+# Plans and inserts a single trip for route %(rid)s starting at %(time)s
+# without creating any views. Every step of the old view chain
+# (AvailableTrucks, OnMain, OnTrip, FreeTrucks, CanDrive, HaveTrip,
+# FreeDrivers, AllTDPairs, FinalDrivers) is a CTE here, so scheduling is one
+# round-trip and takes no catalog locks. The first use of %(time)s gives it
+# its type when the query is prepared.
+# Returns the inserted rID, or no row if the trip could not be scheduled.
+_SCHEDULE_TRIP_SQL = """
+    WITH Req AS (
+        SELECT rID, wasteType, %(time)s::timestamp AS beginTime,
+               %(time)s + make_interval(secs => trunc(3600 * length / 5))
+                   AS endingTime
+        FROM Route
+        WHERE rID = %(rid)s
+    ),
+    -- the trip must fit in working hours and the route must be free that day
+    ValidReq AS (
+        SELECT *
+        FROM Req
+        WHERE beginTime::time >= '08:00' AND endingTime::time <= '16:00'
+          AND NOT EXISTS (
+              SELECT 1
+              FROM Trip
+              WHERE Trip.rID = Req.rID
+                AND Trip.tTIME >= date_trunc('day', %(time)s)
+                AND Trip.tTIME < date_trunc('day', %(time)s)
+                                 + interval '1 day')
+    ),
+    -- trips that overlap this one or come within 30 minutes of it; no trip
+    -- is longer than the 8 hour working day, which bounds the tTIME range.
+    -- The bounds on %(time)s are redundant, but let a partitioned Trip be
+    -- pruned.
+    Busy AS (
+        SELECT Trip.tID, Trip.eID1, Trip.eID2
+        FROM ValidReq, Trip JOIN Route ON Route.rID = Trip.rID
+        WHERE Trip.tTIME >= %(time)s - interval '8 hours 30 minutes'
+          AND Trip.tTIME <= %(time)s + interval '8 hours 30 minutes'
+          AND Trip.tTIME <= ValidReq.endingTime + interval '30 minutes'
+          AND Trip.tTIME + make_interval(secs => trunc(3600 * Route.length / 5))
+              >= ValidReq.beginTime - interval '30 minutes'
+    ),
+    BusyDrivers AS (
+        (SELECT eID1 AS eID FROM Busy) UNION (SELECT eID2 AS eID FROM Busy)
+    ),
+    -- best free truck and a free driver who can drive it
+    FirstPair AS (
+        SELECT Truck.tID, Employee.eID
+        FROM ValidReq
+            JOIN TruckType ON TruckType.wasteType = ValidReq.wasteType
+            JOIN Truck ON Truck.truckType = TruckType.truckType
+            JOIN Driver ON Driver.truckType = Truck.truckType
+            JOIN Employee ON Employee.eID = Driver.eID
+        WHERE Employee.hireDate <= %(time)s::date
+          AND NOT EXISTS (
+              SELECT 1
+              FROM Maintenance
+              WHERE Maintenance.tID = Truck.tID
+                AND Maintenance.mDATE = %(time)s::date)
+          AND Truck.tID NOT IN (SELECT tID FROM Busy)
+          AND Employee.eID NOT IN (SELECT eID FROM BusyDrivers)
+        ORDER BY Truck.capacity DESC, Truck.tID, Employee.hireDate,
+                 Employee.eID
+        LIMIT 1
+    ),
+    -- any other free driver, who does not need to be able to drive the truck
+    SecondDriver AS (
+        SELECT Employee.eID
+        FROM Employee, FirstPair
+        WHERE Employee.hireDate <= %(time)s::date
+          AND Employee.eID != FirstPair.eID
+          AND Employee.eID IN (SELECT eID FROM Driver)
+          AND Employee.eID NOT IN (SELECT eID FROM BusyDrivers)
+        ORDER BY Employee.hireDate, Employee.eID
+        LIMIT 1
+    ),
+    BestFacility AS (
+        SELECT fID
+        FROM Facility, ValidReq
+        WHERE Facility.wasteType = ValidReq.wasteType
+        ORDER BY fID
+        LIMIT 1
+    )
+    INSERT INTO Trip (rID, tID, tTIME, volume, eID1, eID2, fID)
+    SELECT ValidReq.rID, FirstPair.tID, ValidReq.beginTime, NULL,
+           GREATEST(FirstPair.eID, SecondDriver.eID),
+           LEAST(FirstPair.eID, SecondDriver.eID), BestFacility.fID
+    FROM ValidReq, FirstPair, SecondDriver, BestFacility
+    RETURNING rID, eID1, eID2
+"""
+
+# Queries shared by WasteWrangler and AsyncWasteWrangler (a2async.py).
+_ROUTES_SQL = "SELECT rID, wasteType, length FROM Route"
+
+_DRIVERS_SQL = """
+    SELECT eID, hireDate, truckType
+    FROM Employee NATURAL JOIN Driver
+    ORDER BY hireDate, eID
+"""
+
+_FACILITIES_SQL = "SELECT wasteType, min(fID) FROM Facility GROUP BY wasteType"
+
+# The trucks to plan, or every truck if the tID array is NULL
+_FLEET_TRUCKS_SQL = """
+    SELECT tID, truckType, wasteType
+    FROM Truck NATURAL JOIN TruckType
+    WHERE %(tids)s::integer[] IS NULL OR tID = ANY(%(tids)s::integer[])
+    ORDER BY tID
+"""
+
+# What schedule_trip_many reads: the routes requested, the trucks, biggest
+# first, and the maintenance and trips on the days requested...
+_REQUESTED_ROUTES_SQL = """
+    SELECT rID, wasteType, length FROM Route WHERE rID = ANY(%s)
+"""
+
+_TRUCKS_BY_CAPACITY_SQL = """
+    SELECT tID, truckType, wasteType
+    FROM Truck NATURAL JOIN TruckType
+    ORDER BY capacity DESC, tID
+"""
+
+_DAYS_MAINTENANCE_SQL = """
+    SELECT tID, mDATE FROM Maintenance WHERE mDATE = ANY(%s)
+"""
+
+# ...with one sargable range per day instead of date(tTIME) = ANY(...), in the
+# constant range from %s up to (not including) %s that a partitioned Trip can
+# be pruned to
+_DAYS_TRIPS_SQL = """
+    SELECT rID, tID, tTIME, length, eID1, eID2
+    FROM Trip NATURAL JOIN Route JOIN unnest(%s::date[]) AS Day(d)
+        ON tTIME >= d AND tTIME < d + 1
+    WHERE tTIME >= %s AND tTIME < %s
+"""
+
+# The reference tables, read whole into a _ReferenceData snapshot along with
+# Route, which _ROUTES_SQL reads whole already
+_REFERENCE_TRUCKS_SQL = """
+    SELECT tID, truckType, capacity, wasteType
+    FROM Truck NATURAL JOIN TruckType
+"""
+_REFERENCE_FACILITIES_SQL = "SELECT fID, wasteType FROM Facility"
+_REFERENCE_EMPLOYEES_SQL = "SELECT eID, name, hireDate FROM Employee"
+_REFERENCE_DRIVERS_SQL = "SELECT eID, truckType FROM Driver"
+_REFERENCE_TECHNICIANS_SQL = "SELECT eID, truckType FROM Technician"
+
+# rID, tID, tTIME, route length, eID1 and eID2 of the trips from %(day)s up
+# to (not including) %(next_day)s
+_DAY_TRIPS_SQL = """
+    SELECT rID, tID, tTIME, length, eID1, eID2
+    FROM Trip JOIN Route USING (rID)
+    WHERE tTIME >= %(day)s AND tTIME < %(next_day)s
+"""
+
+_INSERT_TRIPS_SQL = """
+    INSERT INTO Trip (rID, tID, tTIME, volume, eID1, eID2, fID)
+    VALUES %s
+"""
+
+_IS_DRIVER_SQL = "SELECT 1 FROM Driver WHERE eID = %s"
+
+# Qualifications are COPY'd into this session-local table one chunk at a time,
+# and each chunk is validated, and taken out of it, in one statement.
+_QUALIFICATIONS_TABLE_SQL = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS QualificationImport (
+        fname TEXT, lname TEXT, truckType TEXT
+    ) ON COMMIT DELETE ROWS
+"""
+
+_COPY_QUALIFICATIONS_SQL = """
+    COPY QualificationImport (fname, lname, truckType) FROM STDIN
+"""
+
+# Adds every imported qualification of an existing employee (the lowest eID if
+# several share the name) for an existing truck type, unless the employee is
+# a driver or already has it.
+_INSERT_QUALIFIED_SQL = """
+    WITH QualificationChunk AS (
+        DELETE FROM QualificationImport
+        RETURNING fname, lname, truckType
+    ), EmployeeByName AS (
+        SELECT name, min(eID) AS eID
+        FROM Employee
+        GROUP BY name
+    )
+    INSERT INTO Technician (eID, truckType)
+    SELECT DISTINCT EmployeeByName.eID, QualificationChunk.truckType
+    FROM QualificationChunk JOIN EmployeeByName
+        ON EmployeeByName.name = QualificationChunk.fname || ' '
+                                 || QualificationChunk.lname
+    WHERE QualificationChunk.truckType IN (SELECT truckType FROM TruckType)
+      AND EmployeeByName.eID NOT IN (SELECT eID FROM Driver)
+    ON CONFLICT DO NOTHING
+"""
+
+_WORKMATES_SQL = "SELECT DISTINCT eID1, eID2 FROM Trip"
+
+_DRIVERS_AMONG_SQL = "SELECT DISTINCT eID FROM Driver WHERE eID = ANY(%s)"
+
+# The workmate sphere of %(eid)s, walked breadth-first by the server; UNION
+# drops the employees already reached, so the walk ends.
+_SPHERE_SQL = """
+    WITH RECURSIVE Sphere(eID) AS (
+        SELECT %(eid)s::integer
+        UNION
+        SELECT Workmate.eID
+        FROM Sphere, LATERAL (
+            SELECT eID2 FROM Trip WHERE eID1 = Sphere.eID
+            UNION ALL
+            SELECT eID1 FROM Trip WHERE eID2 = Sphere.eID
+        ) AS Workmate(eID)
+    )
+    SELECT eID FROM Sphere WHERE eID <> %(eid)s ORDER BY eID
+"""
+
+# The optional table of workmate components, kept by WasteWrangler's workmate
+# cache: each employee who has been on a trip, with an ID shared by everyone
+# in their workmate sphere. It is emptied with DELETE rather than TRUNCATE, so
+# that a reader's open transaction does not block the rebuild.
+_WORKMATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS WorkmateComponent (
+        eID INTEGER PRIMARY KEY,
+        component INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS workmatecomponent_component_idx
+        ON WorkmateComponent (component);
+    DELETE FROM WorkmateComponent;
+"""
+
+_UPSERT_WORKMATE_COMPONENTS_SQL = """
+    INSERT INTO WorkmateComponent (eID, component) VALUES %s
+    ON CONFLICT (eID) DO UPDATE SET component = EXCLUDED.component
+"""
+
+_TABLE_SPHERE_SQL = """
+    SELECT Other.eID
+    FROM WorkmateComponent AS Mine JOIN WorkmateComponent AS Other
+        ON Other.component = Mine.component
+    WHERE Mine.eID = %(eid)s AND Other.eID <> %(eid)s
+    ORDER BY Other.eID
+"""
+
+# The planner's estimate of the number of trips, added up over the partitions
+# of Trip if it is partitioned; -1 if Trip, or a partition, was never analyzed
+_TRIP_ESTIMATE_SQL = """
+    SELECT CASE WHEN min(reltuples) < 0 THEN -1
+                ELSE coalesce(sum(reltuples), 0) END
+    FROM pg_class
+    WHERE relkind = 'r'
+      AND (oid = 'Trip'::regclass
+           OR oid IN (SELECT inhrelid FROM pg_inherits
+                      WHERE inhparent = 'Trip'::regclass))
+"""
+
+# From about this many trips on, workmate_sphere's 'auto' mode computes the
+# sphere on the server rather than fetching every pair of workmates.
+_SERVER_SPHERE_MIN_TRIPS = 10000
+
+# Trucks due for maintenance: none from %(since)s until %(until)s
+_DUE_TRUCKS_SQL = """
+    SELECT tID, truckType
+    FROM Truck
+    WHERE tID NOT IN (
+        SELECT tID FROM Maintenance WHERE mDATE BETWEEN %(since)s AND %(until)s)
+    ORDER BY tID
+"""
+
+# The technicians who can work on the truck types in %(truck_types)s, and the
+# days after %(day)s on which they, or the trucks in %(tids)s, are taken by a
+# maintenance or (for trucks) a trip.
+_TECHNICIANS_SQL = """
+    SELECT eID, truckType, hireDate
+    FROM Technician NATURAL JOIN Employee
+    WHERE truckType = ANY(%(truck_types)s)
+    ORDER BY eID
+"""
+
+_TECHNICIAN_DAYS_SQL = """
+    SELECT eID, mDATE
+    FROM Maintenance
+    WHERE mDATE > %(day)s
+      AND eID IN (SELECT eID FROM Technician
+                  WHERE truckType = ANY(%(truck_types)s))
+"""
+
+# For the trucks, only the days before %(until)s are read: a truck's first
+# free day is almost always soon after %(day)s, and Trip holds every trip
+# planned ahead, not just those of the next few days.
+_TRUCK_DAYS_SQL = """
+    SELECT tID, mDATE FROM Maintenance
+    WHERE mDATE > %(day)s AND mDATE < %(until)s AND tID = ANY(%(tids)s)
+    UNION
+    SELECT tID, date(tTIME) FROM Trip
+    WHERE tTIME >= %(next_day)s AND tTIME < %(until)s
+      AND tID = ANY(%(tids)s)
+"""
+
+# How many days after the planned day _TRUCK_DAYS_SQL reads at first
+_MAINTENANCE_HORIZON = 30
+
+_INSERT_MAINTENANCES_SQL = """
+    INSERT INTO Maintenance (tID, eID, mDATE) VALUES %s
+"""
+
+# Moves the trips from %(first_day)s up to (not including) %(end_day)s to any
+# of the closed facilities %(fids)s to the facility with the smallest fID that
+# takes the same waste type and is not closed, and counts them per closed fID.
+_REROUTE_MANY_SQL = """
+    WITH Replacement AS (
+        SELECT wasteType, min(fID) AS fID
+        FROM Facility
+        WHERE fID != ALL(%(fids)s::integer[])
+        GROUP BY wasteType
+    ), Rerouted AS (
+        UPDATE Trip
+        SET fID = Replacement.fID
+        FROM Facility Closed JOIN Replacement
+            ON Replacement.wasteType = Closed.wasteType
+        WHERE Trip.fID = Closed.fID
+          AND Closed.fID = ANY(%(fids)s::integer[])
+          AND Trip.tTIME >= %(first_day)s AND Trip.tTIME < %(end_day)s
+        RETURNING Closed.fID
+    )
+    SELECT fID, count(*) FROM Rerouted GROUP BY fID
+"""
+
+# For reroute_waste_balanced: the trips to the closed facilities %(fids)s in
+# the range, biggest truck first, locked until they are moved...
+_CLOSED_TRIPS_SQL = """
+    SELECT Trip.rID, Trip.tTIME, Trip.fID, Facility.wasteType, Truck.capacity
+    FROM Trip JOIN Facility ON Facility.fID = Trip.fID
+        JOIN Truck ON Truck.tID = Trip.tID
+    WHERE Trip.fID = ANY(%(fids)s::integer[])
+      AND Trip.tTIME >= %(first_day)s AND Trip.tTIME < %(end_day)s
+    ORDER BY Truck.capacity DESC, Trip.tTIME, Trip.rID
+"""
+
+_LOCK_CLOSED_TRIPS_SQL = _CLOSED_TRIPS_SQL + "    FOR UPDATE OF Trip\n"
+
+# ...the facilities still open...
+_OPEN_FACILITIES_SQL = """
+    SELECT fID, wasteType
+    FROM Facility
+    WHERE fID != ALL(%(fids)s::integer[])
+    ORDER BY fID
+"""
+
+# ...and their load per day: the capacity of the trucks already sent there
+_FACILITY_LOAD_SQL = """
+    SELECT Trip.fID, date(Trip.tTIME), sum(Truck.capacity)
+    FROM Trip JOIN Truck ON Truck.tID = Trip.tID
+    WHERE Trip.fID != ALL(%(fids)s::integer[])
+      AND Trip.tTIME >= %(first_day)s AND Trip.tTIME < %(end_day)s
+    GROUP BY Trip.fID, date(Trip.tTIME)
+"""
+
+# ...to be moved, given as parallel arrays of rID, tTIME and new fID, all
+# from %s up to (not including) %s
+_MOVE_TRIPS_SQL = """
+    UPDATE Trip
+    SET fID = Moved.fID
+    FROM unnest(%s::integer[], %s::timestamp[], %s::integer[])
+        AS Moved (rID, tTIME, fID)
+    WHERE Trip.rID = Moved.rID AND Trip.tTIME = Moved.tTIME
+      AND Trip.tTIME >= %s AND Trip.tTIME < %s
+"""
+
+# A statement of a data file that setup loads with COPY: INSERT INTO a table
+# VALUES rows of literals. Any other statement is run as it is.
+_INSERT_VALUES_RE = re.compile(r"\s*INSERT\s+INTO\s+(\w+)\s+VALUES\s*\(",
+                               re.IGNORECASE)
+
+# A literal of such a statement: a quoted string, a number or NULL
+_LITERAL = r"('(?:[^']|'')*'|[-+0-9.eE]+|NULL)"
+
+_LITERAL_RE = re.compile(r"\s*" + _LITERAL + r"\s*([,)])", re.IGNORECASE)
+
+_NEXT_ROW_RE = re.compile(r"\s*,\s*\(")
+
+_END_OF_STATEMENT_RE = re.compile(r"\s*;?\s*$")
+
+# What starts a string literal, or a -- comment outside of one
+_QUOTE_OR_COMMENT_RE = re.compile(r"'|--")
+
+# The schema setup_from_template keeps a loaded copy of the data in, the
+# creation order of the tables of a schema, which respects their foreign keys,
+# and those foreign keys
+_TEMPLATE_SCHEMA = 'waste_wrangler_template'
+
+_SCHEMA_TABLES_SQL = """
+    SELECT relname
+    FROM pg_class
+    WHERE relnamespace = %s::regnamespace AND relkind = 'r'
+    ORDER BY oid
+"""
+
+_SCHEMA_FOREIGN_KEYS_SQL = """
+    SELECT relname, conname, pg_get_constraintdef(pg_constraint.oid)
+    FROM pg_constraint JOIN pg_class ON pg_class.oid = conrelid
+    WHERE connamespace = %s::regnamespace AND contype = 'f'
+    ORDER BY pg_constraint.oid
+"""
+
+# Starts the read-only snapshot the plan_* methods work in
+_SNAPSHOT_SQL = "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"
+
+# The statements already prepared in the session
+_PREPARED_STATEMENTS_SQL = "SELECT name FROM pg_prepared_statements"
+
+# Indexes created by setup. The scheduler queries filter Trip by sargable
+# tTIME ranges (never date(tTIME)), so plain b-trees on tTIME, and on tTIME per
+# employee, answer the conflict checks without scanning Trip. Trip's
+# UNIQUE (tID, tTIME) already covers the per-truck lookups. The (eID1, eID2)
+# and (eID2, eID1) indexes let _SPHERE_SQL follow workmates with index-only
+# scans, and ANALYZE gives workmate_sphere an estimate of Trip's size.
+_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS trip_ttime_idx ON Trip (tTIME);
+    CREATE INDEX IF NOT EXISTS trip_eid1_ttime_idx ON Trip (eID1, tTIME);
+    CREATE INDEX IF NOT EXISTS trip_eid2_ttime_idx ON Trip (eID2, tTIME);
+    CREATE INDEX IF NOT EXISTS maintenance_mdate_idx ON Maintenance (mDATE);
+    CREATE INDEX IF NOT EXISTS trip_eid1_eid2_idx ON Trip (eID1, eID2);
+    CREATE INDEX IF NOT EXISTS trip_eid2_eid1_idx ON Trip (eID2, eID1);
+    ANALYZE Trip;
+"""
+
+# The tables partition_tables range-partitions by month, and their partition
+# keys. The partition of a month is named like trip_y2023m05.
+_PARTITION_KEYS = {'trip': 'ttime', 'maintenance': 'mdate'}
+
+# Creates the missing partitions of the partitioned table $1 for the months of
+# the days in $2, and returns how many it created. Sessions that need to
+# create one take turns, so two never create the same partition.
+_ENSURE_PARTITIONS_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION ensure_partitions(parent regclass, days date[])
+    RETURNS integer LANGUAGE plpgsql AS $$
+    DECLARE
+        parent_schema name;
+        parent_name name;
+        month date;
+        partition_name text;
+        created integer := 0;
+    BEGIN
+        SELECT relnamespace::regnamespace::name, relname
+        INTO parent_schema, parent_name
+        FROM pg_class WHERE oid = parent;
+
+        FOR month IN SELECT DISTINCT date_trunc('month', day)::date
+                     FROM unnest(days) AS day WHERE day IS NOT NULL
+        LOOP
+            partition_name := parent_name || to_char(month, '"_y"YYYY"m"MM');
+            CONTINUE WHEN EXISTS (
+                SELECT 1 FROM pg_class
+                WHERE relname = partition_name
+                  AND relnamespace = parent_schema::regnamespace);
+            PERFORM pg_advisory_xact_lock(parent::oid::bigint);
+            -- another session may have created it while we waited
+            CONTINUE WHEN EXISTS (
+                SELECT 1 FROM pg_class
+                WHERE relname = partition_name
+                  AND relnamespace = parent_schema::regnamespace);
+            EXECUTE format(
+                'CREATE TABLE %I.%I PARTITION OF %s '
+                'FOR VALUES FROM (%L) TO (%L)',
+                parent_schema, partition_name, parent, month,
+                (month + interval '1 month')::date);
+            created := created + 1;
+        END LOOP;
+        RETURN created;
+    END
+    $$
+"""
+
+_ENSURE_PARTITIONS_SQL = "SELECT ensure_partitions(%s, %s::date[])"
+
+# The tables of the search path's first schema that are partitioned
+_PARTITIONED_TABLES_SQL = """
+    SELECT relname
+    FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = partrelid
+    WHERE relnamespace = current_schema()::regnamespace
+"""
+
+# The primary key, unique and foreign key constraints of the table %s, and
+# its indexes that back no constraint, which partition_tables moves over to
+# the partitioned table
+_TABLE_CONSTRAINTS_SQL = """
+    SELECT conname, pg_get_constraintdef(oid)
+    FROM pg_constraint
+    WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')
+    ORDER BY contype DESC, oid
+"""
+
+_TABLE_INDEXES_SQL = """
+    SELECT pg_get_indexdef(indexrelid)
+    FROM pg_index
+    WHERE indrelid = %s::regclass
+      AND indexrelid NOT IN (SELECT conindid FROM pg_constraint)
+    ORDER BY indexrelid
+"""
+
+# The partitions partition_tables starts with for the table {table}, renamed
+# {old} meanwhile: one per month it has rows in, and one for the current
+# month and each of the %s months after it
+_FIRST_PARTITIONS_SQL = """
+    SELECT ensure_partitions({table}::regclass,
+        array(SELECT DISTINCT date_trunc('month', {key})::date FROM {old})
+        || array(SELECT generate_series(
+                     date_trunc('month', current_date),
+                     date_trunc('month', current_date)
+                         + make_interval(months => %s),
+                     interval '1 month')::date))
+"""
+
+# The label of each SQL constant above in the metrics, e.g. 'due_trucks' for
+# _DUE_TRUCKS_SQL, keyed by its text; _prepared_form adds the EXECUTE
+# statement of each prepared one. Other statements are labelled by their
+# first keywords (see _sql_label).
+_SQL_LABELS = {
+    _SCHEDULE_TRIP_SQL: 'schedule_trip',
+    _ROUTES_SQL: 'routes',
+    _DRIVERS_SQL: 'drivers',
+    _FACILITIES_SQL: 'facilities',
+    _FLEET_TRUCKS_SQL: 'fleet_trucks',
+    _REQUESTED_ROUTES_SQL: 'requested_routes',
+    _TRUCKS_BY_CAPACITY_SQL: 'trucks_by_capacity',
+    _DAYS_MAINTENANCE_SQL: 'days_maintenance',
+    _DAYS_TRIPS_SQL: 'days_trips',
+    _REFERENCE_TRUCKS_SQL: 'reference_trucks',
+    _REFERENCE_FACILITIES_SQL: 'reference_facilities',
+    _REFERENCE_EMPLOYEES_SQL: 'reference_employees',
+    _REFERENCE_DRIVERS_SQL: 'reference_drivers',
+    _REFERENCE_TECHNICIANS_SQL: 'reference_technicians',
+    _DAY_TRIPS_SQL: 'day_trips',
+    _INSERT_TRIPS_SQL: 'insert_trips',
+    _IS_DRIVER_SQL: 'is_driver',
+    _QUALIFICATIONS_TABLE_SQL: 'qualifications_table',
+    _COPY_QUALIFICATIONS_SQL: 'copy_qualifications',
+    _INSERT_QUALIFIED_SQL: 'insert_qualified',
+    _WORKMATES_SQL: 'workmates',
+    _DRIVERS_AMONG_SQL: 'drivers_among',
+    _SPHERE_SQL: 'sphere',
+    _WORKMATE_TABLE_SQL: 'workmate_table',
+    _UPSERT_WORKMATE_COMPONENTS_SQL: 'upsert_workmate_components',
+    _TABLE_SPHERE_SQL: 'table_sphere',
+    _TRIP_ESTIMATE_SQL: 'trip_estimate',
+    _DUE_TRUCKS_SQL: 'due_trucks',
+    _TECHNICIANS_SQL: 'technicians',
+    _TECHNICIAN_DAYS_SQL: 'technician_days',
+    _TRUCK_DAYS_SQL: 'truck_days',
+    _INSERT_MAINTENANCES_SQL: 'insert_maintenances',
+    _REROUTE_MANY_SQL: 'reroute_many',
+    _CLOSED_TRIPS_SQL: 'closed_trips',
+    _LOCK_CLOSED_TRIPS_SQL: 'lock_closed_trips',
+    _OPEN_FACILITIES_SQL: 'open_facilities',
+    _FACILITY_LOAD_SQL: 'facility_load',
+    _MOVE_TRIPS_SQL: 'move_trips',
+    _SCHEMA_TABLES_SQL: 'schema_tables',
+    _SCHEMA_FOREIGN_KEYS_SQL: 'schema_foreign_keys',
+    _SNAPSHOT_SQL: 'snapshot',
+    _PREPARED_STATEMENTS_SQL: 'prepared_statements',
+    _INDEX_SQL: 'index',
+    _ENSURE_PARTITIONS_FUNCTION_SQL: 'ensure_partitions_function',
+    _ENSURE_PARTITIONS_SQL: 'ensure_partitions',
+    _PARTITIONED_TABLES_SQL: 'partitioned_tables',
+    _TABLE_CONSTRAINTS_SQL: 'table_constraints',
+    _TABLE_INDEXES_SQL: 'table_indexes',
+    _FIRST_PARTITIONS_SQL: 'first_partitions',
+}
+
+# The start of what execute_values sends for the constants it is used with
+_SQL_PAGE_LABELS = [(sql.partition('%s')[0].encode(), label)
+                    for sql, label in _SQL_LABELS.items()
+                    if 'VALUES %s' in sql]
+
+# Per-thread state of the instrumentation: _calls.current is the _Call in
+# progress on the thread, if any.
+_calls = threading.local()
+
+# The placeholders of a query for psycopg2, %(name)s or %s, and escaped %s
+_PLACEHOLDER_RE = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def _sql_label(query) -> str:
+    """Return the label of the statement <query>, as a str or as the bytes
+    psycopg2 sends: the label of the SQL constant it is, or comes from, or
+    else its first keyword (both keywords for EXECUTE), in lowercase.
+    """
+    label = _SQL_LABELS.get(query)
+    if label is not None:
+        return label
+    if isinstance(query, bytes):
+        for head, label in _SQL_PAGE_LABELS:
+            if query.startswith(head):
+                return label
+        return query.split(None, 1)[0].decode().lower()
+    return _keyword_label(query)
+
+
+@lru_cache(maxsize=1024)
+def _keyword_label(query: str) -> str:
+    """Return the label of the statement <query>, which is no SQL constant:
+    its first keyword (both keywords for EXECUTE), in lowercase. The cache is
+    bounded, so ad-hoc statements do not pile up in a long-running process.
+    """
+    words = query.split(None, 2)
+    return ' '.join(words[:2] if words[0].upper() == 'EXECUTE'
+                    else words[:1]).lower()
+
+
+def _sql_statements(query) -> int:
+    """Return the number of statements in <query>, a str or bytes: one more
+    than the semicolons that separate them.
+    """
+    if isinstance(query, bytes):
+        return 1
+    return 1 + query.rstrip().rstrip(';').count(';')
+
+
+def _prepared_form(query: str) -> tuple[str, str, str, list]:
+    """Return the name of the prepared statement for the SQL constant
+    <query>, the PREPARE statement that creates it, the EXECUTE statement
+    that runs it, with a %s per parameter, and where each parameter comes
+    from in the parameters of <query>: a key for %(key)s, a position for %s.
+    """
+    name = f"ww_{_SQL_LABELS[query]}"
+    keys = []
+
+    def number(placeholder: re.Match) -> str:
+        if placeholder.group(0) == '%%':
+            return '%'
+        key = placeholder.group(1)
+        if key is None:
+            key = len(keys)
+        if key not in keys:
+            keys.append(key)
+        return f"${keys.index(key) + 1}"
+
+    prepare_sql = f"PREPARE {name} AS {_PLACEHOLDER_RE.sub(number, query)}"
+
+    execute_sql = f"EXECUTE {name}"
+    if keys:
+        execute_sql += f" ({', '.join(['%s'] * len(keys))})"
+    # runs of the statement are counted under the constant's label
+    _SQL_LABELS[execute_sql] = _SQL_LABELS[query]
+    return name, prepare_sql, execute_sql, keys
+
+
+# The SQL constants WasteWrangler runs as prepared statements (see
+# _Statements), with their _prepared_form: the lookups and updates that its
+# methods send with the same text on every call. The multi-row inserts, whose
+# text depends on the number of rows, and DDL are sent as they are.
+_PREPARED = {query: _prepared_form(query) for query in [
+    _SCHEDULE_TRIP_SQL, _ROUTES_SQL, _DRIVERS_SQL, _FACILITIES_SQL,
+    _FLEET_TRUCKS_SQL, _REQUESTED_ROUTES_SQL, _TRUCKS_BY_CAPACITY_SQL,
+    _DAYS_MAINTENANCE_SQL, _DAYS_TRIPS_SQL, _REFERENCE_TRUCKS_SQL,
+    _REFERENCE_FACILITIES_SQL, _REFERENCE_EMPLOYEES_SQL,
+    _REFERENCE_DRIVERS_SQL, _REFERENCE_TECHNICIANS_SQL, _DAY_TRIPS_SQL,
+    _IS_DRIVER_SQL, _INSERT_QUALIFIED_SQL, _WORKMATES_SQL,
+    _DRIVERS_AMONG_SQL, _SPHERE_SQL, _TABLE_SPHERE_SQL, _TRIP_ESTIMATE_SQL,
+    _DUE_TRUCKS_SQL, _TECHNICIANS_SQL, _TECHNICIAN_DAYS_SQL, _TRUCK_DAYS_SQL,
+    _REROUTE_MANY_SQL, _CLOSED_TRIPS_SQL, _LOCK_CLOSED_TRIPS_SQL,
+    _OPEN_FACILITIES_SQL, _FACILITY_LOAD_SQL, _MOVE_TRIPS_SQL,
+    _ENSURE_PARTITIONS_SQL,
+]}
+
+
+def _is_missing_partition(error: Exception) -> bool:
+    """Return whether <error>, from psycopg2 or psycopg 3, is PostgreSQL's
+    for a row that no partition of a partitioned table accepts.
+    """
+    diag = getattr(error, 'diag', None)
+    message = getattr(diag, 'message_primary', None) or ''
+    return message.startswith('no partition of relation')
+
+
+def _with_connection(method: Callable) -> Callable:
+    """Decorator for the public methods of WasteWrangler that use the database.
+
+    In pooled mode, check a connection out of the pool for the calling thread
+    for the duration of the call, so that <self.connection> refers to it, and
+    release it afterwards. A call made while the thread already holds a
+    connection, e.g. schedule_trips calling schedule_fleet, reuses it.
+
+    If metrics are being collected (see collect_metrics), also record the
+    call and the statements it runs. A call made from within another one is
+    counted as part of the outer call.
+    """
+    def call(self: 'WasteWrangler', args: tuple, kwargs: dict):
+        if (self._pool is None
+                or getattr(self._local, 'connection', None) is not None):
+            return method(self, *args, **kwargs)
+
+        self._local.connection = self._pool.checkout()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            conn, self._local.connection = self._local.connection, None
+            self._pool.release(conn)
+
+    @wraps(method)
+    def wrapper(self: 'WasteWrangler', *args, **kwargs):
+        metrics = self._metrics
+        if metrics is None or getattr(_calls, 'current', None) is not None:
+            return call(self, args, kwargs)
+
+        current = _calls.current = _Call()
+        try:
+            return call(self, args, kwargs)
+        finally:
+            _calls.current = None
+            metrics.record(method.__name__, current)
+
+    return wrapper
+
+
+class _ConnectionPool:
+    """A pool of connections that threads wait on when all of them are in use,
+    and that keeps track of how it is used.
+
+    === Instance Attributes ===
+    size: the maximum number of connections open at once.
+
+    === Private Attributes ===
+    _pool: the underlying psycopg2 pool.
+    _slots: counts the connections that can still be checked out. psycopg2's
+        pool raises an error instead of waiting when it is exhausted.
+    _lock: protects the statistics below.
+    _in_use: the number of connections checked out right now.
+    _checkouts: the number of checkouts so far.
+    _total_wait: seconds spent waiting for a connection, over all checkouts.
+    _max_wait: the longest wait for a connection, in seconds.
+    """
+    size: int
+    _pool: pg_pool.ThreadedConnectionPool
+    _slots: threading.BoundedSemaphore
+    _lock: threading.Lock
+    _in_use: int
+    _checkouts: int
+    _total_wait: float
+    _max_wait: float
+
+    def __init__(self, size: int, **connect_args) -> None:
+        """Open a pool of up to <size> connections, each made by passing
+        <connect_args> to psycopg2.connect. One connection is opened right
+        away, so that bad credentials are reported here.
+        """
+        self.size = size
+        self._pool = pg_pool.ThreadedConnectionPool(1, size, **connect_args)
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def checkout(self) -> pg_ext.connection:
+        """Return a connection for the exclusive use of the caller, waiting
+        until one is free if needed.
+        """
+        started = perf_counter()
+        self._slots.acquire()
+        waited = perf_counter() - started
+        try:
+            conn = self._pool.getconn()
+        except pg.Error:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def release(self, conn: pg_ext.connection) -> None:
+        """Give <conn> back to the pool, rolling back any transaction the
+        caller left open.
+        """
+        try:
+            if not conn.closed and conn.status != pg_ext.STATUS_READY:
+                conn.rollback()
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def stats(self) -> dict[str, float]:
+        """Return the size of the pool, the connections in use, the number of
+        checkouts, and the total, mean and maximum time spent waiting for a
+        connection in seconds.
+        """
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'checkouts': self._checkouts,
+                'total_wait': self._total_wait,
+                'mean_wait': self._total_wait / max(self._checkouts, 1),
+                'max_wait': self._max_wait,
+            }
+
+    def close(self) -> None:
+        """Close every connection of the pool."""
+        self._pool.closeall()
+
+
+class _Histogram:
+    """A histogram of durations, in buckets a quarter of a power of two wide,
+    so that percentiles are over-estimated by at most 19%.
+
+    === Instance Attributes ===
+    count: the number of durations added.
+    total: the sum of the durations, in seconds.
+    max: the longest duration, in seconds.
+    buckets: maps each bucket to the number of durations in it; the
+        durations in bucket b are at most 2 ** (b / 4) seconds.
+    """
+    count: int
+    total: float
+    max: float
+    buckets: dict[int, int]
+
+    def __init__(self) -> None:
+        """Initialize an empty histogram."""
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+
+    def add(self, seconds: float) -> None:
+        """Add a duration of <seconds>."""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        # durations of 0 share the bucket of 1ns
+        bucket = math.ceil(4 * math.log2(max(seconds, 1e-9)))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent: float) -> float:
+        """Return the <percent>th percentile of the durations, in seconds, or
+        0 if there are none.
+        """
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** (bucket / 4), self.max)
+        return self.max
+
+
+class _Stats:
+    """The totals recorded for one public method or one SQL label.
+
+    === Instance Attributes ===
+    calls: the number of calls to the method, or of runs of the statement.
+    statements: the number of SQL statements run.
+    round_trips: the number of round-trips to the server.
+    rows: the number of rows returned or affected.
+    server_time: seconds spent waiting on the server, network included.
+    client_time: seconds spent in Python, outside server_time.
+    latency: the duration of each call, or of each run of the statement.
+    """
+    calls: int
+    statements: int
+    round_trips: int
+    rows: int
+    server_time: float
+    client_time: float
+    latency: _Histogram
+
+    def __init__(self) -> None:
+        """Initialize the totals to 0."""
+        self.calls = 0
+        self.statements = 0
+        self.round_trips = 0
+        self.rows = 0
+        self.server_time = 0.0
+        self.client_time = 0.0
+        self.latency = _Histogram()
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the totals, and the mean, 50th, 90th and 99th percentile and
+        maximum latency in seconds.
+        """
+        return {
+            'calls': self.calls,
+            'statements': self.statements,
+            'round_trips': self.round_trips,
+            'rows': self.rows,
+            'server_time': self.server_time,
+            'client_time': self.client_time,
+            'mean': self.latency.total / max(self.latency.count, 1),
+            'p50': self.latency.percentile(50),
+            'p90': self.latency.percentile(90),
+            'p99': self.latency.percentile(99),
+            'max': self.latency.max,
+        }
+
+
+class _Call:
+    """What one call to a public method of WasteWrangler sent to the server,
+    gathered by _InstrumentedCursor and _InstrumentedConnection without
+    locking, to be added to the _Metrics when the call returns.
+
+    === Instance Attributes ===
+    started: the perf_counter() time at which the call started.
+    executed: (query, times run, rows, seconds) of everything sent to the
+        server, in order; executemany runs its query once per parameter set.
+    """
+    started: float
+    executed: list[tuple]
+
+    def __init__(self) -> None:
+        """Start a call now."""
+        self.started = perf_counter()
+        self.executed = []
+
+
+class _Metrics:
+    """The in-process registry of the metrics of a WasteWrangler, by public
+    method and by SQL label, safe to update from many threads.
+
+    === Private Attributes ===
+    _lock: protects the statistics below.
+    _methods: the totals of each public method.
+    _statements: the totals of each SQL label.
+    """
+    _lock: threading.Lock
+    _methods: dict[str, _Stats]
+    _statements: dict[str, _Stats]
+
+    def __init__(self) -> None:
+        """Initialize an empty registry."""
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._statements = {}
+
+    def record(self, method: str, call: _Call) -> None:
+        """Add <call>, a call to <method> that has just returned."""
+        elapsed = perf_counter() - call.started
+        # one round-trip per run, of as many statements as the query holds
+        executed = [(_sql_label(query), runs * _sql_statements(query), runs,
+                     rows, seconds)
+                    for query, runs, rows, seconds in call.executed]
+        server_time = sum(seconds for *_, seconds in executed)
+
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = _Stats()
+            stats.calls += 1
+            stats.server_time += server_time
+            stats.client_time += elapsed - server_time
+            stats.latency.add(elapsed)
+            for label, statements, round_trips, rows, seconds in executed:
+                stats.statements += statements
+                stats.round_trips += round_trips
+                stats.rows += rows
+
+                by_label = self._statements.get(label)
+                if by_label is None:
+                    by_label = self._statements[label] = _Stats()
+                by_label.calls += 1
+                by_label.statements += statements
+                by_label.round_trips += round_trips
+                by_label.rows += rows
+                by_label.server_time += seconds
+                by_label.latency.add(seconds)
+
+    def snapshot(self) -> dict[str, dict[str, dict[str, float]]]:
+        """Return the statistics of each public method and SQL label, as
+        described in _Stats.as_dict, under 'methods' and 'statements'.
+        """
+        with self._lock:
+            return {
+                'methods': {method: stats.as_dict() for method, stats
+                            in sorted(self._methods.items())},
+                'statements': {label: stats.as_dict() for label, stats
+                               in sorted(self._statements.items())},
+            }
+
+
+class _Statements:
+    """The server-side prepared statements of a WasteWrangler. Each SQL
+    constant of _PREPARED is prepared on a connection the first time it is
+    run on it, and run with EXECUTE from then on, so the server parses it
+    only once per connection, and can reuse its plan.
+
+    A new connection, e.g. after connecting again, or one the pool opens to
+    replace another, starts with the statements it finds prepared in its
+    session, so any other is prepared again. If the server drops them, e.g.
+    on DISCARD ALL, they are read again from the session and the statement
+    is prepared again and retried once, provided it was the first of its
+    transaction: a statement later in a transaction has aborted it, so the
+    call fails, and the next one prepares them again.
+
+    === Instance Attributes ===
+    enabled: whether the constants are run as prepared statements; they are
+        sent as they are otherwise.
+
+    === Private Attributes ===
+    _lock: protects the attributes below, shared by the connections.
+    _prepared: maps each connection to the names of the statements prepared
+        on it.
+    _hits: the runs of a statement already prepared on its connection.
+    _misses: the runs that prepared their statement first.
+    """
+    enabled: bool
+    _lock: threading.Lock
+    _prepared: WeakKeyDictionary
+    _hits: int
+    _misses: int
+
+    def __init__(self) -> None:
+        """Initialize a registry with no statements prepared."""
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._prepared = WeakKeyDictionary()
+        self._hits = 0
+        self._misses = 0
+
+    def execute(self, cursor: pg_ext.cursor, query: str,
+                params=None, retry: bool = True) -> None:
+        """Run the SQL constant <query>, one of _PREPARED, with <params>
+        using <cursor>, preparing it first if it is not prepared on the
+        cursor's connection. If it was prepared but is not any more, prepare
+        it and run it again if <retry> and nothing else ran in the
+        transaction before it.
+        """
+        name, prepare_sql, execute_sql, keys = _PREPARED[query]
+        execute = getattr(cursor, 'execute_unprepared', cursor.execute)
+        connection = cursor.connection
+        first = (connection.get_transaction_status()
+                 == pg_ext.TRANSACTION_STATUS_IDLE)
+        with self._lock:
+            prepared = self._prepared.get(connection)
+        if prepared is None:
+            execute(_PREPARED_STATEMENTS_SQL)
+            prepared = {row[0] for row in cursor.fetchall()}
+            with self._lock:
+                self._prepared[connection] = prepared
+
+        hit = name in prepared
+        if not hit:
+            execute(prepare_sql)
+            prepared.add(name)
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+        try:
+            execute(execute_sql,
+                    [params[key] for key in keys] if keys else None)
+        except pg.errors.InvalidSqlStatementName:
+            # no longer prepared: find out which are before running again
+            with self._lock:
+                self._prepared.pop(connection, None)
+            if not (retry and first):
+                raise
+            # the transaction began with this statement, so nothing is lost
+            connection.rollback()
+            self.execute(cursor, query, params, retry=False)
+
+    def stats(self) -> dict[str, int]:
+        """Return the number of connections that run prepared statements,
+        of the statements prepared over all of them, and of the hits and
+        misses: the runs of a statement that was already prepared on its
+        connection, and the runs that had to prepare it first.
+        """
+        with self._lock:
+            return {
+                'connections': len(self._prepared),
+                'statements': sum(len(names)
+                                  for names in self._prepared.values()),
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+
+class _InstrumentedCursor(pg_ext.cursor):
+    """A cursor that runs the SQL constants of _PREPARED as the prepared
+    statements of its connection's _Statements, if it has any, and adds what
+    it sends to the server to the _Call in progress on its thread, if any.
+    """
+
+    def execute(self, query, vars=None) -> None:
+        statements = self.connection.statements
+        if (statements is not None and statements.enabled
+                and isinstance(query, str) and query in _PREPARED):
+            return statements.execute(self, query, vars)
+        return self.execute_unprepared(query, vars)
+
+    def execute_unprepared(self, query, vars=None) -> None:
+        """Execute <query> with <vars> as it is, even if it is one of the SQL
+        constants of _PREPARED.
+        """
+        call = getattr(_calls, 'current', None)
+        if call is None:
+            return super().execute(query, vars)
+        started = perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            call.executed.append((query, 1, max(self.rowcount, 0),
+                                  perf_counter() - started))
+
+    def executemany(self, query, vars_list) -> None:
+        call = getattr(_calls, 'current', None)
+        if call is None:
+            return super().executemany(query, vars_list)
+        vars_list = list(vars_list)
+        started = perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            call.executed.append((query, len(vars_list),
+                                  max(self.rowcount, 0),
+                                  perf_counter() - started))
+
+    def copy_expert(self, sql, file, size=8192) -> None:
+        call = getattr(_calls, 'current', None)
+        if call is None:
+            return super().copy_expert(sql, file, size)
+        started = perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            call.executed.append((sql, 1, max(self.rowcount, 0),
+                                  perf_counter() - started))
+
+
+class _InstrumentedConnection(pg_ext.connection):
+    """A connection whose cursors are _InstrumentedCursors, and that adds its
+    commits and rollbacks to the _Call in progress on its thread, if any.
+
+    === Instance Attributes ===
+    statements: the prepared statements its cursors run, if any.
+    """
+    statements: Optional[_Statements]
+
+    def __init__(self, *args, statements: Optional[_Statements] = None,
+                 **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = _InstrumentedCursor
+        self.statements = statements
+
+    def commit(self) -> None:
+        self._end('COMMIT', super().commit)
+
+    def rollback(self) -> None:
+        self._end('ROLLBACK', super().rollback)
+
+    def _end(self, statement: str, end: Callable[[], None]) -> None:
+        """End the transaction in progress with <end>, which sends
+        <statement>, recording it if a transaction is open.
+        """
+        call = getattr(_calls, 'current', None)
+        if call is None or self.status == pg_ext.STATUS_READY:
+            return end()
+        started = perf_counter()
+        try:
+            return end()
+        finally:
+            call.executed.append((statement, 1, 0, perf_counter() - started))
 
 
 class WasteWrangler:
     """A class that can work with data conforming to the schema in
     waste_wrangler_schema.ddl.
 
+    In pooled mode (see connect), the methods can be called from many threads
+    at once: each call uses its own connection from the pool.
+
     === Instance Attributes ===
     connection: connection to a PostgreSQL database of a waste management
-    service.
+    service. In pooled mode, the connection the calling thread has checked
+    out of the pool, if any.
+
+    === Private Attributes ===
+    _connection: the single connection, when not in pooled mode.
+    _credentials: the dbname, username and password given to connect, which
+        the worker processes of schedule_horizon connect with, or None before
+        connect is called.
+    _pool: the connection pool in pooled mode, None otherwise.
+    _local: per-thread state; _local.connection is the connection the thread
+        has checked out of <_pool>, if any.
+    _statements: the server-side prepared statements of the connections.
+    _workmates: the workmate cache (see cache_workmates), None until it is
+        first used or after it is invalidated.
+    _workmates_limit: the most employees the workmate cache may hold, 0 when
+        it is disabled.
+    _workmates_table: whether the workmate cache keeps WorkmateComponent up
+        to date.
+    _workmates_generation: counts the times the workmate cache was dropped,
+        so that a cache built meanwhile is not installed.
+    _workmates_builds: the number of threads building the workmate cache.
+    _workmates_pending: the (eID1, eID2) pairs recorded while the workmate
+        cache is being built, added to it once it is.
+    _workmates_lock: guards the workmate cache and the three attributes
+        above; it is never held during database I/O.
+    _workmates_writer: the connection WorkmateComponent is written on, None
+        until it is first needed.
+    _workmates_write_lock: serializes the writes to WorkmateComponent, and
+        guards <_workmates_writer>; acquired before _workmates_lock, never
+        after.
+    _reference: the reference data snapshot (see cache_reference_data), None
+        until it is first used or after it is invalidated.
+    _reference_ttl: how many seconds the snapshot is used for before it is
+        read again, 0 when snapshots are disabled.
+    _reference_lock: guards the reference data snapshot.
+    _metrics: the metrics collected so far (see collect_metrics), None when
+        they are not collected.
 
     Representation invariants:
     - The database to which connection is established conforms to the schema
       in waste_wrangler_schema.ddl.
     """
-    connection: Optional[pg_ext.connection]
+    _connection: Optional[pg_ext.connection]
+    _credentials: Optional[tuple[str, str, str]]
+    _pool: Optional[_ConnectionPool]
+    _local: threading.local
+    _statements: _Statements
+    _workmates: Optional['_WorkmateGraph']
+    _workmates_limit: int
+    _workmates_table: bool
+    _workmates_generation: int
+    _workmates_builds: int
+    _workmates_pending: list[tuple[int, int]]
+    _workmates_lock: threading.Lock
+    _workmates_writer: Optional[pg_ext.connection]
+    _workmates_write_lock: threading.Lock
+    _reference: Optional['_ReferenceData']
+    _reference_ttl: float
+    _reference_lock: threading.Lock
+    _metrics: Optional[_Metrics]
 
     def __init__(self) -> None:
         """Initialize this WasteWrangler instance, with no database connection
         yet.
         """
-        self.connection = None
-
-    def connect(self, dbname: str, username: str, password: str) -> bool:
+        self._connection = None
+        self._credentials = None
+        self._pool = None
+        self._local = threading.local()
+        self._statements = _Statements()
+        self._workmates = None
+        self._workmates_limit = 0
+        self._workmates_table = False
+        self._workmates_generation = 0
+        self._workmates_builds = 0
+        self._workmates_pending = []
+        self._workmates_lock = threading.Lock()
+        self._workmates_writer = None
+        self._workmates_write_lock = threading.Lock()
+        self._reference = None
+        self._reference_ttl = 0.0
+        self._reference_lock = threading.Lock()
+        self._metrics = _Metrics()
+
+    @property
+    def connection(self) -> Optional[pg_ext.connection]:
+        """The connection the methods of this WasteWrangler use."""
+        if self._pool is not None:
+            return getattr(self._local, 'connection', None)
+        return self._connection
+
+    @connection.setter
+    def connection(self, conn: Optional[pg_ext.connection]) -> None:
+        self._connection = conn
+
+    def connect(self, dbname: str, username: str, password: str,
+                pool_size: int = 0) -> bool:
         """Establish a connection to the database <dbname> using the
         username <username> and password <password>, and assign it to the
         instance attribute <connection>. In addition, set the search path
         to waste_wrangler.
 
+        If <pool_size> is positive, open a pool of up to <pool_size>
+        connections instead, so that this WasteWrangler can serve calls from
+        several threads in parallel.
+
         Return True if the connection was made successfully, False otherwise.
         I.e., do NOT throw an error if making the connection fails.
 
@@ -63,11 +1340,19 @@ class WasteWrangler:
         >>> ww.connect("invalid", "nonsense", "incorrect")
         False
         """
+        connect_args = {
+            'dbname': dbname, 'user': username, 'password': password,
+            'options': "-c search_path=waste_wrangler",
+            'connection_factory': partial(_InstrumentedConnection,
+                                          statements=self._statements)
+        }
         try:
-            self.connection = pg.connect(
-                dbname=dbname, user=username, password=password,
-                options="-c search_path=waste_wrangler"
-            )
+            if pool_size > 0:
+                self._pool = _ConnectionPool(pool_size, **connect_args)
+                self._local = threading.local()
+            else:
+                self.connection = pg.connect(**connect_args)
+            self._credentials = (dbname, username, password)
             return True
         except pg.Error:
             return False
@@ -85,12 +1370,149 @@ class WasteWrangler:
         True
         """
         try:
-            if self.connection and not self.connection.closed:
-                self.connection.close()
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+            if self._connection and not self._connection.closed:
+                self._connection.close()
+            with self._workmates_write_lock:
+                if self._workmates_writer is not None:
+                    self._workmates_writer.close()
+                    self._workmates_writer = None
             return True
         except pg.Error:
             return False
 
+    def pool_stats(self) -> dict[str, float]:
+        """Return the usage statistics of the connection pool, as described in
+        _ConnectionPool.stats, or an empty dict if not in pooled mode.
+        """
+        if self._pool is None:
+            return {}
+        return self._pool.stats()
+
+    def prepare_statements(self, enabled: bool = True) -> None:
+        """Run the queries the methods send on every call as server-side
+        prepared statements if <enabled>, or send their text every time
+        otherwise, e.g. behind a pooler that does not keep sessions. They are
+        prepared by default.
+        """
+        self._statements.enabled = enabled
+
+    def prepared_stats(self) -> dict[str, int]:
+        """Return the usage statistics of the server-side prepared
+        statements the methods run, as described in _Statements.stats.
+        """
+        return self._statements.stats()
+
+    def collect_metrics(self, enabled: bool = True) -> None:
+        """Start collecting metrics afresh if <enabled>, or stop collecting
+        them otherwise. They are collected from the start by default.
+
+        For each public method, and for each SQL statement its calls run,
+        the metrics count the calls, the statements and round-trips sent to
+        the server and the rows they returned or affected, add up the time
+        spent waiting on the server and the rest of the time (client time),
+        and keep a histogram of the latencies. Statements are labelled by the
+        SQL constant they come from, e.g. 'due_trucks' for _DUE_TRUCKS_SQL.
+        """
+        self._metrics = _Metrics() if enabled else None
+
+    def metrics(self) -> dict[str, dict[str, dict[str, float]]]:
+        """Return the metrics collected so far: for each public method under
+        'methods', and for each SQL label under 'statements', a dict with the
+        number of 'calls', 'statements', 'round_trips' and 'rows', the
+        'server_time' and 'client_time', and the 'mean', 'p50', 'p90', 'p99'
+        and 'max' latency. Times are in seconds.
+
+        Return an empty dict if metrics are not being collected.
+        """
+        if self._metrics is None:
+            return {}
+        return self._metrics.snapshot()
+
+    def export_metrics(self, fmt: str = 'text') -> str:
+        """Return the metrics collected so far as a table if <fmt> is 'text',
+        with times in ms, or as a JSON object holding what metrics returns if
+        <fmt> is 'json'.
+        """
+        metrics = self.metrics()
+        if fmt == 'json':
+            return json.dumps(metrics, indent=2)
+        if fmt != 'text':
+            raise ValueError(f"unknown metrics format: {fmt}")
+
+        lines = []
+        for section in ('methods', 'statements'):
+            lines.append(f"{section:<28} {'calls':>7} {'stmts':>7} "
+                         f"{'trips':>7} {'rows':>8} {'server':>9} "
+                         f"{'client':>9} {'p50':>8} {'p90':>8} {'p99':>8} "
+                         f"{'max':>8}")
+            for name, stats in metrics.get(section, {}).items():
+                lines.append(
+                    f"{name[:28]:<28} {stats['calls']:>7} "
+                    f"{stats['statements']:>7} {stats['round_trips']:>7} "
+                    f"{stats['rows']:>8} "
+                    + ' '.join(f"{1000 * stats[key]:>{width}.2f}"
+                               for key, width in (('server_time', 9),
+                                                  ('client_time', 9),
+                                                  ('p50', 8), ('p90', 8),
+                                                  ('p99', 8), ('max', 8))))
+            lines.append('')
+        return '\n'.join(lines)
+
+    def cache_workmates(self, max_employees: int = 100000,
+                        materialize: bool = False) -> None:
+        """Keep the workmate components in memory, so that workmate_sphere
+        and its batch variants answer without reading Trip. The components
+        are read on first use and then updated as this WasteWrangler
+        schedules trips; once they hold more than <max_employees> employees
+        the cache is dropped and disabled. A <max_employees> of 0 disables it.
+
+        If <materialize> is True, also keep the table WorkmateComponent
+        (created if needed) in step with the cache, for workmate_sphere's
+        'table' mode, which any client can use. The table is only built for a
+        WasteWrangler connected with connect.
+
+        Trips deleted, or inserted by other clients, are not seen by the cache:
+        call invalidate_workmates after such changes.
+        """
+        with self._workmates_lock:
+            self._workmates = None
+            self._workmates_generation += 1
+            self._workmates_limit = max_employees
+            self._workmates_table = materialize
+
+    def invalidate_workmates(self) -> None:
+        """Drop the workmate cache, so that it is rebuilt from Trip on its
+        next use.
+        """
+        with self._workmates_lock:
+            self._workmates = None
+            self._workmates_generation += 1
+
+    def cache_reference_data(self, ttl: float = 300.0) -> None:
+        """Keep Route, Truck, TruckType, Facility, Employee, Driver and
+        Technician in memory, so that the schedulers only read Trip and
+        Maintenance from the database. The tables are read on first use and
+        again once the snapshot is <ttl> seconds old; a <ttl> of 0 disables
+        the snapshot.
+
+        update_technicians refreshes the snapshot itself; after other changes
+        to these tables, call invalidate_reference_data.
+        """
+        with self._reference_lock:
+            self._reference = None
+            self._reference_ttl = ttl
+
+    def invalidate_reference_data(self) -> None:
+        """Drop the reference data snapshot, so that it is read again on its
+        next use.
+        """
+        with self._reference_lock:
+            self._reference = None
+
+    @_with_connection
     def schedule_trip(self, rid: int, time: dt.datetime) -> bool:
         """Schedule a truck and two employees to the route identified
         with <rid> at the given time stamp <time> to pick up an
@@ -137,222 +1559,76 @@ class WasteWrangler:
         tests could use any valid value for <time>.
         """
         try:
-            # TODO: implement this method
             cur = self.connection.cursor()
 
-            # ---------- seeing if the given rid is valid
-            cur.execute("""
-                SELECT *
-                FROM Route
-                WHERE rID = %s 
-                """, (rid,))
-            
-            reqRoute = cur.fetchone()
-            if reqRoute is None:
-                self.connection.rollback()
-                cur.close()
-                return False
-            
-            ridCur, waste_t, length = reqRoute #if valid, assign variables
-
-            #--------- check if the required distance and time will be withing the working hours
-            beginTime = time
-            totalTripTime = int(3600*(length/5))
-            endingTime = beginTime + dt.timedelta(seconds = totalTripTime)
-            if endingTime.time() > dt.time(hour=16) or beginTime.time() < dt.time(hour = 8):
-                self.connection.rollback()
-                cur.close()
-                return False
-            
-            #------------------ finding the requirement of the range of time
-            max_time = endingTime + dt.timedelta(minutes = 30)
-            min_time = beginTime - dt.timedelta(minutes =30)
-
-            
-            # ------ check if the route has already happened or will happen today
-            cur.execute("SELECT rID FROM Trip WHERE rID = %s AND date(tTIME) = %s", (ridCur, time.date()))
-
-            alreadyExists = cur.fetchone()
-            #print(" check if it exists:", alreadyExists)
-            if alreadyExists is not None:
-                self.connection.rollback()
-                cur.close()
-                return False 
-            
-            #------- Finding all Possible Trucks
-            cur.execute("""
-                CREATE VIEW AvailableTrucks AS
-                SELECT tID, capacity, truckType
-                FROM TruckType NATURAL JOIN Truck
-                WHERE wasteType = %s
-                ORDER BY capacity DESC, tID ASC
-                """, (waste_t,))
-            
-            # ----------- Finding Trucks that have the a maintanence scheduled on the same day
-            cur.execute("""
-                CREATE VIEW OnMain AS
-                SELECT AT.tID, AT.capacity, AT.truckType
-                FROM AvailableTrucks AT NATURAL JOIN Maintenance Main
-                WHERE Main.mDATE = %s
-                ORDER BY capacity DESC, tID ASC
-                """, (beginTime.date(),))
-            
-            #-------- Finding Trucks that have the a trip scheduled in the not allowed range time
-            cur.execute("""
-                CREATE VIEW OnTrip AS
-                SELECT AT.tID, AT.capacity, AT.truckType
-                FROM AvailableTrucks AT NATURAL JOIN Trip
-                WHERE Trip.tTIME BETWEEN %s AND %s
-                ORDER BY capacity DESC, tID ASC
-                """, (min_time, max_time))
-            
-            #-------- Now to find all the trucks that are actuall free, we do AvailableTrucks - OnTrip - OnMain
-            cur.execute("""
-                CREATE VIEW FreeTrucks AS
-                (SELECT *
-                FROM AvailableTrucks) 
-                EXCEPT
-                (SELECT *
-                FROM OnMain)
-                EXCEPT
-                (SELECT *
-                FROM OnTrip)
-                """) 
-            
-            #----------------------------------------------------
-            #---------- Now finding the driver details that can drive the truck of specified trucktypes
-            cur.execute("""
-                CREATE VIEW CanDrive AS
-                SELECT FT.tID as tID, FT.capacity as capacity, FT.truckType as truckType, Employee.eID as eID, Employee.hireDate as hireDate
-                FROM Employee NATURAL JOIN Driver NATURAL JOIN FreeTrucks FT
-                WHERE Employee.hireDate <= %s
-                """, (beginTime.date(),))
-            
-            #------ Find drivers that have another trip schedule in the +- 30 minute time frame
-            cur.execute("""
-                CREATE VIEW HaveTrip AS
-                SELECT CanDrive.eID as eID
-                FROM CanDrive, Trip
-                WHERE (Trip.eID1 = CanDrive.eID OR Trip.eID2 = CanDrive.eID) AND Trip.tTIME BETWEEN %s AND %s
-                """, (min_time, max_time))
-            
-            #------ To find all free drivers, we do similar operations for truck: Allpossibledrivers - ones who have trips
-            cur.execute("""
-                CREATE VIEW FreeDrivers AS
-                (SELECT eID
-                FROM CanDrive)
-                EXCEPT
-                (SELECT *
-                FROM HaveTrip)
-                """)
-
-            #----------------------------------------------------
-            #----------- Add the free drivers and Trucks together
-            cur.execute("""
-                CREATE VIEW AllTDPairs AS
-                SELECT eID, tID
-                FROM CanDrive NATURAL JOIN FreeDrivers
-                ORDER BY capacity DESC, tID, hireDate, eID
-                """)
-
-            cur.execute("SELECT * FROM AllTDPairs")
-            allpairs = cur.fetchone()
-            if allpairs is None: #------- if there are no pairs avaiable
-                #print("no pairs exist")
-                self.connection.rollback()
-                cur.close()
-                return False
-            
-            firsteid, tid = allpairs
-
-
-
-            #----------- find next driver to go on trip (if there is no one, then return false)
-            #-- First find the drivers that can be on the trip but can't drive the car (assume the first  driver can)
-
-            cur.execute("""
-                CREATE VIEW SecondDriversOnTrip AS
-                SELECT Driver.eID as eID
-                FROM Driver, Trip
-                WHERE (Trip.eID1 = Driver.eID OR Trip.eID2 = Driver.eID) AND Trip.tTIME BETWEEN %s AND %s
-            """, (min_time, max_time))
-            cur.execute("""
-                CREATE VIEW FinalDrivers AS
-                (SELECT eID
-                FROM Driver)
-                EXCEPT
-                (SELECT *
-                FROM SecondDriversOnTrip)
-                """) 
-            
-
-            #------ now actually finding the next driver
-            cur.execute("""
-                SELECT eID
-                FROM Employee NATURAL JOIN FinalDrivers 
-                WHERE hireDate<= %s AND eID != %s
-                ORDER BY hireDate, eID
-                """, (beginTime.date(), firsteid))
-
-            nextdriver = cur.fetchone()
-
-            if nextdriver is None: # if there is no driver, then return false
-                #print("next driver is none")
-                self.connection.rollback()
-                cur.close()
-                return False
-            
-            secondeid = nextdriver[0]
-
-            #---------------------- FIND FACILITY WTIH LOWEST FID AND MATCHING WASTETYPE
-            cur.execute(""" 
-                SELECT fID
-                FROM Facility 
-                WHERE wasteType = %s
-                ORDER BY fID
-            """, (waste_t,))
-
-            bestfacility = cur.fetchone()
-
-            #error check again
-            if bestfacility is None:
-                #print("facility is none")
-                self.connection.rollback()
-                cur.close()
-                return False
-            
-            facility = bestfacility[0]
+            #------ plan and insert the trip in a single statement
+            cur.execute(_SCHEDULE_TRIP_SQL, {'rid': rid, 'time': time})
+            trip = cur.fetchone()
 
-            #---------------- create the trip in the table
-            if(secondeid >firsteid): #putting the largest eid as number one
-                inserttrip = tuple([ridCur, tid, beginTime, None, secondeid, firsteid, facility])
-            else:
-                inserttrip = tuple([ridCur, tid, beginTime, None, firsteid, secondeid, facility]) 
+            cur.close()
+            self.connection.commit()
+            if trip is not None:
+                self._record_workmates([trip[1:]])
+            return trip is not None
 
-            #insert into the table
-            cur.execute("INSERT INTO Trip VALUES (%s, %s, %s, %s, %s, %s, %s)", (inserttrip))
+        except pg.Error as ex:
+            self.connection.rollback()
+            if self._add_missing_partitions(ex, 'trip', [time.date()]):
+                return self.schedule_trip(rid, time)
+            return False
+
+    @_with_connection
+    def schedule_trip_many(
+            self, requests: Iterable[tuple[int, dt.datetime]]) -> list[bool]:
+        """Schedule a trip for every (rid, time) pair in <requests>, in the
+        order given, following the same rules as schedule_trip. A trip
+        scheduled for an earlier request makes its truck, drivers and route
+        unavailable to the later requests.
 
+        All the data needed is read once in a single transaction, the trips
+        are assigned in memory and then written with one multi-row insert.
 
-            #cleanup all views
+        Return a list with one entry per request, which is True iff a trip was
+        scheduled for that request. If writing the trips fails, nothing is
+        scheduled and every entry is False.
+        """
+        requests = list(requests)
+        if not requests:
+            return []
 
-            cur.execute("DROP VIEW FinalDrivers, SecondDriversOnTrip, AllTDPairs")
-            
-            cur.execute("DROP VIEW FreeDrivers, HaveTrip, CanDrive")
-        
+        try:
+            cur = self.connection.cursor()
 
-            cur.execute("DROP VIEW FreeTrucks, OnTrip, OnMain, AvailableTrucks")
-            
+            #------ load everything the requests could need, once
+            rids = sorted({rid for rid, _ in requests})
+            days = sorted({time.date() for _, time in requests})
+            resources = self._load_trip_resources(self._loader(cur), rids,
+                                                  days)
+
+            #------ assign in request order, then write all trips together
+            results = []
+            new_trips = []
+            for rid, time in requests:
+                trip = resources.assign(rid, time)
+                results.append(trip is not None)
+                if trip is not None:
+                    new_trips.append(trip)
+
+            if new_trips:
+                pg_extras.execute_values(cur, _INSERT_TRIPS_SQL, new_trips,
+                                         page_size=1000)
 
             cur.close()
             self.connection.commit()
+            self._record_workmates(trip[4:6] for trip in new_trips)
+            return results
 
-            return True
-            
         except pg.Error as ex:
-            # You may find it helpful to uncomment this line while debugging,
-            # as it will show you all the details of the error that occurred:
-            raise ex
-            return False
+            self.connection.rollback()
+            if self._add_missing_partitions(
+                    ex, 'trip', [time.date() for _, time in requests]):
+                return self.schedule_trip_many(requests)
+            return [False] * len(requests)
 
     def schedule_trips(self, tid: int, date: dt.date) -> int:
         """Schedule the truck identified with <tid> for trips on <date> using
@@ -386,249 +1662,129 @@ class WasteWrangler:
         While a realistic use case will provide a <date> in the near future, our
         tests could use any valid value for <date>.
         """
-        num_changed = 0
-
-        try: 
-            # TODO: implement this method
+        # a fleet of one truck: the day is loaded once, the truck's timeline
+        # is planned in memory and the trips are written in one insert
+        counts, _ = self.schedule_fleet(date, [tid])
+        return counts.get(tid, 0)
+
+    @_with_connection
+    def schedule_fleet(self, date: dt.date, tids: Optional[Iterable[int]] = None
+                       ) -> tuple[dict[int, int], dict[str, float]]:
+        """Schedule trips on <date> for every truck in <tids>, or for every
+        truck if <tids> is None, in ascending order of tIDs. Each truck is
+        planned with the same rules as schedule_trips, and routes and drivers
+        taken by one truck are not available to the trucks after it.
+
+        The unscheduled routes and the drivers' availability are read once for
+        the whole fleet, and all trips are written in a single transaction.
+
+        Return a mapping from each tID planned to the number of trips
+        scheduled for it, and a mapping from each phase ('load', 'plan',
+        'write') to the number of seconds it took. If writing fails, nothing
+        is scheduled and every count is 0.
+
+        This method should NOT raise an error.
+        """
+        counts = {}
+        timings = {'load': 0.0, 'plan': 0.0, 'write': 0.0}
+        try:
             cur = self.connection.cursor()
 
-            #------ finding routes that do not have a trip
-            cur.execute("""
-                CREATE VIEW NoRoutes AS
-                (select rID from Route)
-                EXCEPT
-                (select rID FROM Trip WHERE date(tTIME) = %s)
-                """, (date,))
-
-            cur.execute("""
-                CREATE VIEW ScheduleList AS
-                SELECT rID
-                FROM TruckType NATURAL JOIN NoRoutes NATURAL JOIN Route NATURAL JOIN Truck
-                WHERE tID = %s
-                ORDER BY rID
-                """,(tid,))
-
-
-            #----saving the list
-            cur.execute("select * from ScheduleList")
-            routeList = cur.fetchall()
-
-            #if no routes exist then return 0 (yayy)
-            if routeList is None: 
-                #cur.execute("DROP VIEW ScheduleList")
-                #cur.execute("DROP VIEW NoRoutes")
-                
-                self.connection.rollback()
-                cur.close()
-                return 0
-            
-            #-------defining the initial timing variables
-            beginTime = dt.datetime(date.year, date.month, date.day, 8, 0, 0, 0)
-            lastTime = dt.datetime(date.year, date.month, date.day, 16, 0, 0, 0)
-            endingTime = None
-
-            for routes in routeList:
-
-                rid = routes[0]
-
-                #starting current time
-                if endingTime is not None:
-                    currentTime = dt.timedelta(minutes=30) + endingTime
-                else:
-                    currentTime = beginTime
-
-                cur.execute("select length from Route where rID = %s", (rid,))
-                rLength = cur.fetchone()
-
-                totalTime = int(3600* (rLength/5))
-                #got to convert into seconds
-                totalTime = dt.timedelta(seconds=totalTime)
-
-                #---------- if the trip exeeds the max time, then we skip the iteratoin
-                if(lastTime < totalTime + beginTime): 
-                    self.connection.rollback()
-                    #cur.close()
-                    continue
-
-                #--------- can drive the truck before the trip and are able to drive that truck type
-                cur.execute("""
-                    CREATE VIEW CanDrive AS
-                    select eID 
-                    FROM Driver NATURAL JOIN Truck NATURAL JOIN Employee
-                    where hireDate<= %s AND tID = %s
-                    """, (date, tid))
-                
-                #-------- finding the drivers who are on a trip
-                cur.execute("""
-                    CREATE VIEW OnTrip AS
-                    SELECT eID1, eID2
-                    from Trip
-                    where date(tTIME) = %s
-                """, (date,))
-
-                #------finding all the available drivers by subtracting the OnTrip drivers
-                cur.execute("""
-                    CREATE VIEW AvailableDrivers AS
-                    (SELECT *
-                    FROM CanDrive)
-                    EXCEPT
-                    ((SELECT eID2 as eID from OnTrip)
-                    UNION
-                    (SELECT eID1 as eID from OnTrip))
-                """)
-
-                cur.execute("select * from Employee NATURAL JOIN AvailableDrivers ORDER BY hireDate, eID")
-
-                driver= cur.fetchone()
-
-                #--------error checking to see if drivers are even there
-                if driver is None:
-                    self.connection.rollback()
-                    cur.close()
-                    return num_changed
-                
-                firsteid = driver[0]
-
-                #----- now create a list of all other drivers that can be on the truck
-                #------ does not have to be able to drive the truck, rather just be free
-                cur.execute("""
-                    CREATE VIEW SecondList AS
-                    (SELECT eID 
-                    from Driver 
-                    where eID != %s
-                    order by eID)
-                    EXCEPT
-                    ((SELECT eID2 as eID from OnTrip)
-                    UNION
-                    (SELECT eID1 as eID from OnTrip))
-                """, (firsteid))
-
-                cur.execute(" select * from Employee NATURAL JOIN SecondList ORDER BY hireDate, eID")
-                secondeid = cur.fetchone()
-
-                #---- error checking for no drivers
-                if secondeid is None:
-                    self.connection.rollback()
-                    cur.close()
-                    return num_changed
-                
-                #----- find the facility in ascending order and take the smallest value of fID
-                cur.execute(""" 
-                    SELECT fID 
-                    FROM Facility NATURAL JOIN Route NATURAL JOIN ScheduleList
-                    ORDER BY fID
-                    """)
-                
-                fid = cur.fetchone()
-
-                #-----error check for no facilities available
-                if fid is None:
-                    self.connection.rollback()
-                    cur.close()
-                    return num_changed
-                
-                tupleFID = fid[0]
-
-                if(secondeid >firsteid): #putting the largest eid as number one
-                    inserttrip = tuple([rid, tid, currentTime, None, secondeid, firsteid, tupleFID])
-                else:
-                    inserttrip = tuple([rid, tid, currentTime, None, firsteid, secondeid, tupleFID]) 
-                
-                #------updating tables
-                cur.execute(""" 
-                    INSERT INTO Trip
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, inserttrip)
-                
-                #----- cleanup timee
-                cur.execute("DROP VIEW SecondList, AvailableDrivers, OnTrip, CanDrive")
-                num_changed +=1
-                self.connection.commit()
-            
-
-            #--cleanup other views
-            cur.execute("DROP VIEW ScheduleList, NoRoutes")
-            
+            date = _as_day(date)
+
+            #------ load phase: the day and the trucks, once for the fleet
+            started = perf_counter()
+            if tids is not None:
+                tids = list(tids)
+                counts = {tid: 0 for tid in tids}
+            loader = self._loader(cur)
+            trucks = loader.fleet_trucks(tids)
+            plan = self._load_day_plan(loader, date)
+            timings['load'] = perf_counter() - started
+
+            #------ plan phase: every truck against the shared day plan
+            started = perf_counter()
+            planned, new_trips = plan.plan_fleet(trucks)
+            counts.update(planned)
+            timings['plan'] = perf_counter() - started
+
+            #------ write phase: one insert, one commit
+            started = perf_counter()
+            if new_trips:
+                pg_extras.execute_values(cur, _INSERT_TRIPS_SQL, new_trips,
+                                         page_size=1000)
             cur.close()
-            return num_changed
-        except:
-            #raise ex
-            return num_changed
-    
+            self.connection.commit()
+            timings['write'] = perf_counter() - started
+            self._record_workmates(trip[4:6] for trip in new_trips)
+            return counts, timings
 
-    def update_technicians(self, qualifications_file: TextIO) -> int:
+        except pg.Error as ex:
+            self.connection.rollback()
+            if self._add_missing_partitions(ex, 'trip', [date]):
+                return self.schedule_fleet(date, tids)
+            return {tid: 0 for tid in counts}, timings
+
+    @_with_connection
+    def update_technicians(self, qualifications_file: TextIO,
+                           chunk_size: int = 10000,
+                           commit_every: Optional[int] = None,
+                           progress: Optional[Callable[[int], None]] = None
+                           ) -> int:
         """Given the open file <qualifications_file> that follows the format
         described on the handout, update the database to reflect that the
         recorded technicians can now work on the corresponding given truck type.
+
+        The file is read and sent to the database <chunk_size> qualifications
+        at a time, so memory use doesn't grow with its size. The import is
+        committed once at the end, or, if <commit_every> is given, whenever
+        at least that many more qualifications have been processed. After
+        every chunk, <progress> (if given) is called with the number of lines
+        of the file processed so far.
+
+        Return the number of qualifications added, or, if an error stops the
+        import, the number of them that had already been committed.
         """
+        num_changed = num_committed = 0
         try:
-            # TODO: implement this method
             cur = self.connection.cursor()
-
-            #use helper function to read file
-            qualified = self._read_qualifications_file(qualifications_file)
-
-            #number of techs changed
-            num_changed = 0
-
-            #for every entry, check if employee and truck type are valid, if the tech is not a driver and not already
-            #qualified
-            for q in qualified:
-                techName = q[0] + ' ' + q[1]
-                #print(techName)
-                truck_type = q[2]
-
-                #technician ID is employee
-                cur.execute("SELECT eID FROM Employee WHERE name = %s ", (techName,))
-                validEID = cur.fetchone()
-
-                if validEID is not None:
-                    
-                    cur.execute("SELECT truckType FROM TruckType WHERE truckType = %s ", (truck_type,)) # see if the trucktype exists
-                    validTruckType = cur.fetchone()
-
-                    if validTruckType is not None:
-
-                        cur.execute("SELECT eID FROM Driver WHERE eID = %s", (validEID[0],)) #see if the employee is a driver
-                        isDriver = cur.fetchone()
-
-                        if isDriver is None:
-                            cur.execute("SELECT eID, truckType FROM Technician WHERE eID = %s AND truckType = %s", (validEID[0], truck_type)) #see if already a technician for the same type
-                            isAlreadyTech = cur.fetchone()
-
-                            if isAlreadyTech is None:
-                                #print("about to insert")
-                                cur.execute("INSERT INTO Technician (eID, truckType) VALUES (%s, %s)", (validEID[0], truck_type))
-                                num_changed += 1
-                            else:
-                                continue #skip because already exists
-                        
-                        else:
-                            continue #was a driver, skip
-                    else:
-                        continue #skip because was not a valid truck type
-
-
-
-                else:
-                    continue #skip because was not a valid employee 
-
-                
-
-
+            cur.execute(_QUALIFICATIONS_TABLE_SQL)
+
+            processed = uncommitted = 0
+            for chunk in self._read_qualifications_file(qualifications_file,
+                                                        chunk_size):
+                #stream the chunk to the server, then check all of its lines
+                #at once: the employee and truck type exist, and the employee
+                #is not a driver nor already qualified
+                rows = io.StringIO(''.join(
+                    '\t'.join(_copy_escape(field) for field in q) + '\n'
+                    for q in chunk))
+                cur.copy_expert(_COPY_QUALIFICATIONS_SQL, rows)
+                cur.execute(_INSERT_QUALIFIED_SQL)
+                num_changed += cur.rowcount
+
+                processed += len(chunk)
+                uncommitted += len(chunk)
+                if commit_every is not None and uncommitted >= commit_every:
+                    self.connection.commit()
+                    num_committed = num_changed
+                    uncommitted = 0
+                if progress is not None:
+                    progress(2 * processed)
 
             cur.close()
             self.connection.commit()
-            return num_changed    
+            self.invalidate_reference_data()
+            return num_changed
 
-            
-        except pg.Error as ex:
-            # You may find it helpful to uncomment this line while debugging,
-            # as it will show you all the details of the error that occurred:
-            raise ex
-            return 0
+        except pg.Error:
+            self.connection.rollback()
+            if num_committed:
+                self.invalidate_reference_data()
+            return num_committed
 
-    def workmate_sphere(self, eid: int) -> list[int]:
+    @_with_connection
+    def workmate_sphere(self, eid: int, mode: str = 'auto') -> list[int]:
         """Return the workmate sphere of the driver identified by <eid>, as a
         list of eIDs.
 
@@ -636,307 +1792,2115 @@ class WasteWrangler:
             * Any employee who has been on a trip with <eid>.
             * Recursively, any employee who has been on a trip with an employee
               in <eid>'s workmate sphere is also in <eid>'s workmate sphere.
+
+        <mode> selects where the sphere is computed: 'client' reads every pair
+        of workmates and walks them here, 'server' has the database walk them
+        so only the sphere is sent back, 'table' reads it from the table
+        WorkmateComponent (see cache_workmates), or does as 'server' if the
+        table was never materialized, and 'auto' uses the workmate
+        cache if enabled, otherwise picks 'server' once Trip is estimated to
+        hold at least _SERVER_SPHERE_MIN_TRIPS trips.
         """
+        if mode not in ('auto', 'client', 'server', 'table'):
+            raise ValueError(f"Unknown workmate_sphere mode: {mode!r}")
         try:
-            # TODO: implement this method
-            
-            new_cursor = self.connection.cursor()
-
-            new_cursor.execute("select eid from driver") #getting eIDs of all drivers
-
-            allDrivers = new_cursor.fetchall()
-           
-           
-            found = False
-
-            for driver in allDrivers:
-                if(driver[0] == eid): #checking if eid belongs to a driver otherwise return []
-                    found = True               
-        
-            
-            if (found == False): 
-                return []
+            cur = self.connection.cursor()
 
-            new_cursor.execute("select distinct eid1,eid2 from trip") #get workmates
-            pair_extract = new_cursor.fetchall()
-           
-            pairs = []
-            
-            for row in pair_extract:
-                pairs.append((row[0],row[1]))   #store in pairs array after integer conversion             
-
-            sphere_list = []
-            populate = self.partner(self,eid,pairs,sphere_list) # call recursive helper function to get workmate_sphere
-
-            
-            for x in range(len(sphere_list)): #remove the initial eid argument
-                if(sphere_list[x] == eid):
-                    del sphere_list[x]
-                    break #stop iteration to prevent going out of bounds
-            
-            new_cursor.close()            
-            return sphere_list          
-            
-        except pg.Error as ex:
-            # You may find it helpful to uncomment this line while debugging,
-            # as it will show you all the details of the error that occurred:
-            raise ex
+            #checking if eid belongs to a driver otherwise return []
+            reference = self._reference_data(cur)
+            if reference is not None:
+                is_driver = eid in reference.drivers_by_eid
+            else:
+                cur.execute(_IS_DRIVER_SQL, (eid,))
+                is_driver = cur.fetchone() is not None
+            if not is_driver:
+                cur.close()
+                return []
+
+            workmates = self._cached_workmates(cur) if mode == 'auto' else None
+            if workmates is not None:
+                cur.close()
+                return workmates.sphere(eid)
+
+            if mode == 'auto':
+                cur.execute(_TRIP_ESTIMATE_SQL)
+                estimate = cur.fetchone()[0]
+                #never analyzed (-1): the size is unknown, so stay on the server
+                mode = ('client' if 0 <= estimate < _SERVER_SPHERE_MIN_TRIPS
+                        else 'server')
+
+            if mode == 'table':
+                try:
+                    cur.execute(_TABLE_SPHERE_SQL, {'eid': eid})
+                    sphere = [row[0] for row in cur.fetchall()]
+                except pg.errors.UndefinedTable:
+                    #never materialized: walk the trips on the server instead
+                    self.connection.rollback()
+                    mode = 'server'
+
+            if mode == 'server':
+                cur.execute(_SPHERE_SQL, {'eid': eid})
+                sphere = [row[0] for row in cur.fetchall()]
+            elif mode == 'client':
+                cur.execute(_WORKMATES_SQL) #get workmates
+                sphere = _WorkmateGraph(cur.fetchall()).sphere(eid)
+
+            cur.close()
+            return sphere
+
+        except pg.Error:
+            self.connection.rollback()
+            return []
+
+    @_with_connection
+    def workmate_spheres(self, eids: Iterable[int]) -> dict[int, list[int]]:
+        """Return the workmate sphere, as defined in workmate_sphere, of every
+        eID in <eids>, reading the trips only once.
+        """
+        eids = list(eids)
+        try:
+            cur = self.connection.cursor()
+            reference = self._reference_data(cur)
+            if reference is not None:
+                drivers = reference.drivers_by_eid
+            else:
+                cur.execute(_DRIVERS_AMONG_SQL, (eids,))
+                drivers = {row[0] for row in cur.fetchall()}
+
+            workmates = self._cached_workmates(cur)
+            if workmates is None:
+                cur.execute(_WORKMATES_SQL)
+                workmates = _WorkmateGraph(cur.fetchall())
+
+            cur.close()
+            return {eid: workmates.sphere(eid) if eid in drivers else []
+                    for eid in eids}
+
+        except pg.Error:
+            self.connection.rollback()
+            return {eid: [] for eid in eids}
+
+    @_with_connection
+    def workmate_components(self) -> list[list[int]]:
+        """Return every group of employees who are in each other's workmate
+        sphere, as sorted lists of eIDs. Employees who have never been on a
+        trip are in no group.
+        """
+        try:
+            cur = self.connection.cursor()
+            workmates = self._cached_workmates(cur)
+            if workmates is None:
+                cur.execute(_WORKMATES_SQL)
+                workmates = _WorkmateGraph(cur.fetchall())
+            cur.close()
+            return workmates.components()
+
+        except pg.Error:
+            self.connection.rollback()
             return []
 
-    def schedule_maintenance(self, date: dt.date) -> int:
+    @_with_connection
+    def schedule_maintenance(self, date: dt.date,
+                             tids: Optional[Iterable[int]] = None) -> int:
         """For each truck whose most recent maintenance before <date> happened
         over 90 days before <date>, and for which there is no scheduled
         maintenance up to 10 days following date, schedule maintenance with
         a technician qualified to work on that truck in ascending order of tIDs.
+        If <tids> is given, only the trucks in it are considered.
         """
+        new_maintenance = []
+        if tids is not None:
+            tids = list(tids)
         try:
-            # TODO: implement this method
             cur = self.connection.cursor()
-            
-            #finding the date to check the truck maintenance
-            maintenanceDate = date - dt.timedelta(days=90)
-            tenDays = date + dt.timedelta(days=10)
-
-            #Trucks that need maintenance
-            cur.execute("""
-                CREATE TEMPORARY VIEW MainRequired AS 
-                (SELECT DISTINCT tID FROM Truck ORDER BY tID) 
-                EXCEPT 
-                (SELECT DISTINCT tID FROM Maintenance WHERE mDATE BETWEEN %s AND %s)
-                """, (maintenanceDate, tenDays))
-            
-            # ----- Storing all the maintenance requiring trucks in a var ----
-            cur.execute("SELECT tID, truckType FROM MainRequired NATURAL JOIN Truck ORDER BY tID")
-            maintenanceRequiredTrucks = cur.fetchall()
-
-            if maintenanceRequiredTrucks is None:
-                cur.close()
-                self.connection.commit()
-                return 0
-            
-
-            #FIND ALL TRUCKS GETTING MAINTAINED IN THE NEXT 10 DAYS
-            # 
-            #Finding all the available techs for every truck type and then schedule the maintenance
-            number_schedule = 0 
-            
-            
-
-            for eachTruck in maintenanceRequiredTrucks:
-
-                tid, truck_t = eachTruck
-
-
-                #------ finding the allowed technicians
-                cur.execute(""" 
-                    CREATE VIEW techAllowed AS
-                    SELECT eID 
-                    FROM Technician 
-                    WHERE truckType = %s 
-                    ORDER BY eID """, (truck_t))
-                
-                cur.execute("SELECT * FROM techAllowed")
-                tech_allowed = cur.fetchall()
-
-                if tech_allowed is None: #skip if not allowed
-                    continue
-
-
-                curr_date = date + dt.timedelta(days=1)
-                can_schedule = False
-
-                while can_schedule is False:
-
-                    # ----- Find if the tID is going on a trip today
-                    cur.execute ( """
-                        SELECT * 
-                        FROM Trip 
-                        WHERE tID = %s AND date(tTIME) = %s
-                    
-                    """, (tid, curr_date))
-                    TruckOnTrip = cur.fetchone()
-                    #print("truck is going on trip: ", TruckOnTrip)
-
-                    if TruckOnTrip is not None: #if it went on a trip go to the next day and skip iteration
-                        #print("Going here")
-                        self.connection.rollback()
-                        curr_date = curr_date + dt.timedelta(days=1)
-                        continue
-
-
-
-                        # -------------------- -------------------- --------------------
-                    # -------- get free technicians on the day w the same type -----
-
-
-                    ##get all the technicians that are busy
-                    cur.execute("""
-                        CREATE TEMPORARY VIEW NotAvail AS
-                        SELECT eID
-                        FROM Maintenance NATURAL JOIN techAllowed NATURAL JOIN Employee
-                        WHERE mDATE = %s OR hireDate >= %s
-                        ORDER BY eID
-                    
-                    """, (curr_date, curr_date))
-
-
-                    #----- subtract all allowed from the ones who are busy
-                    cur.execute("""
-                        CREATE TEMPORARY VIEW FinalList AS 
-                        (SELECT eID
-                        FROM techAllowed
-                        ORDER BY eID)
-                        EXCEPT
-                        (SELECT *
-                        FROM NotAvail)
-                    """)
-
-                    cur.execute(" SELECT * FROM FinalList ORDER BY eID")
-
-                    availableTechEID = cur.fetchone()
-                    #print(availableTechEID)
-
-                    #----- if no available techs today, go to the next day and skip iteration
-                    if availableTechEID is None:
-                        self.connection.rollback()
-                        curr_date = curr_date + dt.timedelta(days=1)
-                        continue
-                    
-                   
-                    #===== everything is good, we can insert and update
-                    cur.execute(" INSERT INTO Maintenance (tID, eID, mDATE) VALUES (%s, %s, %s)", (tid, availableTechEID, curr_date))
-                    number_schedule += 1
-                    can_schedule = True
-                    cur.execute("DROP VIEW FinalList, NotAvail")
-                    
-                    
-                    
-                    self.connection.commit()
-                
-                #other cleanup
-                cur.execute("DROP VIEW techAllowed")
 
+            date = _as_day(date)
+
+            #------ give each due truck its earliest free day, in tID order
+            new_maintenance = self._plan_maintenance(self._loader(cur), date,
+                                                     tids)
+            if new_maintenance:
+                pg_extras.execute_values(cur, _INSERT_MAINTENANCES_SQL,
+                                         new_maintenance, page_size=1000)
 
-            
             cur.close()
             self.connection.commit()
-            return number_schedule
-        
+            return len(new_maintenance)
+
         except pg.Error as ex:
-            # You may find it helpful to uncomment this line while debugging,
-            # as it will show you all the details of the error that occurred:
-            raise ex
+            self.connection.rollback()
+            if self._add_missing_partitions(
+                    ex, 'maintenance', [day for _, _, day in new_maintenance]):
+                return self.schedule_maintenance(date, tids)
             return 0
 
-    def reroute_waste(self, fid: int, date: dt.date) -> int:
+    @_with_connection
+    def schedule_horizon(self, first_day: dt.date, last_day: dt.date,
+                         workers: Optional[int] = None
+                         ) -> dict[dt.date, tuple[int, int]]:
+        """Schedule trips for every truck, and maintenance for the trucks due
+        for it, on every day from <first_day> to <last_day>, inclusive, with
+        the same result as calling schedule_fleet(day) and then
+        schedule_maintenance(day) for each day in order.
+
+        The work is split into units that run in <workers> processes, one per
+        CPU by default, each with its own connection:
+
+            1. Maintenance, one unit per shard of the trucks (see
+               _maintenance_shards), which plans the days in order. Later days
+               depend on the maintenance of earlier ones, but no truck or
+               technician is shared between shards.
+
+            2. Then trips, one unit per day: a day's plan only depends on the
+               trips and maintenance already on that day. Maintenance planned
+               after a day only looks at the trips after it, and only lands
+               on days after it, so the trips of a day see the same
+               maintenance, and the maintenance the same trips, as in the
+               sequential order: planning all the maintenance first changes
+               nothing.
+
+        Units write disjoint rows, and create the partitions they need under
+        an advisory lock, so they never wait on each other. The workers are
+        spawned rather than forked, so that they do not share this process's
+        connections: a script calling this must guard its entry point with
+        if __name__ == '__main__'. The workmate cache is dropped afterwards,
+        as the workers' trips are not recorded in it.
+
+        With <workers> of 1 or less, or if this WasteWrangler was not
+        connected with connect, run the days in order on its own connection
+        instead.
+
+        Return, for each day, the number of trips and of maintenances
+        scheduled.
+        """
+        first_day = _as_day(first_day)
+        last_day = _as_day(last_day)
+        days = [first_day + dt.timedelta(days=offset)
+                for offset in range((last_day - first_day).days + 1)]
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1 or self._credentials is None:
+            scheduled = {}
+            for day in days:
+                counts, _ = self.schedule_fleet(day)
+                scheduled[day] = (sum(counts.values()),
+                                  self.schedule_maintenance(day))
+            return scheduled
+
+        with self._snapshot() as cur:
+            shards = _maintenance_shards(self._reference_data(cur)
+                                         or _ReferenceData.load(cur))
+        with ProcessPoolExecutor(
+                workers, multiprocessing.get_context('spawn'),
+                initializer=_start_planner,
+                initargs=(*self._credentials, self._reference_ttl)
+                ) as executor:
+            maintenance = [0] * len(days)
+            for counts in executor.map(
+                    partial(_schedule_shard_maintenance, days), shards):
+                maintenance = [total + count for total, count
+                               in zip(maintenance, counts)]
+            trips = list(executor.map(_schedule_day_trips, days))
+        self.invalidate_workmates()
+        return dict(zip(days, zip(trips, maintenance)))
+
+    def reroute_waste(self, fid: int, date: dt.date,
+                      balance: bool = False) -> int:
         """Reroute the trips to <fid> on day <date> to another facility that
         takes the same type of waste. If there are many such facilities, pick
-        the one with the smallest fID (that is not <fid>).
+        the one with the smallest fID (that is not <fid>), or, if <balance>
+        is True, spread the trips over all of them as reroute_waste_balanced
+        does.
+        """
+        # the outage of one facility for one day
+        if balance:
+            counts, _ = self.reroute_waste_balanced([fid], date, date)
+        else:
+            counts = self.reroute_waste_many([fid], date, date)
+        return counts.get(fid, 0)
+
+    @_with_connection
+    def reroute_waste_balanced(
+            self, fids: Iterable[int], first_day: dt.date, last_day: dt.date
+            ) -> tuple[dict[int, int], dict[tuple[int, dt.date], float]]:
+        """Reroute the trips to any of the facilities <fids> from <first_day>
+        to <last_day>, inclusive, spreading them over every facility not in
+        <fids> that takes the same type of waste, rather than sending them
+        all to the one with the smallest fID.
+
+        A facility's load on a day is the total capacity of the trucks sent
+        to it that day. Biggest truck first, each trip goes to the eligible
+        facility with the lowest load on its day (the smallest fID among
+        equals), and all trips are then moved by a single update.
+
+        Return a mapping from each fID in <fids> to the number of its trips
+        that were rerouted, and the projected load on each day with rerouted
+        trips of every facility eligible for them, keyed by (fID, day).
         """
-        
+        fids = list(fids)
+        counts = {fid: 0 for fid in fids}
+
+        first_day = _as_day(first_day)
+        last_day = _as_day(last_day)
+
         try:
-            # TODO: implement this method
             cur = self.connection.cursor()
 
-            #find the waste type of the facility which is shut down
-            cur.execute("SELECT wasteType FROM Facility WHERE fID =%s", (fid,))
-            result = cur.fetchone()
-            #print("waste type:", result)
-
-            #invalid wastetype
-            if result is None:
-                return 0
-
-            WasteType = result[0]
-
-            #find facilities where the waste type is the same
-            cur.execute("SELECT fID FROM Facility WHERE fID != %s AND wasteType = %s ORDER BY fID", (fid, WasteType))
-            availableFacilities = cur.fetchall()
-            
-            #print("available facilities:", availableFacilities)
-            newFID = availableFacilities[0]
-
-            if not availableFacilities: #if there aren't any facilities available then dip
-                return 0
-
-            #cursor.execute("SELECT *  FROM Trip WHERE date(tTime) = %s AND fID != %s", (date, fid))
-            
-            #print("the new fid", newFID)
-            #tripsOnDate = cursor.fetchall()
-            #if not tripsOnDate:
-            #    return 0
-           
-            # update the trip table to change all the rows
-            cur.execute("UPDATE Trip SET fID = %s WHERE fID = %s AND date(tTIME) = %s ", (newFID, fid, date ))
-
-            num_changed = cur.rowcount
-            
+            #------ the trips to move, locked, and where they can go
+            moved, projected = self._plan_reroute(
+                self._loader(cur, lock=True), fids, first_day, last_day, True)
+
+            #------ one update for all of them
+            if moved:
+                rids, t_times, _, new_fids = zip(*moved)
+                cur.execute(_MOVE_TRIPS_SQL,
+                            (list(rids), list(t_times), list(new_fids),
+                             first_day, last_day + dt.timedelta(days=1)))
+            for _, _, fid, _ in moved:
+                counts[fid] += 1
+
             cur.close()
             self.connection.commit()
-            
-            return num_changed
-        except pg.Error as ex:
-            # You may find it helpful to uncomment this line while debugging,
-            # as it will show you all the details of the error that occurred:
-            #raise ex
+            return counts, projected
+
+        except pg.Error:
             self.connection.rollback()
-            return 0
+            return {fid: 0 for fid in fids}, {}
+
+    @_with_connection
+    def reroute_waste_many(self, fids: Iterable[int], first_day: dt.date,
+                           last_day: dt.date) -> dict[int, int]:
+        """Reroute the trips to any of the facilities <fids> from <first_day>
+        to <last_day>, inclusive, to the facility with the smallest fID that
+        takes the same type of waste and is not in <fids>.
+
+        All the trips are moved by a single update. Return a mapping from each
+        fID in <fids> to the number of its trips that were rerouted.
+        """
+        fids = list(fids)
+        counts = {fid: 0 for fid in fids}
+
+        first_day = _as_day(first_day)
+        last_day = _as_day(last_day)
+
+        try:
+            cur = self.connection.cursor()
+
+            cur.execute(_REROUTE_MANY_SQL, {
+                'fids': fids, 'first_day': first_day,
+                'end_day': last_day + dt.timedelta(days=1)})
+            counts.update(cur.fetchall())
+
+            cur.close()
+            self.connection.commit()
+            return counts
+
+        except pg.Error:
+            self.connection.rollback()
+            return {fid: 0 for fid in fids}
+
+    # ============================ Dry runs ================================== #
+    # Each plan_* method works out what the scheduler of the same name would
+    # write, using the same planner, but in a read-only REPEATABLE READ
+    # transaction that is rolled back: it returns the proposed rows, writes
+    # nothing and takes no row locks.
+
+    @_with_connection
+    def plan_trip(self, rid: int, time: dt.datetime) -> Optional[tuple]:
+        """Return the Trip row schedule_trip(<rid>, <time>) would insert, or
+        None if it would fail.
+        """
+        return self.plan_trip_many([(rid, time)])[0]
+
+    @_with_connection
+    def plan_trip_many(self, requests: Iterable[tuple[int, dt.datetime]]
+                       ) -> list[Optional[tuple]]:
+        """Return, for each (rid, time) in <requests>, the Trip row
+        schedule_trip_many(<requests>) would insert for it, or None if it
+        would schedule nothing for it.
+        """
+        requests = list(requests)
+        if not requests:
+            return []
+        try:
+            with self._snapshot() as cur:
+                resources = self._load_trip_resources(
+                    self._loader(cur), sorted({rid for rid, _ in requests}),
+                    sorted({time.date() for _, time in requests}))
+                return [resources.assign(rid, time) for rid, time in requests]
+        except pg.Error:
+            return [None] * len(requests)
+
+    def plan_trips(self, tid: int, date: dt.date) -> list[tuple]:
+        """Return the Trip rows schedule_trips(<tid>, <date>) would insert."""
+        return self.plan_fleet(date, [tid])
+
+    @_with_connection
+    def plan_fleet(self, date: dt.date,
+                   tids: Optional[Iterable[int]] = None) -> list[tuple]:
+        """Return the Trip rows schedule_fleet(<date>, <tids>) would insert.
+        """
+        date = _as_day(date)
+        try:
+            with self._snapshot() as cur:
+                loader = self._loader(cur)
+                trucks = loader.fleet_trucks(
+                    None if tids is None else list(tids))
+                _, new_trips = self._load_day_plan(
+                    loader, date).plan_fleet(trucks)
+                return new_trips
+        except pg.Error:
+            return []
+
+    @_with_connection
+    def plan_maintenance(self, date: dt.date,
+                         tids: Optional[Iterable[int]] = None
+                         ) -> list[tuple[int, int, dt.date]]:
+        """Return the Maintenance rows schedule_maintenance(<date>, <tids>)
+        would insert.
+        """
+        date = _as_day(date)
+        try:
+            with self._snapshot() as cur:
+                return self._plan_maintenance(self._loader(cur), date, tids)
+        except pg.Error:
+            return []
+
+    @_with_connection
+    def plan_reroute(self, fids: Iterable[int], first_day: dt.date,
+                     last_day: dt.date, balance: bool = False
+                     ) -> list[tuple[int, dt.datetime, int, int]]:
+        """Return the (rID, tTIME, old fID, new fID) of every trip that
+        reroute_waste_many(<fids>, <first_day>, <last_day>), or
+        reroute_waste_balanced if <balance> is True, would move.
+        """
+        fids = list(fids)
+        first_day = _as_day(first_day)
+        last_day = _as_day(last_day)
+        try:
+            with self._snapshot() as cur:
+                moved, _ = self._plan_reroute(self._loader(cur), fids,
+                                              first_day, last_day, balance)
+                return moved
+        except pg.Error:
+            return []
 
     # =========================== Helper methods ============================= #
 
+    def _add_missing_partitions(self, error: pg.Error, table: str,
+                                days: Iterable[dt.date]) -> bool:
+        """Helper for the schedulers, called once they have rolled back after
+        <error>. If <error> says a row of <table> ('trip' or 'maintenance')
+        has no partition to go in, create the partitions of <table> that rows
+        on <days> need.
+
+        Return True iff partitions were created, so that the write can be
+        tried again. partition_tables creates the partitions of the coming
+        months ahead of time, so the usual write costs no extra round-trip.
+        """
+        if not _is_missing_partition(error):
+            return False
+        try:
+            cur = self.connection.cursor()
+            cur.execute(_ENSURE_PARTITIONS_SQL, (table, sorted(set(days))))
+            created = cur.fetchone()[0]
+            cur.close()
+            self.connection.commit()
+            return created > 0
+        except pg.Error:
+            self.connection.rollback()
+            return False
+
+    @contextmanager
+    def _snapshot(self) -> Iterator[pg_ext.cursor]:
+        """Helper for the plan_* methods. Start a read-only REPEATABLE READ
+        transaction on this WasteWrangler's connection and give a cursor for
+        it, then close the cursor and roll the transaction back.
+        """
+        cur = self.connection.cursor()
+        try:
+            cur.execute(_SNAPSHOT_SQL)
+            yield cur
+        finally:
+            cur.close()
+            self.connection.rollback()
+
+    def _cached_workmates(self, cur: pg_ext.cursor
+                          ) -> Optional['_WorkmateGraph']:
+        """Return the workmate cache, building it with the cursor <cur> (and
+        filling WorkmateComponent, if materialized) if needed, or None if the
+        cache is disabled.
+
+        The trips are read without holding _workmates_lock, so other threads
+        can use and update the cache meanwhile; the pairs they record while it
+        is being built are added to it before it is installed.
+        """
+        with self._workmates_lock:
+            if self._workmates is not None or self._workmates_limit <= 0:
+                return self._workmates
+            generation = self._workmates_generation
+            self._workmates_builds += 1
+        try:
+            cur.execute(_WORKMATES_SQL)
+            workmates = _WorkmateGraph(cur.fetchall())
+        except pg.Error:
+            with self._workmates_lock:
+                self._end_workmates_build()
+            raise
+
+        with self._workmates_write_lock:
+            with self._workmates_lock:
+                pending = self._end_workmates_build()
+                if self._workmates is not None:
+                    #another thread installed one first
+                    return self._workmates
+                if generation != self._workmates_generation:
+                    #dropped meanwhile: answer from this one, but keep nothing
+                    return workmates
+                for eid1, eid2 in pending:
+                    workmates.add(eid1, eid2)
+                if len(workmates) > self._workmates_limit:
+                    self._workmates_limit = 0
+                    return None
+                self._workmates = workmates
+            if self._workmates_table:
+                try:
+                    self._materialize_workmates(workmates)
+                except pg.Error:
+                    self._drop_workmates(workmates)
+                    raise
+        return workmates
+
+    def _end_workmates_build(self) -> list[tuple[int, int]]:
+        """Record that a thread is done building the workmate cache, and
+        return the pairs recorded since the build started.
+
+        _workmates_lock must be held.
+        """
+        self._workmates_builds -= 1
+        pending = self._workmates_pending
+        if self._workmates_builds == 0:
+            self._workmates_pending = []
+        return pending
+
+    def _materialize_workmates(self, workmates: '_WorkmateGraph') -> None:
+        """Fill WorkmateComponent, creating it if needed, with the components
+        of <workmates>, on the connection of _workmates_connection. Nothing is
+        written if this WasteWrangler was not connected with connect.
+
+        _workmates_write_lock must be held.
+        """
+        conn = self._workmates_connection()
+        if conn is None:
+            return
+        with self._workmates_lock:
+            roots = list(workmates.roots())
+        try:
+            cur = conn.cursor()
+            cur.execute(_WORKMATE_TABLE_SQL)
+            pg_extras.execute_values(cur, _UPSERT_WORKMATE_COMPONENTS_SQL,
+                                     roots, page_size=1000)
+            cur.close()
+            conn.commit()
+        except pg.Error:
+            conn.rollback()
+            raise
+
+    def _workmates_connection(self) -> Optional[pg_ext.connection]:
+        """Return the connection WorkmateComponent is written on, connecting
+        it first if needed, or None if this WasteWrangler was not connected
+        with connect. It is a connection of its own, so that keeping the table
+        up to date never commits, or waits on, what is in progress on the
+        connections of the callers.
+
+        _workmates_write_lock must be held.
+        """
+        if self._credentials is None:
+            return None
+        if self._workmates_writer is None or self._workmates_writer.closed:
+            dbname, username, password = self._credentials
+            self._workmates_writer = pg.connect(
+                dbname=dbname, user=username, password=password,
+                options="-c search_path=waste_wrangler",
+                connection_factory=_InstrumentedConnection)
+        return self._workmates_writer
+
+    def _drop_workmates(self, workmates: '_WorkmateGraph') -> None:
+        """Drop the workmate cache if it is still <workmates>, so that it is
+        rebuilt, with WorkmateComponent, on its next use.
+        """
+        with self._workmates_lock:
+            if self._workmates is workmates:
+                self._workmates = None
+                self._workmates_generation += 1
+
+    def _record_workmates(self, pairs: Iterable[tuple[int, int]]) -> None:
+        """Add the (eID1, eID2) <pairs> of employees just scheduled on a trip
+        together to the workmate cache, if it has been built or is being
+        built, and to WorkmateComponent, if materialized. The caller's
+        connection is left alone: the table is written on its own connection
+        (see _workmates_connection), after _workmates_lock is released.
+        """
+        pairs = list(pairs)
+        with self._workmates_lock:
+            workmates = self._workmates
+            if workmates is None:
+                if self._workmates_builds > 0:
+                    self._workmates_pending.extend(pairs)
+                return
+            changed = []
+            for eid1, eid2 in pairs:
+                changed.extend(eid for eid, _ in workmates.add(eid1, eid2))
+
+            if len(workmates) > self._workmates_limit:
+                self._workmates, self._workmates_limit = None, 0
+                return
+            if not self._workmates_table or not changed:
+                return
+
+        with self._workmates_write_lock:
+            #roots are read when written, as writes may finish out of order
+            with self._workmates_lock:
+                if self._workmates is not workmates:
+                    return
+                rows = [(eid, workmates.root(eid))
+                        for eid in dict.fromkeys(changed)]
+            conn = None
+            try:
+                conn = self._workmates_connection()
+                if conn is None:
+                    return
+                cur = conn.cursor()
+                pg_extras.execute_values(cur, _UPSERT_WORKMATE_COMPONENTS_SQL,
+                                         rows, page_size=1000)
+                cur.close()
+                conn.commit()
+            except pg.Error:
+                #the table is behind now: rebuild everything on next use
+                if conn is not None and not conn.closed:
+                    conn.rollback()
+                self._drop_workmates(workmates)
+
+    def _reference_data(self, cur: pg_ext.cursor
+                        ) -> Optional['_ReferenceData']:
+        """Return the reference data snapshot, reading it with the cursor
+        <cur> if there is none or it has expired, or None if snapshots are
+        disabled.
+        """
+        with self._reference_lock:
+            if self._reference_ttl <= 0:
+                return None
+            if (self._reference is None
+                    or perf_counter() - self._reference.loaded_at
+                    > self._reference_ttl):
+                self._reference = _ReferenceData.load(cur)
+            return self._reference
+
+    def _loader(self, cur: pg_ext.cursor,
+                lock: bool = False) -> '_DatabaseLoader':
+        """Return a loader that reads the planners' rows with the cursor
+        <cur>, and the reference tables from the reference data snapshot if
+        there is one. If <lock> is True, the trips it reads to reroute are
+        locked until the end of the transaction.
+        """
+        return _DatabaseLoader(cur, self._reference_data(cur), lock)
+
+    @staticmethod
+    def _plan_maintenance(loader: '_PlannerLoader', date: dt.date,
+                          tids: Optional[Iterable[int]] = None
+                          ) -> list[tuple[int, int, dt.date]]:
+        """Helper for schedule_maintenance and plan_maintenance. Using
+        <loader>, plan the maintenance of the trucks due for it on <date>,
+        among <tids> if given, and return the new Maintenance rows.
+
+        The days the trucks are taken are read for the _MAINTENANCE_HORIZON
+        days after <date>. A truck only lands past them if it is taken on
+        every one of them; the plan is then made again over twice as many.
+        """
+        if tids is not None:
+            tids = list(tids)
+        horizon = _MAINTENANCE_HORIZON
+        while True:
+            until = date + dt.timedelta(days=horizon + 1)
+            new_maintenance = WasteWrangler._load_maintenance_plan(
+                loader, date, until, tids).plan_all()
+            if all(day < until for _, _, day in new_maintenance):
+                return new_maintenance
+            horizon *= 2
+
+    @staticmethod
+    def _load_maintenance_plan(loader: '_PlannerLoader', date: dt.date,
+                               until: dt.date,
+                               tids: Optional[Iterable[int]] = None
+                               ) -> '_MaintenancePlan':
+        """Helper for _plan_maintenance. Using <loader>, read the trucks due
+        for maintenance on <date>, among <tids> if given, the technicians who
+        can work on them, the days after <date> on which those technicians
+        are taken, and those before <until> on which those trucks are, and
+        return them as a _MaintenancePlan.
+        """
+        trucks = loader.due_trucks(date - dt.timedelta(days=90),
+                                   date + dt.timedelta(days=10))
+        if tids is not None:
+            tids = set(tids)
+            trucks = [(tid, truck_t) for tid, truck_t in trucks
+                      if tid in tids]
+
+        truck_types = list({truck_t for _, truck_t in trucks})
+        return _MaintenancePlan(
+            date, trucks, loader.technicians(truck_types),
+            loader.technician_days(date, truck_types),
+            loader.truck_days(date, until, [tid for tid, _ in trucks]))
+
+    @staticmethod
+    def _load_trip_resources(loader: '_PlannerLoader', rids: list[int],
+                             days: list[dt.date]) -> '_TripResources':
+        """Helper for schedule_trip_many. Using <loader>, read the routes
+        <rids>, all trucks, drivers and facilities, and the maintenance and
+        trips on <days>, in ascending order, and return them as
+        _TripResources.
+        """
+        return _TripResources(loader.routes(rids), loader.trucks_by_capacity(),
+                              loader.drivers(), loader.facilities(),
+                              loader.days_maintenance(days),
+                              loader.days_trips(days))
+
+    @staticmethod
+    def _load_day_plan(loader: '_PlannerLoader', date: dt.date
+                       ) -> '_DayPlan':
+        """Helper for schedule_fleet. Using <loader>, read the routes, drivers
+        and facilities and the trips and maintenance already scheduled on
+        <date>, and return them as a _DayPlan.
+        """
+        trips = loader.days_trips([date])
+        maintenance = loader.days_maintenance([date])
+        return _DayPlan(date, loader.routes(), loader.drivers(),
+                        loader.facilities(), trips, maintenance)
+
+    @staticmethod
+    def _plan_reroute(loader: '_PlannerLoader', fids: list[int],
+                      first_day: dt.date, last_day: dt.date, balance: bool
+                      ) -> tuple[list[tuple[int, dt.datetime, int, int]],
+                                 dict[tuple[int, dt.date], float]]:
+        """Helper for the reroute methods. Using <loader>, read the trips to
+        the facilities <fids> from <first_day> to <last_day>, inclusive, and
+        the facilities they can go to instead, and return the
+        (rID, tTIME, old fID, new fID) of every trip that has somewhere to
+        go, with the projected loads of _balance_trips.
+
+        If <balance> is True, the trips are spread as _balance_trips does;
+        otherwise each goes to the smallest fID that takes its waste type,
+        and no loads are projected.
+        """
+        end_day = last_day + dt.timedelta(days=1)
+        trips = loader.closed_trips(fids, first_day, end_day)
+        facilities = loader.open_facilities(fids)
+        if balance:
+            return _balance_trips(
+                trips, facilities,
+                loader.facility_load(fids, first_day, end_day))
+
+        #every trip goes to the smallest open fID for its waste type
+        replacement = {}
+        for fid, waste_t in facilities:
+            replacement.setdefault(waste_t, fid)
+        return [(rid, t_time, fid, replacement[waste_t])
+                for rid, t_time, fid, waste_t, _ in trips
+                if waste_t in replacement], {}
+
     @staticmethod
-    def _read_qualifications_file(file: TextIO) -> list[list[str, str, str]]:
+    def _read_qualifications_file(file: TextIO, chunk_size: int = 10000
+                                  ) -> Iterator[list[tuple[str, str, str]]]:
         """Helper for update_technicians. Accept an open file <file> that
-        follows the format described on the A2 handout and return a list
-        representing the information in the file, where each item in the list
-        includes the following 3 elements in this order:
+        follows the format described on the A2 handout and yield the
+        information in the file, in lists of up to <chunk_size> items, where
+        each item is a tuple of the following 3 elements in this order:
             * The first name of the technician.
             * The last name of the technician.
             * The truck type that the technician is currently qualified to work
               on.
 
+        The file is read lazily, so only one chunk is in memory at a time.
+
         Pre-condition:
             <file> follows the format given on the A2 handout.
         """
-        result = []
-        employee_info = []
-        for idx, line in enumerate(file):
-            if idx % 2 == 0:
-                info = line.strip().split(' ')[-2:]
-                fname, lname = info
-                employee_info.extend([fname, lname])
-            else:
-                employee_info.append(line.strip())
-                result.append(employee_info)
-                employee_info = []
+        chunk = []
+        lines = iter(file)
+        for name_line in lines:
+            #drop the title, if any, in front of the name
+            fname, lname = name_line.split()[-2:]
+            chunk.append((fname, lname, next(lines, '').strip()))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _as_day(value: dt.date) -> dt.date:
+    """Return the day of <value>, a date or a datetime. Callers sometimes pass
+    a datetime where only the day matters.
+    """
+    if isinstance(value, dt.datetime):
+        return value.date()
+    return value
+
+
+def _trip_duration(length: float) -> dt.timedelta:
+    """Return how long a trip on a route of <length> km takes, assuming the
+    truck travels at an average of 5 kph.
+    """
+    return dt.timedelta(seconds=int(3600 * (length / 5)))
+
+
+def _balance_trips(trips: list[tuple], facilities: list[tuple],
+                   loads: list[tuple]
+                   ) -> tuple[list[tuple[int, dt.datetime, int, int]],
+                              dict[tuple[int, dt.date], float]]:
+    """Helper for reroute_waste_balanced. Assign each of the
+    (rID, tTIME, fID, wasteType, capacity) <trips>, in the order given, to
+    the facility with the lowest load on its day among the (fID, wasteType)
+    <facilities> that take its waste type, the smallest fID among equals.
+    <loads> holds the (fID, day, load) already on the facilities.
+
+    Return the (rID, tTIME, old fID, new fID) of every trip that found a
+    facility, and the resulting load on each day with such trips of each
+    facility eligible for them, keyed by (fID, day).
+    """
+    by_waste_type = {}
+    for fid, waste_t in facilities:
+        by_waste_type.setdefault(waste_t, []).append(fid)
+    load = {(fid, day): total for fid, day, total in loads}
+
+    #one min-heap of (load, fID) per day and waste type, built when needed
+    heaps = {}
+    moved = []
+    for rid, t_time, old_fid, waste_t, capacity in trips:
+        day = t_time.date()
+        heap = heaps.get((day, waste_t))
+        if heap is None:
+            heap = [(load.get((fid, day), 0), fid)
+                    for fid in by_waste_type.get(waste_t, [])]
+            heapq.heapify(heap)
+            heaps[(day, waste_t)] = heap
+        if not heap:
+            continue
+        fid_load, fid = heapq.heappop(heap)
+        heapq.heappush(heap, (fid_load + capacity, fid))
+        moved.append((rid, t_time, old_fid, fid))
+
+    projected = {(fid, day): fid_load
+                 for (day, _), heap in heaps.items() for fid_load, fid in heap}
+    return moved, projected
+
+
+def _maintenance_shards(reference: '_ReferenceData') -> list[list[int]]:
+    """Helper for schedule_horizon. Return the tIDs of the trucks in
+    <reference> that some technician can maintain, in ascending order, split
+    into shards such that no technician can maintain trucks of two shards.
+    Maintenance planned for the trucks of one shard then never depends on
+    that of another.
+    """
+    #truck types are in the same group if a technician can maintain both;
+    #every type of a group maps to the same set
+    groups = {}
+    for employee in reference.employees_by_eid.values():
+        if not employee.maintains:
+            continue
+        group = set()
+        for truck_t in employee.maintains:
+            group |= groups.get(truck_t, {truck_t})
+        for truck_t in group:
+            groups[truck_t] = group
+
+    shards = {}
+    for tid in sorted(reference.trucks_by_tid):
+        group = groups.get(reference.trucks_by_tid[tid].truck_type)
+        if group is not None:
+            shards.setdefault(id(group), []).append(tid)
+    return list(shards.values())
+
+
+# The WasteWrangler of a schedule_horizon worker process, connected by
+# _start_planner when the process starts.
+_planner: Optional['WasteWrangler'] = None
+
+
+def _start_planner(dbname: str, username: str, password: str,
+                   reference_ttl: float) -> None:
+    """Connect the WasteWrangler of this schedule_horizon worker process to
+    the database <dbname>, keeping a reference data snapshot for
+    <reference_ttl> seconds as the parent's does.
+    """
+    global _planner
+    _planner = WasteWrangler()
+    if not _planner.connect(dbname, username, password):
+        raise pg.OperationalError(f"could not connect to {dbname}")
+    _planner.cache_reference_data(reference_ttl)
+
+
+def _schedule_shard_maintenance(days: list[dt.date],
+                                tids: list[int]) -> list[int]:
+    """Schedule maintenance for the trucks <tids> on each of <days>, in order,
+    in a schedule_horizon worker process, and return the number of
+    maintenances scheduled on each day.
+    """
+    return [_planner.schedule_maintenance(day, tids) for day in days]
+
+
+def _schedule_day_trips(day: dt.date) -> int:
+    """Schedule trips for every truck on <day> in a schedule_horizon worker
+    process, and return the number of trips scheduled.
+    """
+    counts, _ = _planner.schedule_fleet(day)
+    return sum(counts.values())
+
+
+def _copy_escape(value: str) -> str:
+    """Return <value> escaped for a field of COPY's text format."""
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _group_drivers(rows: list[tuple]) -> list[tuple[int, dt.date, set[str]]]:
+    """Return the (eID, hireDate, truck types the driver can drive) of every
+    driver from the (eID, hireDate, truckType) <rows> of _DRIVERS_SQL, keeping
+    their order.
+    """
+    drivers = []
+    by_eid = {}
+    for eid, hire_date, truck_t in rows:
+        if eid not in by_eid:
+            by_eid[eid] = set()
+            drivers.append((eid, hire_date, by_eid[eid]))
+        by_eid[eid].add(truck_t)
+    return drivers
+
+
+class _Route:
+    """A row of Route in a _ReferenceData snapshot."""
+    __slots__ = ('rid', 'waste_type', 'length')
+    rid: int
+    waste_type: str
+    length: float
+
+    def __init__(self, rid: int, waste_type: str, length: float) -> None:
+        self.rid = rid
+        self.waste_type = waste_type
+        self.length = length
+
+
+class _Truck:
+    """A row of Truck in a _ReferenceData snapshot, with the waste types its
+    truck type can carry.
+    """
+    __slots__ = ('tid', 'truck_type', 'capacity', 'waste_types')
+    tid: int
+    truck_type: str
+    capacity: float
+    waste_types: set[str]
+
+    def __init__(self, tid: int, truck_type: str, capacity: float) -> None:
+        self.tid = tid
+        self.truck_type = truck_type
+        self.capacity = capacity
+        self.waste_types = set()
+
+
+class _Employee:
+    """A row of Employee in a _ReferenceData snapshot, with the truck types
+    the employee can drive and maintain.
+    """
+    __slots__ = ('eid', 'name', 'hire_date', 'drives', 'maintains')
+    eid: int
+    name: str
+    hire_date: dt.date
+    drives: set[str]
+    maintains: set[str]
+
+    def __init__(self, eid: int, name: str, hire_date: dt.date) -> None:
+        self.eid = eid
+        self.name = name
+        self.hire_date = hire_date
+        self.drives = set()
+        self.maintains = set()
+
+
+class _ReferenceData:
+    """A snapshot of the tables that scheduling reads on every call but that
+    rarely change: Route, Truck, TruckType, Facility, Employee, Driver and
+    Technician, indexed the ways the planners look them up.
+
+    === Instance Attributes ===
+    loaded_at: the perf_counter() time at which the snapshot was read.
+    routes_by_rid: maps each rID to its route.
+    routes_by_waste_type: maps each waste type to its routes, ordered by rID.
+    trucks_by_tid: maps each tID to its truck.
+    trucks_by_truck_type: maps each truck type to its trucks, ordered by tID.
+    trucks_by_waste_type: maps each waste type to the trucks that can carry
+        it, ordered by capacity descending and then tID.
+    facilities_by_waste_type: maps each waste type to the fIDs of the
+        facilities that accept it, in ascending order.
+    first_facility: maps each waste type to the lowest fID that accepts it.
+    employees_by_eid: maps each eID to its employee.
+    drivers_by_eid: maps the eID of each driver to its employee.
+    drivers: (eID, hireDate, truck types the driver can drive) of every
+        driver, ordered by hireDate and then eID, as _DRIVERS_SQL orders
+        them.
+    technicians_by_truck_type: maps each truck type to the technicians who can
+        maintain it, ordered by eID.
+    """
+    loaded_at: float
+    routes_by_rid: dict[int, _Route]
+    routes_by_waste_type: dict[str, list[_Route]]
+    trucks_by_tid: dict[int, _Truck]
+    trucks_by_truck_type: dict[str, list[_Truck]]
+    trucks_by_waste_type: dict[str, list[_Truck]]
+    facilities_by_waste_type: dict[str, list[int]]
+    first_facility: dict[str, int]
+    employees_by_eid: dict[int, _Employee]
+    drivers_by_eid: dict[int, _Employee]
+    drivers: list[tuple[int, dt.date, set[str]]]
+    technicians_by_truck_type: dict[str, list[_Employee]]
 
-        return result
-    
     @staticmethod
-    def partner(self,eid:int,driver_pairs:list,final_list:list):
-        
-        if not driver_pairs: #if empty
+    def load(cur: pg_ext.cursor) -> '_ReferenceData':
+        """Using the cursor <cur>, read the reference tables and return them as
+        a _ReferenceData.
+        """
+        reference = _ReferenceData()
+        reference.loaded_at = perf_counter()
+
+        cur.execute(_ROUTES_SQL)
+        reference.routes_by_rid = {}
+        reference.routes_by_waste_type = {}
+        for rid, waste_t, length in sorted(cur.fetchall()):
+            route = _Route(rid, waste_t, length)
+            reference.routes_by_rid[rid] = route
+            reference.routes_by_waste_type.setdefault(waste_t, []).append(
+                route)
+
+        cur.execute(_REFERENCE_TRUCKS_SQL)
+        reference.trucks_by_tid = {}
+        for tid, truck_t, capacity, waste_t in cur.fetchall():
+            if tid not in reference.trucks_by_tid:
+                reference.trucks_by_tid[tid] = _Truck(tid, truck_t, capacity)
+            reference.trucks_by_tid[tid].waste_types.add(waste_t)
+        reference.trucks_by_truck_type = {}
+        reference.trucks_by_waste_type = {}
+        for truck in sorted(reference.trucks_by_tid.values(),
+                            key=lambda truck: (-truck.capacity, truck.tid)):
+            for waste_t in truck.waste_types:
+                reference.trucks_by_waste_type.setdefault(
+                    waste_t, []).append(truck)
+        for tid in sorted(reference.trucks_by_tid):
+            truck = reference.trucks_by_tid[tid]
+            reference.trucks_by_truck_type.setdefault(
+                truck.truck_type, []).append(truck)
+
+        cur.execute(_REFERENCE_FACILITIES_SQL)
+        reference.facilities_by_waste_type = {}
+        for fid, waste_t in sorted(cur.fetchall()):
+            reference.facilities_by_waste_type.setdefault(
+                waste_t, []).append(fid)
+        reference.first_facility = {
+            waste_t: fids[0]
+            for waste_t, fids in reference.facilities_by_waste_type.items()}
+
+        cur.execute(_REFERENCE_EMPLOYEES_SQL)
+        reference.employees_by_eid = {
+            eid: _Employee(eid, name, hire_date)
+            for eid, name, hire_date in cur.fetchall()}
+
+        cur.execute(_REFERENCE_DRIVERS_SQL)
+        reference.drivers_by_eid = {}
+        for eid, truck_t in cur.fetchall():
+            employee = reference.employees_by_eid[eid]
+            employee.drives.add(truck_t)
+            reference.drivers_by_eid[eid] = employee
+        reference.drivers = [
+            (employee.eid, employee.hire_date, employee.drives)
+            for employee in sorted(
+                reference.drivers_by_eid.values(),
+                key=lambda employee: (employee.hire_date, employee.eid))]
+
+        cur.execute(_REFERENCE_TECHNICIANS_SQL)
+        reference.technicians_by_truck_type = {}
+        for eid, truck_t in sorted(cur.fetchall()):
+            employee = reference.employees_by_eid[eid]
+            employee.maintains.add(truck_t)
+            reference.technicians_by_truck_type.setdefault(
+                truck_t, []).append(employee)
+        return reference
+
+    def route_rows(self, rids: Optional[list[int]] = None
+                   ) -> list[tuple[int, str, float]]:
+        """Return the (rID, wasteType, length) of the routes <rids> that exist,
+        or of every route if <rids> is None.
+        """
+        if rids is None:
+            routes = self.routes_by_rid.values()
+        else:
+            routes = (self.routes_by_rid[rid] for rid in set(rids)
+                      if rid in self.routes_by_rid)
+        return [(route.rid, route.waste_type, route.length)
+                for route in routes]
+
+    def truck_rows(self) -> list[tuple[int, str, str]]:
+        """Return the (tID, truckType, wasteType) of every truck and waste type
+        it can carry, ordered by capacity descending and then tID.
+        """
+        trucks = sorted(self.trucks_by_tid.values(),
+                        key=lambda truck: (-truck.capacity, truck.tid))
+        return [(truck.tid, truck.truck_type, waste_t)
+                for truck in trucks for waste_t in sorted(truck.waste_types)]
+
+    def technician_rows(self, truck_types: list[str]
+                        ) -> list[tuple[int, str, dt.date]]:
+        """Return the (eID, truckType, hireDate) of the technicians qualified
+        to work on each of <truck_types>, ordered by eID.
+        """
+        rows = [(employee.eid, truck_t, employee.hire_date)
+                for truck_t in set(truck_types)
+                for employee in self.technicians_by_truck_type.get(truck_t, [])]
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+
+class _PlannerLoader:
+    """The rows the planners are built from, read by WasteWrangler's
+    _load_* helpers. WasteWrangler reads them from the database with a
+    _DatabaseLoader, and LocalWasteWrangler from its tables in memory with an
+    a2local._LocalLoader, so both build their planners the same way.
+
+    Each method returns the rows of the query it is named after, e.g.
+    due_trucks those of _DUE_TRUCKS_SQL, in the same order where the query
+    orders them. The rows of the reference tables are taken from <reference>;
+    the rest must be given by a subclass.
+
+    === Instance Attributes ===
+    reference: the reference data snapshot, or None if there is none.
+    """
+    reference: Optional[_ReferenceData]
+
+    def __init__(self, reference: Optional[_ReferenceData]) -> None:
+        """Initialize a loader that takes the reference tables from
+        <reference>.
+        """
+        self.reference = reference
+
+    def routes(self, rids: Optional[list[int]] = None
+               ) -> list[tuple[int, str, float]]:
+        """Return the (rID, wasteType, length) of the routes <rids>, or of
+        every route if <rids> is None.
+        """
+        return self.reference.route_rows(rids)
+
+    def trucks_by_capacity(self) -> list[tuple[int, str, str]]:
+        """Return the (tID, truckType, wasteType) of every truck and waste type
+        it can carry, ordered by capacity descending and then tID.
+        """
+        return self.reference.truck_rows()
+
+    def fleet_trucks(self, tids: Optional[list[int]]
+                     ) -> list[tuple[int, str, str]]:
+        """Return the (tID, truckType, wasteType) of the trucks <tids>, or of
+        every truck if <tids> is None, ordered by tID.
+        """
+        trucks = (self.reference.trucks_by_tid.values() if tids is None
+                  else {tid: self.reference.trucks_by_tid[tid] for tid in tids
+                        if tid in self.reference.trucks_by_tid}.values())
+        return [(truck.tid, truck.truck_type, waste_t)
+                for truck in sorted(trucks, key=lambda truck: truck.tid)
+                for waste_t in sorted(truck.waste_types)]
+
+    def drivers(self) -> list[tuple[int, dt.date, set[str]]]:
+        """Return the (eID, hireDate, truck types the driver can drive) of
+        every driver, ordered by hireDate and then eID.
+        """
+        return self.reference.drivers
+
+    def facilities(self) -> dict[str, int]:
+        """Return a mapping from each waste type to the lowest fID of a
+        facility that accepts it.
+        """
+        return self.reference.first_facility
+
+    def technicians(self, truck_types: list[str]
+                    ) -> list[tuple[int, str, dt.date]]:
+        """Return the (eID, truckType, hireDate) of the technicians qualified
+        to work on each of <truck_types>, ordered by eID.
+        """
+        return self.reference.technician_rows(truck_types)
+
+    def days_maintenance(self, days: list[dt.date]
+                         ) -> list[tuple[int, dt.date]]:
+        """Return the (tID, mDATE) of the maintenance on <days>."""
+        raise NotImplementedError
+
+    def days_trips(self, days: list[dt.date]) -> list[tuple]:
+        """Return the (rID, tID, tTIME, route length, eID1, eID2) of the trips
+        on <days>, given in ascending order.
+        """
+        raise NotImplementedError
+
+    def due_trucks(self, since: dt.date, until: dt.date
+                   ) -> list[tuple[int, str]]:
+        """Return the (tID, truckType) of the trucks with no maintenance from
+        <since> until <until>, inclusive, ordered by tID.
+        """
+        raise NotImplementedError
+
+    def technician_days(self, day: dt.date, truck_types: list[str]
+                        ) -> list[tuple[int, dt.date]]:
+        """Return the (eID, mDATE) of the maintenance after <day> by the
+        technicians qualified to work on any of <truck_types>.
+        """
+        raise NotImplementedError
+
+    def truck_days(self, day: dt.date, until: dt.date, tids: list[int]
+                   ) -> list[tuple[int, dt.date]]:
+        """Return the (tID, day) of the days after <day> and before <until> on
+        which the trucks <tids> have a maintenance or a trip.
+        """
+        raise NotImplementedError
+
+    def closed_trips(self, fids: list[int], first_day: dt.date,
+                     end_day: dt.date) -> list[tuple]:
+        """Return the (rID, tTIME, fID, wasteType, capacity) of the trips to
+        the facilities <fids> from <first_day> up to (not including)
+        <end_day>, ordered by capacity descending, then tTIME and rID.
+        """
+        raise NotImplementedError
+
+    def open_facilities(self, fids: list[int]) -> list[tuple[int, str]]:
+        """Return the (fID, wasteType) of the facilities not in <fids>,
+        ordered by fID.
+        """
+        raise NotImplementedError
+
+    def facility_load(self, fids: list[int], first_day: dt.date,
+                      end_day: dt.date) -> list[tuple[int, dt.date, float]]:
+        """Return the (fID, day, load) of every facility not in <fids> with
+        trips from <first_day> up to (not including) <end_day>, where its
+        load on a day is the total capacity of the trucks sent to it then.
+        """
+        raise NotImplementedError
+
+
+class _DatabaseLoader(_PlannerLoader):
+    """A _PlannerLoader that runs the queries with a cursor, and also reads
+    the reference tables with it if there is no reference data snapshot.
+
+    === Private Attributes ===
+    _cur: the cursor the queries run on.
+    _lock: whether closed_trips locks the trips it returns until the end of
+        the transaction.
+    """
+    _cur: pg_ext.cursor
+    _lock: bool
+
+    def __init__(self, cur: pg_ext.cursor,
+                 reference: Optional[_ReferenceData],
+                 lock: bool = False) -> None:
+        """Initialize a loader that runs its queries with <cur>."""
+        super().__init__(reference)
+        self._cur = cur
+        self._lock = lock
+
+    def _rows(self, query: str, params=None) -> list[tuple]:
+        """Run <query> with <params> and return its rows."""
+        self._cur.execute(query, params)
+        return self._cur.fetchall()
+
+    def routes(self, rids: Optional[list[int]] = None
+               ) -> list[tuple[int, str, float]]:
+        if self.reference is not None:
+            return super().routes(rids)
+        if rids is None:
+            return self._rows(_ROUTES_SQL)
+        return self._rows(_REQUESTED_ROUTES_SQL, (rids,))
+
+    def trucks_by_capacity(self) -> list[tuple[int, str, str]]:
+        if self.reference is not None:
+            return super().trucks_by_capacity()
+        return self._rows(_TRUCKS_BY_CAPACITY_SQL)
+
+    def fleet_trucks(self, tids: Optional[list[int]]
+                     ) -> list[tuple[int, str, str]]:
+        if self.reference is not None:
+            return super().fleet_trucks(tids)
+        return self._rows(_FLEET_TRUCKS_SQL, {'tids': tids})
+
+    def drivers(self) -> list[tuple[int, dt.date, set[str]]]:
+        if self.reference is not None:
+            return super().drivers()
+        return _group_drivers(self._rows(_DRIVERS_SQL))
+
+    def facilities(self) -> dict[str, int]:
+        if self.reference is not None:
+            return super().facilities()
+        return dict(self._rows(_FACILITIES_SQL))
+
+    def technicians(self, truck_types: list[str]
+                    ) -> list[tuple[int, str, dt.date]]:
+        if self.reference is not None:
+            return super().technicians(truck_types)
+        return self._rows(_TECHNICIANS_SQL, {'truck_types': truck_types})
+
+    def days_maintenance(self, days: list[dt.date]
+                         ) -> list[tuple[int, dt.date]]:
+        return self._rows(_DAYS_MAINTENANCE_SQL, (days,))
+
+    def days_trips(self, days: list[dt.date]) -> list[tuple]:
+        if len(days) == 1:
+            #one day needs no join with the days
+            return self._rows(_DAY_TRIPS_SQL, {
+                'day': days[0], 'next_day': days[0] + dt.timedelta(days=1)})
+        return self._rows(_DAYS_TRIPS_SQL,
+                          (days, days[0], days[-1] + dt.timedelta(days=1)))
+
+    def due_trucks(self, since: dt.date, until: dt.date
+                   ) -> list[tuple[int, str]]:
+        return self._rows(_DUE_TRUCKS_SQL, {'since': since, 'until': until})
+
+    def technician_days(self, day: dt.date, truck_types: list[str]
+                        ) -> list[tuple[int, dt.date]]:
+        return self._rows(_TECHNICIAN_DAYS_SQL,
+                          {'day': day, 'truck_types': truck_types})
+
+    def truck_days(self, day: dt.date, until: dt.date, tids: list[int]
+                   ) -> list[tuple[int, dt.date]]:
+        return self._rows(_TRUCK_DAYS_SQL, {
+            'day': day, 'next_day': day + dt.timedelta(days=1),
+            'until': until, 'tids': tids})
+
+    def closed_trips(self, fids: list[int], first_day: dt.date,
+                     end_day: dt.date) -> list[tuple]:
+        return self._rows(
+            _LOCK_CLOSED_TRIPS_SQL if self._lock else _CLOSED_TRIPS_SQL,
+            {'fids': fids, 'first_day': first_day, 'end_day': end_day})
+
+    def open_facilities(self, fids: list[int]) -> list[tuple[int, str]]:
+        return self._rows(_OPEN_FACILITIES_SQL, {'fids': fids})
+
+    def facility_load(self, fids: list[int], first_day: dt.date,
+                      end_day: dt.date) -> list[tuple[int, dt.date, float]]:
+        return self._rows(_FACILITY_LOAD_SQL, {
+            'fids': fids, 'first_day': first_day, 'end_day': end_day})
+
+
+class _WorkmateGraph:
+    """The employees who have been on trips together, kept as a disjoint-set
+    forest in which each tree is one workmate sphere (plus its members).
+
+    === Private Attributes ===
+    _parent: maps each employee who has been on a trip to their parent in the
+        forest; the root of a tree is its own parent.
+    _members: maps the root of each tree to the employees in it, in no
+        particular order.
+    """
+    _parent: dict[int, int]
+    _members: dict[int, list[int]]
+
+    def __init__(self, pairs: Iterable[tuple[int, int]] = ()) -> None:
+        """Initialize the forest with the (eID1, eID2) <pairs> of employees
+        who have been on a trip together.
+        """
+        self._parent, self._members = {}, {}
+        for eid1, eid2 in pairs:
+            self.add(eid1, eid2)
+
+    def __len__(self) -> int:
+        """Return the number of employees in the forest."""
+        return len(self._parent)
+
+    def add(self, eid1: int, eid2: int) -> list[tuple[int, int]]:
+        """Record that <eid1> and <eid2> have been on a trip together.
+
+        Return the (eID, root) of every employee who is new to the forest or
+        whose root changed.
+        """
+        moved = [(eid, eid) for eid in dict.fromkeys((eid1, eid2))
+                 if eid not in self._parent]
+        for eid, _ in moved:
+            self._parent[eid] = eid
+            self._members[eid] = [eid]
+
+        root1, root2 = self._find(eid1), self._find(eid2)
+        if root1 == root2:
+            return moved
+        #hang the smaller tree under the larger one
+        if len(self._members[root1]) < len(self._members[root2]):
+            root1, root2 = root2, root1
+        self._parent[root2] = root1
+        merged = self._members.pop(root2)
+        self._members[root1].extend(merged)
+        return ([(eid, root) for eid, root in moved if eid not in merged]
+                + [(eid, root1) for eid in merged])
+
+    def root(self, eid: int) -> Optional[int]:
+        """Return the root of the tree of <eid>, None if <eid> has never been
+        on a trip.
+        """
+        return self._find(eid) if eid in self._parent else None
+
+    def sphere(self, eid: int) -> list[int]:
+        """Return the workmate sphere of <eid>: everyone in its tree but
+        <eid>, in ascending order.
+        """
+        if eid not in self._parent:
+            return []
+        return sorted(other for other in self._members[self._find(eid)]
+                      if other != eid)
+
+    def components(self) -> list[list[int]]:
+        """Return the employees of every tree, each in ascending order, in
+        ascending order of their smallest eID.
+        """
+        return sorted(sorted(members) for members in self._members.values())
+
+    def roots(self) -> Iterator[tuple[int, int]]:
+        """Yield the (eID, root) of every employee in the forest."""
+        for eid in self._parent:
+            yield eid, self._find(eid)
+
+    def _find(self, eid: int) -> int:
+        """Return the root of the tree of <eid>, which must be in the forest.
+        """
+        #path halving: point every other node on the way at its grandparent
+        parent = self._parent
+        while parent[eid] != eid:
+            parent[eid] = parent[parent[eid]]
+            eid = parent[eid]
+        return eid
+
+
+class _Calendar:
+    """The days on which each of a set of resources, such as trucks or
+    technicians, is taken, as one bitset per resource: bit i of a resource's
+    bitset is set iff the resource is taken on day <start> + i. Days before
+    <start> are outside the calendar and always free.
+
+    === Instance Attributes ===
+    start: the first day of the calendar.
+
+    === Private Attributes ===
+    _taken: maps each resource to its bitset; resources not in it are free
+        every day.
+    """
+    start: dt.date
+    _taken: dict[int, int]
+
+    def __init__(self, start: dt.date,
+                 days: Iterable[tuple[int, dt.date]] = ()) -> None:
+        """Initialize the calendar from <start> with the (resource, day)
+        pairs of <days>, in any order.
+        """
+        self.start = start
+        self._taken = {}
+        for resource, day in days:
+            self.mark(resource, day)
+
+    def mark(self, resource: int, day: dt.date) -> None:
+        """Record that <resource> is taken on <day>."""
+        offset = (day - self.start).days
+        if offset >= 0:
+            self._taken[resource] = self._taken.get(resource, 0) | 1 << offset
+
+    def mark_until(self, resource: int, day: dt.date) -> None:
+        """Record that <resource> is taken on every day up to <day>,
+        inclusive.
+        """
+        offset = (day - self.start).days
+        if offset >= 0:
+            self._taken[resource] = (self._taken.get(resource, 0)
+                                     | (1 << offset + 1) - 1)
+
+    def taken(self, resource: int) -> int:
+        """Return the bitset of the days on which <resource> is taken."""
+        return self._taken.get(resource, 0)
+
+    def is_free(self, resource: int, day: dt.date) -> bool:
+        """Return whether <resource> is free on <day>."""
+        offset = (day - self.start).days
+        return offset < 0 or not self._taken.get(resource, 0) >> offset & 1
+
+    def is_free_between(self, resource: int, first_day: dt.date,
+                        last_day: dt.date) -> bool:
+        """Return whether <resource> is free on every day from <first_day> to
+        <last_day>, inclusive.
+        """
+        first = max((first_day - self.start).days, 0)
+        last = (last_day - self.start).days
+        if last < first:
+            return True
+        days = (1 << last - first + 1) - 1
+        return not self._taken.get(resource, 0) >> first & days
+
+    def first_free(self, taken: int, day: dt.date) -> dt.date:
+        """Return the first day from <day> on whose bit is clear in the
+        bitset <taken>, such as a resource's, or several of them combined
+        with | (taken by any) or & (taken by all).
+        """
+        offset = (day - self.start).days
+        if offset < 0:
+            return day
+        rest = taken >> offset
+        #rest + 1 carries through the trailing set bits into the first clear
+        #one, which is then the only bit it shares with ~rest
+        first_clear = ((rest + 1) & ~rest).bit_length() - 1
+        return day + dt.timedelta(days=first_clear)
+
+
+class _IntervalIndex:
+    """The busy intervals of a set of resources, such as trucks or employees,
+    kept sorted by start time per resource so that a conflict can be found
+    with a binary search.
+
+    === Private Attributes ===
+    _starts: maps each resource to the starts of its intervals, in order.
+    _ends: maps each resource to the ends of its intervals, in the same order
+        as <_starts>.
+    _reach: maps each resource to the running maximum of <_ends>, i.e.
+        _reach[r][i] is the latest end among the first i + 1 intervals of r.
+    """
+    _starts: dict[int, list[dt.datetime]]
+    _ends: dict[int, list[dt.datetime]]
+    _reach: dict[int, list[dt.datetime]]
+
+    def __init__(self, intervals: Iterable[tuple[int, dt.datetime,
+                                                 dt.datetime]] = ()) -> None:
+        """Initialize the index with <intervals>, given as
+        (resource, start, end) triples in any order.
+        """
+        grouped = {}
+        for resource, start, end in intervals:
+            grouped.setdefault(resource, []).append((start, end))
+
+        self._starts, self._ends, self._reach = {}, {}, {}
+        for resource, spans in grouped.items():
+            spans.sort()
+            self._starts[resource] = [start for start, _ in spans]
+            self._ends[resource] = [end for _, end in spans]
+            self._reach[resource] = list(accumulate(self._ends[resource],
+                                                    max))
+
+    def add(self, resource: int, start: dt.datetime,
+            end: dt.datetime) -> None:
+        """Record that <resource> is busy from <start> until <end>."""
+        starts = self._starts.setdefault(resource, [])
+        ends = self._ends.setdefault(resource, [])
+        reach = self._reach.setdefault(resource, [])
+
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        reach.insert(i, end)
+        latest = reach[i - 1] if i > 0 else end
+        for j in range(i, len(reach)):
+            latest = max(latest, ends[j])
+            reach[j] = latest
+
+    def is_free(self, resource: int, start: dt.datetime,
+                end: dt.datetime) -> bool:
+        """Return True iff none of the intervals of <resource> overlaps the
+        interval from <start> to <end>, both inclusive.
+        """
+        starts = self._starts.get(resource)
+        if not starts:
+            return True
+        # every interval that starts by <end> is one of the first i, and the
+        # latest of their ends tells whether any of them reaches <start>
+        i = bisect_right(starts, end)
+        return i == 0 or self._reach[resource][i - 1] < start
+
+
+class _TripResources:
+    """The trucks, drivers, facilities and existing trips that single trip
+    requests are assigned from, held in memory.
+
+    === Instance Attributes ===
+    routes: maps each known rID to its (wasteType, length).
+    trucks: maps each waste type to the (tID, truckType) of the trucks that can
+        carry it, ordered by capacity descending and then tID.
+    drivers: (eID, hireDate, truck types the driver can drive) of every
+        driver, ordered by hireDate and then eID.
+    facilities: maps each waste type to the lowest fID that accepts it.
+    maintenance: the days on which each truck is maintained.
+    scheduled: (rID, day) of every known trip.
+    busy_trucks: the intervals during which each truck is on a trip.
+    busy_employees: the intervals during which each employee is on a trip.
+    """
+    routes: dict[int, tuple[str, float]]
+    trucks: dict[str, list[tuple[int, str]]]
+    drivers: list[tuple[int, dt.date, set[str]]]
+    facilities: dict[str, int]
+    maintenance: _Calendar
+    scheduled: set[tuple[int, dt.date]]
+    busy_trucks: _IntervalIndex
+    busy_employees: _IntervalIndex
+
+    def __init__(self, routes: list[tuple], trucks: list[tuple],
+                 drivers: list[tuple[int, dt.date, set[str]]],
+                 facilities: dict[str, int], maintenance: list[tuple],
+                 trips: list[tuple]) -> None:
+        """Initialize from the rows read by
+        WasteWrangler._load_trip_resources, where <trips> holds the
+        (rID, tID, tTIME, route length, eID1, eID2) of the known trips.
+        """
+        self.routes = {rid: (waste_t, length)
+                       for rid, waste_t, length in routes}
+
+        self.trucks = {}
+        for tid, truck_t, waste_t in trucks:
+            self.trucks.setdefault(waste_t, []).append((tid, truck_t))
+
+        self.drivers = drivers
+        self.facilities = facilities
+        self.maintenance = _Calendar(
+            min((day for _, day in maintenance), default=dt.date.min),
+            maintenance)
+
+        self.scheduled = {(rid, t_time.date())
+                          for rid, _, t_time, _, _, _ in trips}
+        spans = [(tid, eid1, eid2, t_time, t_time + _trip_duration(length))
+                 for _, tid, t_time, length, eid1, eid2 in trips]
+        self.busy_trucks = _IntervalIndex(
+            (tid, start, end) for tid, _, _, start, end in spans)
+        self.busy_employees = _IntervalIndex(
+            (eid, start, end) for _, eid1, eid2, start, end in spans
+            for eid in (eid1, eid2))
+
+    def assign(self, rid: int, time: dt.datetime) -> Optional[tuple]:
+        """Pick a truck, two drivers and a facility for a trip on route <rid>
+        starting at <time>, using the same rules as
+        WasteWrangler.schedule_trip, and record the trip as scheduled.
+
+        Return the new Trip row, or None if the trip can't be scheduled.
+        """
+        if rid not in self.routes:
+            return None
+        waste_t, length = self.routes[rid]
+
+        #------ the trip has to happen within working hours
+        end_time = time + _trip_duration(length)
+        if time.time() < dt.time(hour=8) or end_time.time() > dt.time(hour=16):
+            return None
+
+        #------ the route can only be scheduled once a day
+        day = time.date()
+        if (rid, day) in self.scheduled:
+            return None
+
+        #------ trucks and drivers on a trip within 30 minutes are not free
+        min_time = time - dt.timedelta(minutes=30)
+        max_time = end_time + dt.timedelta(minutes=30)
+        free_drivers = [
+            (eid, truck_types)
+            for eid, hire_date, truck_types in self.drivers
+            if hire_date <= day
+            and self.busy_employees.is_free(eid, min_time, max_time)]
+
+        #------ the best free truck that one of the free drivers can drive
+        pair = None
+        for tid, truck_t in self.trucks.get(waste_t, []):
+            if (not self.maintenance.is_free(tid, day)
+                    or not self.busy_trucks.is_free(tid, min_time, max_time)):
+                continue
+            first = next((eid for eid, truck_types in free_drivers
+                          if truck_t in truck_types), None)
+            if first is not None:
+                pair = (tid, first)
+                break
+        if pair is None:
+            return None
+        tid, first_eid = pair
+
+        second_eid = next((eid for eid, _ in free_drivers
+                           if eid != first_eid), None)
+        if second_eid is None or waste_t not in self.facilities:
+            return None
+
+        self.scheduled.add((rid, day))
+        self.busy_trucks.add(tid, time, end_time)
+        self.busy_employees.add(first_eid, time, end_time)
+        self.busy_employees.add(second_eid, time, end_time)
+        return (rid, tid, time, None, max(first_eid, second_eid),
+                min(first_eid, second_eid), self.facilities[waste_t])
+
+
+class _MaintenancePlan:
+    """The trucks due for maintenance after a day, and the days on which they
+    and the technicians who can maintain them are taken, used to plan all the
+    maintenance in memory.
+
+    === Instance Attributes ===
+    date: the day maintenance is being planned after.
+    trucks: (tID, truckType) of every truck due for maintenance, in ascending
+        order of tID.
+    technicians: maps each truck type to the eIDs of the technicians
+        qualified for it, in ascending order.
+    taken_technicians: the days from the day after <date> on which each
+        technician maintains a truck or is not hired yet.
+    taken_trucks: the days from the day after <date> on which each truck is
+        on a trip or maintained.
+    """
+    date: dt.date
+    trucks: list[tuple[int, str]]
+    technicians: dict[str, list[int]]
+    taken_technicians: _Calendar
+    taken_trucks: _Calendar
+
+    def __init__(self, date: dt.date, trucks: list[tuple],
+                 technicians: list[tuple], technician_days: list[tuple],
+                 truck_days: list[tuple]) -> None:
+        """Initialize the plan from the rows read by
+        WasteWrangler._load_maintenance_plan.
+        """
+        self.date = date
+        self.trucks = trucks
+        first_day = date + dt.timedelta(days=1)
+        self.taken_technicians = _Calendar(first_day, technician_days)
+        self.taken_trucks = _Calendar(first_day, truck_days)
+
+        self.technicians = {}
+        for eid, truck_t, hire_date in technicians:
+            self.technicians.setdefault(truck_t, []).append(eid)
+            #a technician can only work from the day after they are hired
+            self.taken_technicians.mark_until(eid, hire_date)
+
+    def plan_truck(self, tid: int, truck_type: str
+                   ) -> Optional[tuple[int, int, dt.date]]:
+        """Choose the first day after <date> on which the truck <tid>, of
+        type <truck_type>, is free and a qualified technician hired before
+        that day is free too, taking the one with the lowest eID, and mark
+        the day as taken for both.
+
+        Return the new Maintenance row, or None if no technician can work on
+        <truck_type>.
+        """
+        technicians = self.technicians.get(truck_type)
+        if not technicians:
+            return None
+
+        #a day is out if the truck is taken, or every technician is
+        all_taken = self.taken_technicians.taken(technicians[0])
+        for eid in technicians[1:]:
+            all_taken &= self.taken_technicians.taken(eid)
+        day = self.taken_trucks.first_free(
+            self.taken_trucks.taken(tid) | all_taken,
+            self.date + dt.timedelta(days=1))
+
+        eid = next(eid for eid in technicians
+                   if self.taken_technicians.is_free(eid, day))
+        self.taken_technicians.mark(eid, day)
+        self.taken_trucks.mark(tid, day)
+        return tid, eid, day
+
+    def plan_all(self) -> list[tuple[int, int, dt.date]]:
+        """Plan maintenance for every due truck, in ascending order of tID.
+
+        Return the new Maintenance rows.
+        """
+        new_maintenance = []
+        for tid, truck_type in self.trucks:
+            row = self.plan_truck(tid, truck_type)
+            if row is not None:
+                new_maintenance.append(row)
+        return new_maintenance
+
+
+class _DayPlan:
+    """The routes, drivers and trucks that are still free on one day, used to
+    plan whole days of trips for a truck in memory.
+
+    === Instance Attributes ===
+    date: the day being planned.
+    routes: maps each rID to its (wasteType, length).
+    unscheduled: rIDs of the routes with no trip on <date>.
+    drivers: (eID, hireDate, truck types the driver can drive) of every
+        driver, ordered by hireDate and then eID.
+    busy: eIDs of the drivers who are on a trip on <date>.
+    facilities: maps each waste type to the lowest fID that accepts it.
+    truck_trips: maps each truck with trips on <date> to their
+        (start, end) times, ordered by start.
+    maintenance: the days on which each truck is maintained, as for
+        _TripResources and _MaintenancePlan.
+    """
+    date: dt.date
+    routes: dict[int, tuple[str, float]]
+    unscheduled: set[int]
+    drivers: list[tuple[int, dt.date, set[str]]]
+    busy: set[int]
+    facilities: dict[str, int]
+    truck_trips: dict[int, list[tuple[dt.datetime, dt.datetime]]]
+    maintenance: _Calendar
+
+    def __init__(self, date: dt.date, routes: list[tuple],
+                 drivers: list[tuple[int, dt.date, set[str]]],
+                 facilities: dict[str, int], trips: list[tuple],
+                 maintenance: list[tuple]) -> None:
+        """Initialize the plan for <date> from the rows read by
+        WasteWrangler._load_day_plan, where <trips> holds the
+        (rID, tID, tTIME, length, eID1, eID2) of the trips already scheduled
+        on <date> and <maintenance> the (tID, mDATE) of its maintenance.
+        """
+        self.date = date
+        self.routes = {rid: (waste_t, length)
+                       for rid, waste_t, length in routes}
+        self.unscheduled = set(self.routes)
+        self.drivers = drivers
+        self.busy = set()
+        self.facilities = facilities
+        self.truck_trips = {}
+        for rid, tid, t_time, length, eid1, eid2 in sorted(
+                trips, key=lambda trip: trip[2]):
+            self.unscheduled.discard(rid)
+            self.busy.update((eid1, eid2))
+            self.truck_trips.setdefault(tid, []).append(
+                (t_time, t_time + _trip_duration(length)))
+        self.maintenance = _Calendar(date, maintenance)
+
+    def plan_truck(self, tid: int, truck_type: str,
+                   waste_types: set[str]) -> list[tuple]:
+        """Plan the trips of truck <tid>, which has type <truck_type> and can
+        carry <waste_types>, following the rules of
+        WasteWrangler.schedule_trips, and mark the routes and drivers it
+        uses as taken.
+
+        Return the new Trip rows in the order they happen.
+        """
+        rids = sorted(rid for rid in self.unscheduled
+                      if self.routes[rid][0] in waste_types)
+        if not rids or not self.maintenance.is_free(tid, self.date):
             return []
 
-        for pair in driver_pairs:
-            if eid not in pair: #exclude the pair if familiar eid not present
+        #------ the most experienced pair of drivers free all day, where at
+        #------ least the first one can drive the truck
+        free = [(eid, truck_types) for eid, hire_date, truck_types
+                in self.drivers
+                if hire_date <= self.date and eid not in self.busy]
+        first = next((eid for eid, truck_types in free
+                      if truck_type in truck_types), None)
+        second = next((eid for eid, _ in free if eid != first), None)
+        if first is None or second is None:
+            return []
+        eid1, eid2 = max(first, second), min(first, second)
+
+        #------ lay the trips out from 8:00, 30 minutes apart, until 16:00,
+        #------ in the gaps between the truck's trips already on the day
+        current = dt.datetime.combine(self.date, dt.time(hour=8))
+        last_time = dt.datetime.combine(self.date, dt.time(hour=16))
+        gap = dt.timedelta(minutes=30)
+        booked = self.truck_trips.get(tid, [])
+        new_trips = []
+        for rid in rids:
+            waste_t, length = self.routes[rid]
+            if waste_t not in self.facilities:
                 continue
-            else:
-                if eid in pair:
-                    #identify which element of the pair is 1st and 2nd, switch if needed 
-                    if pair[1] == eid:
-                        other_eid = pair[0]
-                    else: 
-                        other_eid = pair[1]
-
-                    if other_eid not in final_list: #check final_list before adding an eid to avoid repition and repititive recurive calls for same eid
-                        final_list.append(other_eid)
-                        self.partner(self,other_eid,driver_pairs,final_list) #make recursive call on 2nd element of pair that was decided earlier
-
-def setup(dbname: str, username: str, password: str, file_path: str) -> None:
+            duration = _trip_duration(length)
+            start = current
+            for booked_start, booked_end in booked:
+                if (start < booked_end + gap
+                        and start + duration + gap > booked_start):
+                    start = max(start, booked_end + gap)
+            if start + duration > last_time:
+                continue
+            new_trips.append((rid, tid, start, None, eid1, eid2,
+                              self.facilities[waste_t]))
+            self.unscheduled.discard(rid)
+            current = start + duration + gap
+
+        if new_trips:
+            self.busy.update((eid1, eid2))
+        return new_trips
+
+    def plan_fleet(self, trucks: list[tuple]
+                   ) -> tuple[dict[int, int], list[tuple]]:
+        """Plan the trips of every truck in <trucks>, given as the
+        (tID, truckType, wasteType) rows of _FLEET_TRUCKS_SQL, in ascending
+        order of tIDs.
+
+        Return the number of trips planned for each truck, and the new Trip
+        rows of all trucks.
+        """
+        by_tid = {}
+        for tid, truck_t, waste_t in trucks:
+            by_tid.setdefault(tid, (truck_t, set()))[1].add(waste_t)
+
+        counts = {}
+        new_trips = []
+        for tid in sorted(by_tid):
+            truck_t, waste_types = by_tid[tid]
+            truck_trips = self.plan_truck(tid, truck_t, waste_types)
+            counts[tid] = len(truck_trips)
+            new_trips.extend(truck_trips)
+        return counts, new_trips
+
+
+def _read_data_file(data_file: TextIO, chunk_size: int
+                    ) -> Iterator[tuple[Optional[str], object]]:
+    """Yield the statements of the SQL file <data_file>, read one statement
+    at a time: each INSERT INTO <table> VALUES ... of literals as
+    (<table>, rows) pairs of up to <chunk_size> rows, where the values of
+    each row are str, or None for NULL, and any other statement as
+    (None, its text). Blank lines and -- comments between statements are
+    skipped, and -- comments within them are dropped.
+
+    Pre-condition: statements end with a ';' at the end of a line, or before
+    a -- comment that ends it.
+    """
+    lines = []
+    quoted = False
+    for line in data_file:
+        if not lines and (not line.strip()
+                          or line.lstrip().startswith('--')):
+            continue
+        if '--' in line:
+            line, quoted = _strip_comment(line, quoted)
+        elif line.count("'") % 2:
+            quoted = not quoted
+        lines.append(line)
+        #a ';' outside of a string ends the statement
+        if not quoted and line.rstrip().endswith(';'):
+            yield from _parse_statement(''.join(lines), chunk_size)
+            lines = []
+    if lines:
+        yield from _parse_statement(''.join(lines), chunk_size)
+
+
+def _strip_comment(line: str, quoted: bool) -> tuple[str, bool]:
+    """Helper for _read_data_file. Return <line>, which starts within a
+    string literal iff <quoted>, without its -- comment, if it has one
+    outside of the string literals, and whether it ends within a string
+    literal. A quote doubled within a string literal closes and reopens it.
+    """
+    position = 0
+    while True:
+        if quoted:
+            end = line.find("'", position)
+            if end < 0:
+                return line, True
+            position = end + 1
+            quoted = False
+            continue
+        found = _QUOTE_OR_COMMENT_RE.search(line, position)
+        if found is None:
+            return line, False
+        if found.group() == '--':
+            return line[:found.start()].rstrip() + '\n', False
+        position = found.end()
+        quoted = True
+
+
+def _parse_statement(text: str, chunk_size: int
+                     ) -> Iterator[tuple[Optional[str], object]]:
+    """Helper for _read_data_file. Yield the statement <text> as described
+    there.
+    """
+    insert = _INSERT_VALUES_RE.match(text)
+    if insert is None:
+        yield None, text
+        return
+
+    #------ the first row, one literal at a time, gives the number of columns
+    row = []
+    position = insert.end()
+    while True:
+        literal = _LITERAL_RE.match(text, position)
+        if literal is None:
+            #e.g. an expression: leave it to the server
+            yield None, text
+            return
+        row.append(literal.group(1))
+        position = literal.end()
+        if literal.group(2) == ')':
+            break
+
+    #------ then each following row in a single match
+    rows = [row]
+    row_re = _row_re(len(row))
+    while True:
+        next_row = row_re.match(text, position)
+        if next_row is None:
+            break
+        rows.append(next_row.groups())
+        position = next_row.end()
+    if _END_OF_STATEMENT_RE.match(text, position) is None:
+        yield None, text
+        return
+
+    for start in range(0, len(rows), chunk_size):
+        yield insert.group(1), [
+            tuple(None if value.upper() == 'NULL'
+                  else value[1:-1].replace("''", "'")
+                  if value.startswith("'") else value
+                  for value in row)
+            for row in rows[start:start + chunk_size]]
+
+
+@lru_cache
+def _row_re(columns: int) -> re.Pattern:
+    """Return a pattern matching the ', (' before a row of <columns>
+    literals, and the row, with a group for each literal.
+    """
+    return re.compile(_NEXT_ROW_RE.pattern + r"\s*"
+                      + r"\s*,\s*".join([_LITERAL] * columns) + r"\s*\)",
+                      re.IGNORECASE)
+
+
+def _load_data_file(cursor: pg_ext.cursor, data_file: TextIO,
+                    chunk_size: int) -> None:
+    """Run the statements of the SQL file <data_file> using <cursor>, sending
+    the rows of its INSERT INTO <table> VALUES statements with COPY, up to
+    <chunk_size> rows at a time.
+
+    The foreign keys of the schema waste_wrangler are dropped meanwhile and
+    added back at the end, so each is checked once against all the rows
+    rather than once per row.
+    """
+    foreign_keys = _foreign_keys(cursor, 'waste_wrangler')
+    _drop_foreign_keys(cursor, 'waste_wrangler', foreign_keys)
+    for table, statement in _read_data_file(data_file, chunk_size):
+        if table is None:
+            cursor.execute(statement)
+            continue
+        rows = io.StringIO(''.join(
+            '\t'.join(r'\N' if value is None else _copy_escape(value)
+                      for value in row) + '\n'
+            for row in statement))
+        # <table> is a plain name, as _INSERT_VALUES_RE matched it
+        cursor.copy_expert(f"COPY {table} FROM STDIN", rows)
+    _add_foreign_keys(cursor, 'waste_wrangler', foreign_keys)
+
+
+@contextmanager
+def _search_path(cursor: pg_ext.cursor, schema: str) -> Iterator[None]:
+    """Put <schema> alone on the search path of the transaction of <cursor>
+    for the body of the with statement, then restore the search path. If
+    the body raises, the search path is left to the rollback.
+    """
+    cursor.execute("SHOW search_path")
+    search_path = cursor.fetchone()[0]
+    cursor.execute("SELECT set_config('search_path', %s, true)", (schema,))
+    yield
+    cursor.execute("SELECT set_config('search_path', %s, true)",
+                   (search_path,))
+
+
+def _foreign_keys(cursor: pg_ext.cursor, schema: str
+                  ) -> list[tuple[str, str, str]]:
+    """Return the (table, name, definition) of each foreign key of the
+    tables of <schema>, where the definition names the tables it references
+    without their schema.
+    """
+    # pg_get_constraintdef qualifies the tables not on the search path
+    with _search_path(cursor, schema):
+        cursor.execute(_SCHEMA_FOREIGN_KEYS_SQL, (schema,))
+        return cursor.fetchall()
+
+
+def _drop_foreign_keys(cursor: pg_ext.cursor, schema: str,
+                       foreign_keys: list[tuple[str, str, str]]) -> None:
+    """Drop the <foreign_keys>, given as by _foreign_keys, of the tables of
+    <schema>.
+    """
+    with _search_path(cursor, schema):
+        for table, name, _ in foreign_keys:
+            cursor.execute(pg_sql.SQL(
+                "ALTER TABLE {} DROP CONSTRAINT {}").format(
+                pg_sql.Identifier(table), pg_sql.Identifier(name)))
+
+
+def _add_foreign_keys(cursor: pg_ext.cursor, schema: str,
+                      foreign_keys: list[tuple[str, str, str]]) -> None:
+    """Add the <foreign_keys>, given as by _foreign_keys, to the tables of
+    <schema>, each checked against all their rows at once.
+    """
+    with _search_path(cursor, schema):
+        for table, name, definition in foreign_keys:
+            cursor.execute(pg_sql.SQL(
+                "ALTER TABLE {} ADD CONSTRAINT {} ").format(
+                pg_sql.Identifier(table), pg_sql.Identifier(name))
+                + pg_sql.SQL(definition))
+
+
+def _partition_tables(cursor: pg_ext.cursor, months_ahead: int) -> None:
+    """Helper for setup and partition_tables. Using <cursor>, range-partition
+    each table of _PARTITION_KEYS in the schema waste_wrangler by month of
+    its key, unless it already is, as partition_tables describes.
+    """
+    cursor.execute(_ENSURE_PARTITIONS_FUNCTION_SQL)
+    cursor.execute(_PARTITIONED_TABLES_SQL)
+    partitioned = {row[0] for row in cursor.fetchall()}
+
+    for table, key in _PARTITION_KEYS.items():
+        if table in partitioned:
+            continue
+        name = pg_sql.Identifier(table)
+        old = pg_sql.Identifier(f"{table}_unpartitioned")
+
+        #------ what the partitioned table takes over from the plain one
+        # (with the foreign keys naming the tables they reference unqualified)
+        with _search_path(cursor, 'waste_wrangler'):
+            cursor.execute(_TABLE_CONSTRAINTS_SQL, (table,))
+            constraints = cursor.fetchall()
+            cursor.execute(_TABLE_INDEXES_SQL, (table,))
+            indexes = [row[0] for row in cursor.fetchall()]
+
+        #------ the partitioned table, under the plain one's name
+        cursor.execute(pg_sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+            name, old))
+        cursor.execute(pg_sql.SQL(
+            "CREATE TABLE {} "
+            "(LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE ({})").format(
+            name, old, pg_sql.Identifier(key)))
+        cursor.execute(pg_sql.SQL(_FIRST_PARTITIONS_SQL).format(
+            table=pg_sql.Literal(table), key=pg_sql.Identifier(key), old=old),
+            (months_ahead,))
+        cursor.execute(pg_sql.SQL("INSERT INTO {} SELECT * FROM {}").format(
+            name, old))
+        cursor.execute(pg_sql.SQL("DROP TABLE {}").format(old))
+
+        #------ the keys, and indexes, under their old names
+        with _search_path(cursor, 'waste_wrangler'):
+            for constraint, definition in constraints:
+                cursor.execute(pg_sql.SQL(
+                    "ALTER TABLE {} ADD CONSTRAINT {} ").format(
+                    name, pg_sql.Identifier(constraint))
+                    + pg_sql.SQL(definition))
+            for definition in indexes:
+                cursor.execute(definition)
+
+
+def _fingerprint(*paths: str) -> str:
+    """Return a string that changes whenever one of the files at <paths> is
+    changed, moved or replaced.
+    """
+    parts = []
+    for path in paths:
+        stat = os.stat(path)
+        parts.append(f"{os.path.abspath(path)}:{stat.st_size}:"
+                     f"{stat.st_mtime_ns}")
+    return ';'.join(parts)
+
+
+def setup(dbname: str, username: str, password: str, file_path: str,
+          chunk_size: int = 10000, partitioned: bool = False) -> None:
     """Set up the testing environment for the database <dbname> using the
     username <username> and password <password> by importing the schema file
     and the file containing the data at <file_path>.
+
+    The data file is read one statement at a time, and the rows of its
+    INSERT statements are sent with COPY, <chunk_size> rows at a time,
+    before the foreign keys are checked.
+
+    If <partitioned>, Trip and Maintenance are then partitioned by month, as
+    partition_tables does.
     """
     connection, cursor, schema_file, data_file = None, None, None, None
     try:
@@ -951,7 +3915,11 @@ def setup(dbname: str, username: str, password: str, file_path: str) -> None:
         cursor.execute(schema_file.read())
 
         data_file = open(file_path, "r")
-        cursor.execute(data_file.read())
+        _load_data_file(cursor, data_file, chunk_size)
+
+        if partitioned:
+            _partition_tables(cursor, 3)
+        cursor.execute(_INDEX_SQL)
 
         connection.commit()
     except Exception as ex:
@@ -968,6 +3936,154 @@ def setup(dbname: str, username: str, password: str, file_path: str) -> None:
             data_file.close()
 
 
+def setup_from_template(dbname: str, username: str, password: str,
+                        file_path: str, template_db: Optional[str] = None,
+                        maintenance_db: str = 'postgres') -> None:
+    """Set up the testing environment as setup does, but import the schema
+    file and the data file at <file_path> only when they have changed since
+    the last call, into a template, and clone the template every time.
+
+    If <template_db> is None, the template is the schema
+    waste_wrangler_template of <dbname>, and the schema waste_wrangler is
+    rebuilt from it with one CREATE TABLE ... LIKE and INSERT ... SELECT per
+    table, adding the foreign keys once the rows are in.
+
+    Otherwise the template is the database <template_db>, and <dbname> is
+    dropped and created again from it with CREATE DATABASE ... TEMPLATE,
+    which copies files rather than rows. This needs the CREATEDB privilege,
+    a connection to <maintenance_db> for the DDL, and no other connection to
+    <dbname> or <template_db>.
+    """
+    fingerprint = _fingerprint("./waste_wrangler_schema.sql", file_path)
+    if template_db is not None:
+        _clone_database(dbname, username, password, file_path, template_db,
+                        maintenance_db, fingerprint)
+    else:
+        _clone_schema(dbname, username, password, file_path, fingerprint)
+
+
+def _clone_schema(dbname: str, username: str, password: str, file_path: str,
+                  fingerprint: str) -> None:
+    """Helper for setup_from_template. Rebuild the schema waste_wrangler of
+    <dbname> from the schema _TEMPLATE_SCHEMA, first importing the schema
+    file and the data file at <file_path> into _TEMPLATE_SCHEMA unless its
+    comment already records <fingerprint>.
+    """
+    connection = pg.connect(dbname=dbname, user=username, password=password,
+                            options="-c search_path=waste_wrangler")
+    try:
+        cursor = connection.cursor()
+        with open("./waste_wrangler_schema.sql", "r") as schema_file:
+            schema = schema_file.read()
+        template = pg_sql.Identifier(_TEMPLATE_SCHEMA)
+
+        cursor.execute("SELECT obj_description(oid, 'pg_namespace') "
+                       "FROM pg_namespace WHERE nspname = %s",
+                       (_TEMPLATE_SCHEMA,))
+        row = cursor.fetchone()
+        if row is None or row[0] != fingerprint:
+            #------ import the files once, then keep them as the template
+            cursor.execute(schema)
+            with open(file_path, "r") as data_file:
+                _load_data_file(cursor, data_file, 10000)
+            cursor.execute(pg_sql.SQL(
+                "DROP SCHEMA IF EXISTS {} CASCADE").format(template))
+            cursor.execute(pg_sql.SQL(
+                "ALTER SCHEMA waste_wrangler RENAME TO {}").format(template))
+            cursor.execute(pg_sql.SQL(
+                "COMMENT ON SCHEMA {} IS %s").format(template), (fingerprint,))
+
+        #------ copies of the template's tables, filled before their foreign
+        # keys are added: one check per key rather than one per row
+        cursor.execute("DROP SCHEMA IF EXISTS waste_wrangler CASCADE; "
+                       "CREATE SCHEMA waste_wrangler")
+        cursor.execute(_SCHEMA_TABLES_SQL, (_TEMPLATE_SCHEMA,))
+        for (table,) in cursor.fetchall():
+            cursor.execute(pg_sql.SQL(
+                "CREATE TABLE waste_wrangler.{0} "
+                "(LIKE {1}.{0} INCLUDING ALL); "
+                "INSERT INTO waste_wrangler.{0} SELECT * FROM {1}.{0}"
+            ).format(pg_sql.Identifier(table), template))
+        _add_foreign_keys(cursor, 'waste_wrangler',
+                          _foreign_keys(cursor, _TEMPLATE_SCHEMA))
+        cursor.execute(_INDEX_SQL)
+        cursor.close()
+        connection.commit()
+    except Exception as ex:
+        connection.rollback()
+        raise Exception(f"Couldn't set up environment for tests: \n{ex}")
+    finally:
+        connection.close()
+
+
+def _clone_database(dbname: str, username: str, password: str,
+                    file_path: str, template_db: str, maintenance_db: str,
+                    fingerprint: str) -> None:
+    """Helper for setup_from_template. Create <dbname> again as a copy of
+    the database <template_db>, first creating <template_db> with setup
+    unless its comment already records <fingerprint>.
+    """
+    connection = pg.connect(dbname=maintenance_db, user=username,
+                            password=password)
+    # CREATE and DROP DATABASE can't run in a transaction
+    connection.autocommit = True
+    try:
+        cursor = connection.cursor()
+        template = pg_sql.Identifier(template_db)
+        cursor.execute("SELECT shobj_description(oid, 'pg_database') "
+                       "FROM pg_database WHERE datname = %s", (template_db,))
+        row = cursor.fetchone()
+        if row is None or row[0] != fingerprint:
+            cursor.execute(pg_sql.SQL(
+                "DROP DATABASE IF EXISTS {}").format(template))
+            cursor.execute(pg_sql.SQL("CREATE DATABASE {}").format(template))
+            setup(template_db, username, password, file_path)
+            cursor.execute(pg_sql.SQL(
+                "COMMENT ON DATABASE {} IS %s").format(template),
+                (fingerprint,))
+
+        cursor.execute(pg_sql.SQL("DROP DATABASE IF EXISTS {}").format(
+            pg_sql.Identifier(dbname)))
+        cursor.execute(pg_sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+            pg_sql.Identifier(dbname), template))
+        cursor.close()
+    except Exception as ex:
+        raise Exception(f"Couldn't set up environment for tests: \n{ex}")
+    finally:
+        connection.close()
+
+
+def partition_tables(dbname: str, username: str, password: str,
+                     months_ahead: int = 3) -> None:
+    """Range-partition Trip by month of tTIME, and Maintenance by month of
+    mDATE, in the schema waste_wrangler of the database <dbname>, using the
+    username <username> and password <password>. Tables that already are
+    partitioned are left as they are.
+
+    The rows move to one partition per month they are in, and partitions are
+    created for the current month and the <months_ahead> months after it.
+    The WasteWrangler methods that add trips or maintenance create the
+    partitions of any other month as they need them. Keys, constraints and
+    indexes keep their names.
+
+    The scheduler queries filter Trip and Maintenance by ranges of tTIME and
+    mDATE, so they only scan the partitions of the days they work on.
+    """
+    connection = pg.connect(dbname=dbname, user=username, password=password,
+                            options="-c search_path=waste_wrangler")
+    try:
+        cursor = connection.cursor()
+        _partition_tables(cursor, months_ahead)
+        cursor.execute(_INDEX_SQL)
+        cursor.close()
+        connection.commit()
+    except Exception as ex:
+        connection.rollback()
+        raise Exception(f"Couldn't partition the tables: \n{ex}")
+    finally:
+        connection.close()
+
+
 def test_preliminary() -> None:
     """Test preliminary aspects of the A2 methods."""
     ww = WasteWrangler()
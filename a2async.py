@@ -0,0 +1,461 @@
+"""CSC343 Assignment 2, asyncio variant
+
+=== Module Description ===
+
+This file contains the AsyncWasteWrangler class, which offers the operations
+of WasteWrangler (a2assignment.py) as coroutines, so that asyncio services can
+call them without blocking their event loop.
+
+It is built on psycopg 3's async connections and connection pool, which have to
+be installed separately:
+    pip install "psycopg[binary]" psycopg_pool
+
+The SQL, the in-memory planners and the rules each operation follows are the
+ones of WasteWrangler; only the way the database is reached differs.
+"""
+
+import datetime as dt
+from typing import Callable, Iterable, Optional, TextIO
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+from a2assignment import (
+    WasteWrangler, _DayPlan, _MaintenancePlan, _WorkmateGraph, _as_day,
+    _balance_trips, _group_drivers, _is_missing_partition, _CLOSED_TRIPS_SQL,
+    _COPY_QUALIFICATIONS_SQL, _DAY_TRIPS_SQL, _DAYS_MAINTENANCE_SQL,
+    _DRIVERS_AMONG_SQL, _DRIVERS_SQL, _DUE_TRUCKS_SQL, _ENSURE_PARTITIONS_SQL,
+    _FACILITIES_SQL, _FACILITY_LOAD_SQL, _FLEET_TRUCKS_SQL,
+    _INSERT_QUALIFIED_SQL, _IS_DRIVER_SQL, _MAINTENANCE_HORIZON,
+    _MOVE_TRIPS_SQL, _OPEN_FACILITIES_SQL, _QUALIFICATIONS_TABLE_SQL,
+    _REROUTE_MANY_SQL, _ROUTES_SQL, _SCHEDULE_TRIP_SQL,
+    _SERVER_SPHERE_MIN_TRIPS, _SPHERE_SQL, _TECHNICIAN_DAYS_SQL,
+    _TECHNICIANS_SQL, _TRIP_ESTIMATE_SQL, _TRUCK_DAYS_SQL, _WORKMATES_SQL
+)
+
+
+_COPY_TRIPS_SQL = """
+    COPY Trip (rID, tID, tTIME, volume, eID1, eID2, fID) FROM STDIN
+"""
+
+_COPY_MAINTENANCE_SQL = """
+    COPY Maintenance (tID, eID, mDATE) FROM STDIN
+"""
+
+
+class AsyncWasteWrangler:
+    """An asyncio counterpart of WasteWrangler. Every call checks a connection
+    out of a shared pool, so many calls can be in flight at once over a small
+    number of connections.
+
+    === Private Attributes ===
+    _pool: the pool of connections to the database, None before connect.
+
+    Representation invariants:
+    - The database to which the pool connects conforms to the schema in
+      waste_wrangler_schema.ddl.
+    """
+    _pool: Optional[AsyncConnectionPool]
+
+    def __init__(self) -> None:
+        """Initialize this AsyncWasteWrangler, with no database connection
+        yet.
+        """
+        self._pool = None
+
+    async def connect(self, dbname: str, username: str, password: str,
+                      pool_size: int = 4) -> bool:
+        """Open a pool of up to <pool_size> connections to the database
+        <dbname> using the username <username> and password <password>, with
+        the search path set to waste_wrangler.
+
+        Return True if the connection was made successfully, False otherwise.
+        """
+        pool = AsyncConnectionPool(
+            psycopg.conninfo.make_conninfo(
+                dbname=dbname, user=username, password=password,
+                options="-c search_path=waste_wrangler"),
+            min_size=1, max_size=pool_size, open=False)
+        try:
+            await pool.open(wait=True, timeout=10)
+            self._pool = pool
+            return True
+        except psycopg.Error:  # includes psycopg_pool.PoolTimeout
+            await pool.close()
+            return False
+
+    async def disconnect(self) -> bool:
+        """Close every connection of this AsyncWasteWrangler.
+
+        Return True if closing the connections was successful, False
+        otherwise.
+        """
+        try:
+            if self._pool is not None:
+                await self._pool.close()
+                self._pool = None
+            return True
+        except psycopg.Error:
+            return False
+
+    def pool_stats(self) -> dict[str, int]:
+        """Return psycopg_pool's statistics about the connection pool, or an
+        empty dict if not connected.
+        """
+        if self._pool is None:
+            return {}
+        return self._pool.get_stats()
+
+    async def schedule_trip(self, rid: int, time: dt.datetime) -> bool:
+        """Schedule a trip on route <rid> at <time>, following the rules of
+        WasteWrangler.schedule_trip.
+
+        Return True iff a trip has been scheduled successfully.
+        """
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    # psycopg prepares it on the connection's first run
+                    await cur.execute(_SCHEDULE_TRIP_SQL,
+                                      {'rid': rid, 'time': time},
+                                      prepare=True)
+                    scheduled = await cur.fetchone() is not None
+                await conn.commit()
+                return scheduled
+        except psycopg.Error as ex:
+            if await self._add_missing_partitions(ex, 'trip', [time.date()]):
+                return await self.schedule_trip(rid, time)
+            return False
+
+    async def schedule_trips(self, tid: int, date: dt.date) -> int:
+        """Schedule trips on <date> for the truck <tid>, following the rules
+        of WasteWrangler.schedule_trips.
+
+        Return the number of trips that were scheduled successfully.
+        """
+        counts = await self.schedule_fleet(date, [tid])
+        return counts.get(tid, 0)
+
+    async def schedule_fleet(self, date: dt.date,
+                             tids: Optional[list[int]] = None
+                             ) -> dict[int, int]:
+        """Schedule trips on <date> for every truck in <tids>, or for every
+        truck if <tids> is None, following the rules of
+        WasteWrangler.schedule_fleet.
+
+        Return a mapping from each tID planned to the number of trips
+        scheduled for it.
+        """
+        date = _as_day(date)
+        counts = {tid: 0 for tid in tids or []}
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(_FLEET_TRUCKS_SQL, {'tids': tids})
+                    trucks = await cur.fetchall()
+                    plan = await self._load_day_plan(cur, date)
+
+                    planned, new_trips = plan.plan_fleet(trucks)
+
+                    if new_trips:
+                        async with cur.copy(_COPY_TRIPS_SQL) as copy:
+                            for trip in new_trips:
+                                await copy.write_row(trip)
+                await conn.commit()
+            counts.update(planned)
+            return counts
+        except psycopg.Error as ex:
+            if await self._add_missing_partitions(ex, 'trip', [date]):
+                return await self.schedule_fleet(date, tids)
+            return {tid: 0 for tid in counts}
+
+    async def update_technicians(
+            self, qualifications_file: TextIO, chunk_size: int = 10000,
+            commit_every: Optional[int] = None,
+            progress: Optional[Callable[[int], None]] = None) -> int:
+        """Record the qualifications in the open file <qualifications_file>,
+        following the rules of WasteWrangler.update_technicians, including its
+        <chunk_size>, <commit_every> and <progress>.
+
+        Return the number of qualifications added, or, if an error stops the
+        import, the number of them that had already been committed.
+        """
+        num_changed = num_committed = 0
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(_QUALIFICATIONS_TABLE_SQL)
+
+                    processed = uncommitted = 0
+                    for chunk in WasteWrangler._read_qualifications_file(
+                            qualifications_file, chunk_size):
+                        async with cur.copy(_COPY_QUALIFICATIONS_SQL) as copy:
+                            for row in chunk:
+                                await copy.write_row(row)
+                        await cur.execute(_INSERT_QUALIFIED_SQL)
+                        num_changed += cur.rowcount
+
+                        processed += len(chunk)
+                        uncommitted += len(chunk)
+                        if (commit_every is not None
+                                and uncommitted >= commit_every):
+                            await conn.commit()
+                            num_committed = num_changed
+                            uncommitted = 0
+                        if progress is not None:
+                            progress(2 * processed)
+                await conn.commit()
+                return num_changed
+        except psycopg.Error:
+            return num_committed
+
+    async def workmate_sphere(self, eid: int, mode: str = 'auto'
+                              ) -> list[int]:
+        """Return the workmate sphere of the driver <eid>, as defined by
+        WasteWrangler.workmate_sphere, computed where <mode> says.
+        """
+        if mode not in ('auto', 'client', 'server'):
+            raise ValueError(f"Unknown workmate_sphere mode: {mode!r}")
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(_IS_DRIVER_SQL, (eid,))
+                    if await cur.fetchone() is None:
+                        return []
+
+                    if mode == 'auto':
+                        await cur.execute(_TRIP_ESTIMATE_SQL)
+                        estimate = (await cur.fetchone())[0]
+                        mode = ('client'
+                                if 0 <= estimate < _SERVER_SPHERE_MIN_TRIPS
+                                else 'server')
+
+                    if mode == 'server':
+                        await cur.execute(_SPHERE_SQL, {'eid': eid})
+                        return [row[0] for row in await cur.fetchall()]
+                    await cur.execute(_WORKMATES_SQL)
+                    workmates = _WorkmateGraph(await cur.fetchall())
+            return workmates.sphere(eid)
+        except psycopg.Error:
+            return []
+
+    async def workmate_spheres(self, eids: Iterable[int]
+                               ) -> dict[int, list[int]]:
+        """Return the workmate sphere of every eID in <eids>, as defined by
+        WasteWrangler.workmate_spheres.
+        """
+        eids = list(eids)
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(_DRIVERS_AMONG_SQL, (eids,))
+                    drivers = {row[0] for row in await cur.fetchall()}
+                    await cur.execute(_WORKMATES_SQL)
+                    workmates = _WorkmateGraph(await cur.fetchall())
+            return {eid: workmates.sphere(eid) if eid in drivers else []
+                    for eid in eids}
+        except psycopg.Error:
+            return {eid: [] for eid in eids}
+
+    async def workmate_components(self) -> list[list[int]]:
+        """Return every group of employees who are in each other's workmate
+        sphere, as defined by WasteWrangler.workmate_components.
+        """
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(_WORKMATES_SQL)
+                    workmates = _WorkmateGraph(await cur.fetchall())
+            return workmates.components()
+        except psycopg.Error:
+            return []
+
+    async def schedule_maintenance(self, date: dt.date) -> int:
+        """Schedule maintenance for every truck that is due for it on <date>,
+        following the rules of WasteWrangler.schedule_maintenance.
+
+        Return the number of maintenances scheduled.
+        """
+        date = _as_day(date)
+        new_maintenance = []
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    new_maintenance = await self._plan_maintenance(cur, date)
+                    if new_maintenance:
+                        async with cur.copy(_COPY_MAINTENANCE_SQL) as copy:
+                            for row in new_maintenance:
+                                await copy.write_row(row)
+                await conn.commit()
+                return len(new_maintenance)
+        except psycopg.Error as ex:
+            if await self._add_missing_partitions(
+                    ex, 'maintenance', [day for _, _, day in new_maintenance]):
+                return await self.schedule_maintenance(date)
+            return 0
+
+    async def reroute_waste(self, fid: int, date: dt.date,
+                            balance: bool = False) -> int:
+        """Reroute the trips to <fid> on <date>, following the rules of
+        WasteWrangler.reroute_waste.
+
+        Return the number of trips rerouted.
+        """
+        if balance:
+            counts, _ = await self.reroute_waste_balanced([fid], date, date)
+        else:
+            counts = await self.reroute_waste_many([fid], date, date)
+        return counts.get(fid, 0)
+
+    async def reroute_waste_many(self, fids: Iterable[int],
+                                 first_day: dt.date,
+                                 last_day: dt.date) -> dict[int, int]:
+        """Reroute the trips to any of the facilities <fids> from <first_day>
+        to <last_day>, inclusive, following the rules of
+        WasteWrangler.reroute_waste_many.
+
+        Return a mapping from each fID in <fids> to the number of its trips
+        that were rerouted.
+        """
+        fids = list(fids)
+        counts = {fid: 0 for fid in fids}
+        first_day = _as_day(first_day)
+        last_day = _as_day(last_day)
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(_REROUTE_MANY_SQL, {
+                        'fids': fids, 'first_day': first_day,
+                        'end_day': last_day + dt.timedelta(days=1)})
+                    counts.update(await cur.fetchall())
+                await conn.commit()
+                return counts
+        except psycopg.Error:
+            return {fid: 0 for fid in fids}
+
+    async def reroute_waste_balanced(
+            self, fids: Iterable[int], first_day: dt.date, last_day: dt.date
+            ) -> tuple[dict[int, int], dict[tuple[int, dt.date], float]]:
+        """Reroute the trips to any of the facilities <fids> from <first_day>
+        to <last_day>, inclusive, spreading them over the eligible facilities
+        as WasteWrangler.reroute_waste_balanced does.
+
+        Return the number of trips rerouted per fID in <fids>, and the
+        projected load per (fID, day).
+        """
+        fids = list(fids)
+        counts = {fid: 0 for fid in fids}
+        first_day = _as_day(first_day)
+        last_day = _as_day(last_day)
+        params = {'fids': fids, 'first_day': first_day,
+                  'end_day': last_day + dt.timedelta(days=1)}
+        try:
+            async with self._pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(_CLOSED_TRIPS_SQL, params)
+                    trips = await cur.fetchall()
+                    await cur.execute(_OPEN_FACILITIES_SQL, params)
+                    facilities = await cur.fetchall()
+                    await cur.execute(_FACILITY_LOAD_SQL, params)
+                    loads = await cur.fetchall()
+
+                    moved, projected = _balance_trips(trips, facilities,
+                                                      loads)
+                    if moved:
+                        rids, t_times, _, new_fids = zip(*moved)
+                        await cur.execute(_MOVE_TRIPS_SQL, (
+                            list(rids), list(t_times), list(new_fids),
+                            params['first_day'], params['end_day']))
+                await conn.commit()
+            for _, _, fid, _ in moved:
+                counts[fid] += 1
+            return counts, projected
+        except psycopg.Error:
+            return {fid: 0 for fid in fids}, {}
+
+    # =========================== Helper methods ============================= #
+
+    async def _add_missing_partitions(self, error: psycopg.Error,
+                                      table: str,
+                                      days: Iterable[dt.date]) -> bool:
+        """If <error> says a row of <table> has no partition to go in, create
+        the partitions of <table> that rows on <days> need, as
+        WasteWrangler._add_missing_partitions does.
+
+        Return True iff partitions were created.
+        """
+        if not _is_missing_partition(error):
+            return False
+        try:
+            async with self._pool.connection() as conn:
+                cur = await conn.execute(_ENSURE_PARTITIONS_SQL,
+                                         (table, sorted(set(days))))
+                created = (await cur.fetchone())[0]
+                await conn.commit()
+            return created > 0
+        except psycopg.Error:
+            return False
+
+    @staticmethod
+    async def _plan_maintenance(cur: psycopg.AsyncCursor, date: dt.date
+                                ) -> list[tuple[int, int, dt.date]]:
+        """Helper for schedule_maintenance. Using the cursor <cur>, plan the
+        maintenance of the trucks due for it on <date> as
+        WasteWrangler._plan_maintenance does, and return the new Maintenance
+        rows.
+        """
+        horizon = _MAINTENANCE_HORIZON
+        while True:
+            until = date + dt.timedelta(days=horizon + 1)
+            plan = await AsyncWasteWrangler._load_maintenance_plan(cur, date,
+                                                                   until)
+            new_maintenance = plan.plan_all()
+            if all(day < until for _, _, day in new_maintenance):
+                return new_maintenance
+            horizon *= 2
+
+    @staticmethod
+    async def _load_maintenance_plan(cur: psycopg.AsyncCursor, date: dt.date,
+                                     until: dt.date) -> _MaintenancePlan:
+        """Helper for _plan_maintenance. Using the cursor <cur>, read what
+        WasteWrangler._load_maintenance_plan reads, and return it as a
+        _MaintenancePlan.
+        """
+        await cur.execute(_DUE_TRUCKS_SQL, {
+            'since': date - dt.timedelta(days=90),
+            'until': date + dt.timedelta(days=10)})
+        trucks = await cur.fetchall()
+
+        params = {'day': date, 'next_day': date + dt.timedelta(days=1),
+                  'until': until, 'tids': [tid for tid, _ in trucks],
+                  'truck_types': list({truck_t for _, truck_t in trucks})}
+        await cur.execute(_TECHNICIANS_SQL, params)
+        technicians = await cur.fetchall()
+        await cur.execute(_TECHNICIAN_DAYS_SQL, params)
+        technician_days = await cur.fetchall()
+        await cur.execute(_TRUCK_DAYS_SQL, params)
+        truck_days = await cur.fetchall()
+
+        return _MaintenancePlan(date, trucks, technicians, technician_days,
+                                truck_days)
+
+    @staticmethod
+    async def _load_day_plan(cur: psycopg.AsyncCursor,
+                             date: dt.date) -> _DayPlan:
+        """Helper for schedule_fleet. Using the cursor <cur>, read the routes,
+        drivers, facilities and the trips and maintenance already scheduled
+        on <date>, and return them as a _DayPlan.
+        """
+        await cur.execute(_ROUTES_SQL)
+        routes = await cur.fetchall()
+        await cur.execute(_DAY_TRIPS_SQL, {
+            'day': date, 'next_day': date + dt.timedelta(days=1)})
+        trips = await cur.fetchall()
+        await cur.execute(_DAYS_MAINTENANCE_SQL, ([date],))
+        maintenance = await cur.fetchall()
+        await cur.execute(_DRIVERS_SQL)
+        drivers = _group_drivers(await cur.fetchall())
+        await cur.execute(_FACILITIES_SQL)
+        facilities = dict(await cur.fetchall())
+        return _DayPlan(date, routes, drivers, facilities, trips,
+                        maintenance)
@@ -0,0 +1,654 @@
+"""CSC343 Assignment 2 benchmarks
+
+=== Module Description ===
+
+This file contains benchmarks for the WasteWrangler class in a2assignment.py.
+They run against a local PostgreSQL database, which they reset with
+a2assignment.setup, or fill with a synthetic dataset, before every
+measurement, so the schema and data files must be in the current directory
+just as for test_preliminary.
+
+The method suite (--suite) times every scheduler on generated datasets at
+1x, 10x and 100x the base sizes in _BASE_SIZES, writes the results as JSON,
+and, given the JSON of an earlier run, reports the methods that became
+slower or send more statements, exiting with status 1 if there are any.
+With --local it runs on LocalWasteWrangler (a2local.py) instead, and needs
+no database.
+
+The horizon benchmark (--horizon) times schedule_horizon over a week on a
+generated dataset with more and more worker processes, and checks that each
+run schedules the same trips and maintenance as the sequential one.
+
+The trip check (--check-trips) makes schedule_trip requests on a generated
+dataset and checks that plan_trip, and LocalWasteWrangler, would have picked
+the same truck, drivers and facility that schedule_trip inserted, exiting
+with status 1 if not: the two apply the same rules separately, in
+_TripResources and _SCHEDULE_TRIP_SQL.
+
+Run it as, e.g.:
+    python a2benchmark.py csc343h-marinat marinat
+    python a2benchmark.py csc343h-marinat marinat --suite --json new.json \\
+        --baseline old.json
+    python a2benchmark.py csc343h-marinat marinat --horizon --scales 10
+    python a2benchmark.py csc343h-marinat marinat --check-trips --scales 1 10
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import io
+import json
+import random
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import psycopg2 as pg
+
+from a2assignment import WasteWrangler, _INDEX_SQL, _partition_tables, setup
+from a2local import LocalWasteWrangler
+
+# The sizes of the generated dataset at scale 1; every count but the days of
+# history is multiplied by the scale.
+_BASE_SIZES = {
+    'trucks': 40,
+    'routes': 60,
+    'employees': 100,
+    'facilities': 12,
+    'history_days': 28,
+}
+
+_WASTE_TYPES = ['drop-off', 'compost', 'recycling', 'hazardous', 'garbage']
+_TRUCK_TYPES = {'A': ['drop-off', 'compost'], 'B': ['recycling'],
+                'C': ['compost'], 'D': ['drop-off', 'garbage'],
+                'E': ['hazardous'], 'F': ['garbage', 'recycling']}
+_FIRST_NAMES = ['Tom', 'Ann', 'Bob', 'Sue', 'Al', 'Jo', 'Mia', 'Li', 'Kai',
+                'Zed', 'Ivy', 'Ned', 'Eve', 'Raj', 'Uma', 'Max']
+_SURNAMES = ['Smith', 'Lee', 'Ray', 'Kim', 'Gore', 'Po', 'Ng', 'Wu', 'Ho',
+             'Ax', 'Qu', 'Ox', 'Diaz', 'Shah', 'Roy', 'Chan']
+
+# The day the suite schedules from: the generated history ends the day before
+_SUITE_DAY = dt.date(2023, 6, 1)
+
+
+def _trip_requests(ww: WasteWrangler, calls: int,
+                   first_day: dt.date) -> list[tuple[int, dt.datetime]]:
+    """Return <calls> (rid, time) requests for schedule_trip that spread the
+    routes of the database <ww> is connected to over the working hours of
+    consecutive days starting at <first_day>.
+    """
+    cur = ww.connection.cursor()
+    cur.execute("SELECT rID FROM Route ORDER BY rID")
+    rids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    ww.connection.rollback()
+
+    requests = []
+    for i in range(calls):
+        day = first_day + dt.timedelta(days=i // len(rids))
+        start = dt.datetime.combine(day, dt.time(hour=8))
+        requests.append((rids[i % len(rids)],
+                         start + dt.timedelta(minutes=30 * (i % 8))))
+    return requests
+
+
+def benchmark_pool(dbname: str, user: str, password: str, data_file: str,
+                   threads: tuple[int, ...] = (1, 2, 4, 8, 16),
+                   calls: int = 400) -> dict[int, dict[str, float]]:
+    """For each number of worker threads in <threads>, reload <data_file>
+    into the database <dbname>, then have that many threads share a pooled
+    WasteWrangler with one connection per thread to make <calls>
+    schedule_trip calls.
+
+    Return, for each number of threads, the throughput in calls per second
+    and the pool's statistics after the run.
+    """
+    results = {}
+    for workers in threads:
+        setup(dbname, user, password, data_file)
+
+        ww = WasteWrangler()
+        assert ww.connect(dbname, user, password, pool_size=workers), \
+            f"[Benchmark] Couldn't connect to {dbname}"
+        try:
+            # a plain connection, just to read the routes
+            reader = WasteWrangler()
+            reader.connect(dbname, user, password)
+            requests = _trip_requests(reader, calls, dt.date(2023, 6, 1))
+            reader.disconnect()
+
+            started = perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda req: ww.schedule_trip(*req),
+                                  requests))
+            elapsed = perf_counter() - started
+
+            results[workers] = {'calls_per_second': calls / elapsed,
+                                **ww.pool_stats()}
+        finally:
+            ww.disconnect()
+    return results
+
+
+def benchmark_async(dbname: str, user: str, password: str, data_file: str,
+                    in_flight: tuple[int, ...] = (1, 16, 64, 256),
+                    pool_size: int = 4,
+                    calls: int = 400) -> dict[int, dict[str, float]]:
+    """For each number of concurrent requests in <in_flight>, reload
+    <data_file> into the database <dbname>, then make <calls> schedule_trip
+    calls on an AsyncWasteWrangler whose pool has <pool_size> connections,
+    keeping that many calls in flight at once.
+
+    Return, for each number of calls in flight, the throughput in calls per
+    second and the pool's statistics after the run.
+    """
+    # psycopg 3 is only needed for this benchmark
+    from a2async import AsyncWasteWrangler
+
+    async def run(concurrency: int,
+                  requests: list[tuple[int, dt.datetime]]) -> dict:
+        ww = AsyncWasteWrangler()
+        assert await ww.connect(dbname, user, password, pool_size), \
+            f"[Benchmark] Couldn't connect to {dbname}"
+        try:
+            slots = asyncio.Semaphore(concurrency)
+
+            async def call(rid: int, time: dt.datetime) -> bool:
+                async with slots:
+                    return await ww.schedule_trip(rid, time)
+
+            started = perf_counter()
+            await asyncio.gather(*(call(*req) for req in requests))
+            elapsed = perf_counter() - started
+            return {'calls_per_second': calls / elapsed, **ww.pool_stats()}
+        finally:
+            await ww.disconnect()
+
+    results = {}
+    for concurrency in in_flight:
+        setup(dbname, user, password, data_file)
+
+        reader = WasteWrangler()
+        reader.connect(dbname, user, password)
+        requests = _trip_requests(reader, calls, dt.date(2023, 6, 1))
+        reader.disconnect()
+
+        results[concurrency] = asyncio.run(run(concurrency, requests))
+    return results
+
+
+def _copy_rows(cursor: pg.extensions.cursor, table: str,
+               rows: list[tuple]) -> None:
+    """Load <rows> into <table> with COPY, using <cursor>."""
+    data = io.StringIO()
+    for row in rows:
+        data.write('\t'.join(r'\N' if value is None else str(value)
+                             for value in row))
+        data.write('\n')
+    data.seek(0)
+    cursor.copy_expert(f"COPY {table} FROM STDIN", data)
+
+
+def generate_rows(scale: int = 1, seed: int = 343) -> dict[str, list[tuple]]:
+    """Return a synthetic dataset <scale> times the size of _BASE_SIZES, made
+    from <seed>, as the rows of each table of the schema.
+
+    The dataset has <history_days> days of trips before _SUITE_DAY, with a
+    trip on about half of the routes each day, and a maintenance every 60 to
+    120 days for each truck over the year before, so that some trucks are due.
+    The same <scale> and <seed> always give the same dataset.
+    """
+    rng = random.Random(seed)
+    sizes = {name: (size if name == 'history_days' else size * scale)
+             for name, size in _BASE_SIZES.items()}
+
+    truck_types = [(truck_t, waste_t) for truck_t, waste_types
+                   in _TRUCK_TYPES.items() for waste_t in waste_types]
+    trucks = [(tid, rng.choice(list(_TRUCK_TYPES)), rng.choice([5, 10, 15,
+                                                                20, 25, 30]))
+              for tid in range(1, sizes['trucks'] + 1)]
+    employees = [(eid, f"{rng.choice(_FIRST_NAMES)} {rng.choice(_SURNAMES)}",
+                  dt.date(2000, 1, 1) + dt.timedelta(days=rng.randrange(8000)))
+                 for eid in range(1, sizes['employees'] + 1)]
+    # about 60% of the employees drive and 15% maintain, some both
+    drivers = [(eid, truck_t) for eid, _, _ in employees if rng.random() < 0.6
+               for truck_t in rng.sample(sorted(_TRUCK_TYPES),
+                                         rng.choice([1, 1, 2]))]
+    technicians = [(eid, truck_t) for eid, _, _ in employees
+                   if rng.random() < 0.15
+                   for truck_t in rng.sample(sorted(_TRUCK_TYPES),
+                                             rng.choice([1, 2]))]
+    routes = [(rid, rng.choice(_WASTE_TYPES), rng.randrange(20, 200) / 10)
+              for rid in range(1, sizes['routes'] + 1)]
+    # every waste type has at least one facility
+    facilities = [(fid, f"{fid} {rng.choice(_SURNAMES)} St",
+                   _WASTE_TYPES[fid - 1] if fid <= len(_WASTE_TYPES)
+                   else rng.choice(_WASTE_TYPES))
+                  for fid in range(1, sizes['facilities'] + 1)]
+
+    technicians_of = {}
+    for eid, truck_t in technicians:
+        technicians_of.setdefault(truck_t, []).append(eid)
+    maintenance = []
+    for tid, truck_t, _ in trucks:
+        if truck_t not in technicians_of:
+            continue
+        day = _SUITE_DAY - dt.timedelta(days=rng.randrange(365, 400))
+        while True:
+            day += dt.timedelta(days=rng.randrange(60, 121))
+            if day >= _SUITE_DAY:
+                break
+            maintenance.append((tid, rng.choice(technicians_of[truck_t]), day))
+
+    trucks_for = {waste_t: [] for waste_t in _WASTE_TYPES}
+    for tid, truck_t, _ in trucks:
+        for waste_t in _TRUCK_TYPES[truck_t]:
+            trucks_for[waste_t].append(tid)
+    facilities_for = {waste_t: [] for waste_t in _WASTE_TYPES}
+    for fid, _, waste_t in facilities:
+        facilities_for[waste_t].append(fid)
+    driver_eids = sorted({eid for eid, _ in drivers})
+
+    trips = []
+    busy = set()
+    first_day = _SUITE_DAY - dt.timedelta(days=sizes['history_days'])
+    for offset in range(sizes['history_days']):
+        day = first_day + dt.timedelta(days=offset)
+        for rid, waste_t, _ in routes:
+            if rng.random() < 0.5 or not trucks_for[waste_t]:
+                continue
+            time = dt.datetime.combine(day, dt.time(8)) + dt.timedelta(
+                minutes=30 * rng.randrange(13))
+            tid = rng.choice(trucks_for[waste_t])
+            if (tid, time) in busy:
+                continue
+            busy.add((tid, time))
+            eid1, eid2 = sorted(rng.sample(driver_eids, 2), reverse=True)
+            trips.append((rid, tid, time, None, eid1, eid2,
+                          rng.choice(facilities_for[waste_t])))
+
+    return {'TruckType': truck_types, 'Truck': trucks, 'Employee': employees,
+            'Driver': drivers, 'Technician': technicians, 'Route': routes,
+            'Facility': facilities, 'Maintenance': maintenance, 'Trip': trips}
+
+
+def generate(dbname: str, user: str, password: str, scale: int = 1,
+             seed: int = 343, partitioned: bool = False) -> dict[str, int]:
+    """Reset the database <dbname> to the schema in
+    ./waste_wrangler_schema.sql, fill it with the dataset
+    generate_rows(<scale>, <seed>) makes, and create the indexes setup creates.
+    If <partitioned>, partition Trip and Maintenance by month, as setup does.
+
+    Return the number of rows generated for each table.
+    """
+    tables = generate_rows(scale, seed)
+    connection = pg.connect(dbname=dbname, user=user, password=password,
+                            options="-c search_path=waste_wrangler")
+    try:
+        cursor = connection.cursor()
+        with open("./waste_wrangler_schema.sql", "r") as schema_file:
+            cursor.execute(schema_file.read())
+        for table, rows in tables.items():
+            _copy_rows(cursor, table, rows)
+        if partitioned:
+            _partition_tables(cursor, 3)
+        cursor.execute(_INDEX_SQL)
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+    return {table.lower(): len(rows) for table, rows in tables.items()}
+
+
+def _qualifications(tables: dict[str, list[tuple]], lines: int,
+                    seed: int) -> str:
+    """Return a qualifications file, as described on the handout, with
+    <lines> qualifications of random employees of the dataset <tables>, some
+    with titles, made from <seed>.
+    """
+    rng = random.Random(seed)
+    names = [name for _, name, _ in tables['Employee']]
+
+    entries = [f"{rng.choice(['', '', 'Mr. ', 'Ms ', 'Prof. '])}"
+               f"{rng.choice(names)}\n{rng.choice(sorted(_TRUCK_TYPES))}"
+               for _ in range(lines)]
+    return '\n'.join(entries)
+
+
+def _suite_calls(tables: dict[str, list[tuple]], scale: int,
+                 seed: int) -> dict[str, list[tuple]]:
+    """Return, for each WasteWrangler method the suite times, the arguments of
+    the calls to make to it on the dataset <tables> of <scale>, made from
+    <seed>.
+    """
+    rng = random.Random(seed)
+    rids = list(range(1, _BASE_SIZES['routes'] * scale + 1))
+    tids = list(range(1, _BASE_SIZES['trucks'] * scale + 1))
+    eids = list(range(1, _BASE_SIZES['employees'] * scale + 1))
+    fids = list(range(1, _BASE_SIZES['facilities'] * scale + 1))
+    days = [_SUITE_DAY + dt.timedelta(days=offset) for offset in range(7)]
+    past = [_SUITE_DAY - dt.timedelta(days=offset) for offset in range(1, 8)]
+
+    def times(count: int) -> list[tuple[int, dt.datetime]]:
+        return [(rng.choice(rids),
+                 dt.datetime.combine(rng.choice(days), dt.time(8))
+                 + dt.timedelta(minutes=30 * rng.randrange(13)))
+                for _ in range(count)]
+
+    qualifications = _qualifications(tables, 20 * scale, seed)
+    return {
+        'schedule_trip': times(50),
+        'schedule_trip_many': [(times(200),)],
+        'schedule_trips': [(tid, days[0]) for tid in rng.sample(tids, 10)],
+        'schedule_fleet': [(day,) for day in days[:3]],
+        'update_technicians': [(io.StringIO(qualifications),)],
+        'workmate_sphere': [(eid,) for eid in rng.sample(eids, 20)],
+        'workmate_spheres': [(rng.sample(eids, 50),)],
+        'schedule_maintenance': [(day,) for day in days[::3]],
+        'reroute_waste': [(rng.choice(fids), rng.choice(past))
+                          for _ in range(10)],
+        'reroute_waste_many': [(rng.sample(fids, 2), past[-1], past[0])],
+    }
+
+
+def benchmark_methods(dbname: str, user: str, password: str,
+                      scales: tuple[int, ...] = (1, 10, 100),
+                      seed: int = 343, local: bool = False,
+                      partitioned: bool = False) -> dict[str, dict]:
+    """For each scale in <scales>, and each WasteWrangler method in
+    _suite_calls, generate the dataset of that scale from <seed>, then make
+    the method's calls one after the other and time each of them. Every
+    method starts from a freshly generated dataset, so runs are repeatable.
+
+    If <local> is True, run the methods of a LocalWasteWrangler holding the
+    dataset instead, without using the database <dbname>. If <partitioned>
+    is True, Trip and Maintenance are partitioned by month.
+
+    Return, for each scale, the number of rows of each table and, for each
+    method, the number of calls, their total, mean, median and maximum time
+    in seconds, and the statements and round-trips per call, as the
+    WasteWrangler metrics count them (0 with <local>).
+    """
+    results = {}
+    for scale in scales:
+        tables = generate_rows(scale, seed)
+        sizes = {table.lower(): len(rows) for table, rows in tables.items()}
+        calls = _suite_calls(tables, scale, seed)
+        methods = {}
+        for method, arguments in calls.items():
+            if local:
+                ww = LocalWasteWrangler()
+                ww.load_rows(tables)
+            else:
+                generate(dbname, user, password, scale, seed, partitioned)
+                ww = WasteWrangler()
+                assert ww.connect(dbname, user, password), \
+                    f"[Benchmark] Couldn't connect to {dbname}"
+            try:
+                timings = []
+                for args in arguments:
+                    started = perf_counter()
+                    getattr(ww, method)(*args)
+                    timings.append(perf_counter() - started)
+                counts = {} if local else ww.metrics().get('methods', {})
+            finally:
+                ww.disconnect()
+
+            # methods that delegate, e.g. schedule_trips, are counted under
+            # the method they call
+            statements = sum(stats['statements'] for stats in counts.values())
+            round_trips = sum(stats['round_trips']
+                              for stats in counts.values())
+            methods[method] = {
+                'calls': len(timings),
+                'total': sum(timings),
+                'mean': statistics.mean(timings),
+                'median': statistics.median(timings),
+                'max': max(timings),
+                'statements_per_call': statements / len(timings),
+                'round_trips_per_call': round_trips / len(timings),
+            }
+        results[str(scale)] = {'sizes': sizes, 'methods': methods}
+    return results
+
+
+def benchmark_horizon(dbname: str, user: str, password: str,
+                      scale: int = 10, days: int = 7,
+                      workers: tuple[int, ...] = (1, 2, 4, 8),
+                      seed: int = 343) -> dict[int, dict[str, float]]:
+    """For each number of worker processes in <workers>, generate the dataset
+    of <scale> from <seed>, then schedule_horizon the <days> days from
+    _SUITE_DAY with that many workers.
+
+    Return, for each number of workers, the time taken in seconds, the
+    number of trips and maintenances scheduled, and whether Trip and
+    Maintenance ended up the same as with the first number of workers.
+    """
+    results = {}
+    first_plan = None
+    for count in workers:
+        generate(dbname, user, password, scale, seed)
+        ww = WasteWrangler()
+        assert ww.connect(dbname, user, password), \
+            f"[Benchmark] Couldn't connect to {dbname}"
+        try:
+            started = perf_counter()
+            scheduled = ww.schedule_horizon(
+                _SUITE_DAY, _SUITE_DAY + dt.timedelta(days=days - 1), count)
+            elapsed = perf_counter() - started
+
+            cursor = ww.connection.cursor()
+            cursor.execute("SELECT * FROM Trip ORDER BY rID, tTIME")
+            plan = cursor.fetchall()
+            cursor.execute("SELECT * FROM Maintenance ORDER BY tID, mDATE")
+            plan += cursor.fetchall()
+            cursor.close()
+            ww.connection.rollback()
+        finally:
+            ww.disconnect()
+
+        if first_plan is None:
+            first_plan = plan
+        results[count] = {
+            'seconds': elapsed,
+            'trips': sum(trips for trips, _ in scheduled.values()),
+            'maintenances': sum(maintenances
+                                for _, maintenances in scheduled.values()),
+            'same_plan': plan == first_plan,
+        }
+    return results
+
+
+def check_trip_planners(dbname: str, user: str, password: str,
+                        scale: int = 1, calls: int = 200,
+                        seed: int = 343) -> list[str]:
+    """Generate the dataset of <scale> from <seed>, then make <calls>
+    schedule_trip requests on it, all in one week so that trucks and drivers
+    clash. Before each request, ask plan_trip, which picks with
+    _TripResources, and the plan_trip of a LocalWasteWrangler kept in step,
+    for the Trip row they would insert, and compare both with the row
+    schedule_trip, which picks with _SCHEDULE_TRIP_SQL, does insert.
+
+    Return a description of each request on which they disagree.
+    """
+    tables = generate_rows(scale, seed)
+    requests = _suite_calls(tables, scale, seed)['schedule_trip']
+    rng = random.Random(seed)
+    requests += [rng.choice(requests) for _ in range(calls - len(requests))]
+
+    generate(dbname, user, password, scale, seed)
+    local = LocalWasteWrangler()
+    local.load_rows(tables)
+    ww = WasteWrangler()
+    assert ww.connect(dbname, user, password), \
+        f"[Check] Couldn't connect to {dbname}"
+    mismatches = []
+    try:
+        cursor = ww.connection.cursor()
+        for rid, time in requests[:calls]:
+            planned = ww.plan_trip(rid, time)
+            local_planned = local.plan_trip(rid, time)
+            inserted = None
+            if ww.schedule_trip(rid, time):
+                cursor.execute("SELECT * FROM Trip WHERE rID = %s "
+                               "AND tTIME = %s", (rid, time))
+                inserted = cursor.fetchone()
+                ww.connection.rollback()
+            local.schedule_trip(rid, time)
+            if not planned == local_planned == inserted:
+                mismatches.append(f"schedule_trip({rid}, {time}): inserted "
+                                  f"{inserted}, plan_trip {planned}, local "
+                                  f"{local_planned}")
+        cursor.close()
+    finally:
+        ww.disconnect()
+        local.disconnect()
+    return mismatches
+
+
+def compare(baseline: dict[str, dict], results: dict[str, dict],
+            tolerance: float = 0.25, floor: float = 0.001) -> list[str]:
+    """Return a description of each regression of <results> against
+    <baseline>, both as returned by benchmark_methods: a method whose median
+    time grew by more than <tolerance> (as a fraction) and by more than
+    <floor> seconds, or that sends more statements per call, at the same
+    scale.
+    """
+    regressions = []
+    for scale, result in results.items():
+        before = baseline.get(scale, {}).get('methods', {})
+        for method, now in result['methods'].items():
+            if method not in before:
+                continue
+            then = before[method]
+            if (now['median'] > then['median'] * (1 + tolerance)
+                    and now['median'] - then['median'] > floor):
+                regressions.append(
+                    f"{method} at {scale}x: median {then['median']:.4f}s -> "
+                    f"{now['median']:.4f}s")
+            if now['statements_per_call'] > then['statements_per_call']:
+                regressions.append(
+                    f"{method} at {scale}x: "
+                    f"{then['statements_per_call']:.1f} -> "
+                    f"{now['statements_per_call']:.1f} statements per call")
+    return regressions
+
+
+def _print_methods(results: dict[str, dict]) -> None:
+    """Print the <results> of benchmark_methods."""
+    for scale, result in results.items():
+        print(f"scale {scale}x: " + ', '.join(
+            f"{count} {table}" for table, count in result['sizes'].items()))
+        print(f"{'method':>22} {'calls':>6} {'median ms':>10} "
+              f"{'max ms':>10} {'stmts':>7} {'trips':>7}")
+        for method, stats in result['methods'].items():
+            print(f"{method:>22} {stats['calls']:>6} "
+                  f"{1000 * stats['median']:>10.2f} "
+                  f"{1000 * stats['max']:>10.2f} "
+                  f"{stats['statements_per_call']:>7.1f} "
+                  f"{stats['round_trips_per_call']:>7.1f}")
+
+
+def _print_horizon(results: dict[int, dict[str, float]]) -> None:
+    """Print the <results> of benchmark_horizon."""
+    print('schedule_horizon over worker processes')
+    print(f"{'workers':>8} {'seconds':>10} {'trips':>8} {'maint.':>8} "
+          f"{'same plan':>10}")
+    for workers, stats in results.items():
+        print(f"{workers:>8} {stats['seconds']:>10.2f} {stats['trips']:>8} "
+              f"{stats['maintenances']:>8} {str(stats['same_plan']):>10}")
+
+
+def _print_results(title: str, results: dict[int, dict[str, float]]) -> None:
+    """Print the <results> of a benchmark under the heading <title>."""
+    print(title)
+    print(f"{'workers':>8} {'calls/s':>10} {'mean wait':>10} {'max wait':>10}")
+    for workers, stats in results.items():
+        # the async pool reports its total wait in ms instead
+        if 'requests_wait_ms' in stats:
+            stats['mean_wait'] = (stats['requests_wait_ms'] / 1000
+                                  / max(stats.get('requests_num', 1), 1))
+        print(f"{workers:>8} {stats['calls_per_second']:>10.1f} "
+              f"{stats.get('mean_wait', 0.0):>10.4f} "
+              f"{stats.get('max_wait', 0.0):>10.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('dbname')
+    parser.add_argument('user')
+    parser.add_argument('password', nargs='?', default='')
+    parser.add_argument('--data', default='./waste_wrangler_data.sql')
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--async', dest='run_async', action='store_true',
+                        help='also benchmark AsyncWasteWrangler (psycopg 3)')
+    parser.add_argument('--suite', action='store_true',
+                        help='time every method on generated datasets '
+                             'instead')
+    parser.add_argument('--horizon', action='store_true',
+                        help='time schedule_horizon with 1 to 8 worker '
+                             'processes instead')
+    parser.add_argument('--check-trips', action='store_true',
+                        help='check that plan_trip and schedule_trip pick '
+                             'the same trips instead')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--seed', type=int, default=343)
+    parser.add_argument('--local', action='store_true',
+                        help='run the suite on LocalWasteWrangler, without '
+                             'the database')
+    parser.add_argument('--partitioned', action='store_true',
+                        help='partition Trip and Maintenance by month for the '
+                             'suite')
+    parser.add_argument('--json', help='write the suite results to this file')
+    parser.add_argument('--baseline',
+                        help='compare the suite results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.suite:
+        suite = benchmark_methods(args.dbname, args.user, args.password,
+                                  tuple(args.scales), args.seed, args.local,
+                                  args.partitioned)
+        _print_methods(suite)
+        if args.json:
+            with open(args.json, 'w') as out:
+                json.dump(suite, out, indent=2)
+        if args.baseline:
+            with open(args.baseline) as baseline_file:
+                regressions = compare(json.load(baseline_file), suite,
+                                      args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if regressions:
+                sys.exit(1)
+        sys.exit(0)
+
+    if args.check_trips:
+        failed = False
+        for scale in args.scales:
+            mismatches = check_trip_planners(args.dbname, args.user,
+                                             args.password, scale,
+                                             args.calls, args.seed)
+            print(f"scale {scale}x: {len(mismatches)} of {args.calls} "
+                  f"requests planned differently")
+            for mismatch in mismatches:
+                print(f"MISMATCH {mismatch}")
+            failed = failed or bool(mismatches)
+        sys.exit(1 if failed else 0)
+
+    if args.horizon:
+        for scale in args.scales:
+            _print_horizon(benchmark_horizon(args.dbname, args.user,
+                                             args.password, scale,
+                                             seed=args.seed))
+        sys.exit(0)
+
+    _print_results('schedule_trip through a connection pool',
+                   benchmark_pool(args.dbname, args.user, args.password,
+                                  args.data, calls=args.calls))
+    if args.run_async:
+        _print_results('async schedule_trip, calls in flight over 4 '
+                       'connections',
+                       benchmark_async(args.dbname, args.user, args.password,
+                                       args.data, calls=args.calls))
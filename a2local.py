@@ -0,0 +1,678 @@
+"""CSC343 Assignment 2, in-process variant
+
+=== Module Description ===
+
+This file contains the LocalWasteWrangler class, which offers the operations
+of WasteWrangler (a2assignment.py) on tables held in memory, so that tests and
+benchmarks can run without a PostgreSQL server and start in milliseconds.
+
+The tables follow waste_wrangler_schema.sql, including its keys, and are
+filled either from a data file of INSERT statements, like
+waste_wrangler_data.sql, or from rows, like those a2benchmark.generate_rows
+makes. The in-memory planners and the rules each operation follows are the
+ones of WasteWrangler, built by the same helpers; only the queries that feed
+them are answered here, by a _LocalLoader, instead of by the database, so
+both give the same results on the same data.
+"""
+
+import datetime as dt
+from time import perf_counter
+from typing import Callable, Iterable, Optional, TextIO
+
+from a2assignment import (
+    WasteWrangler, _Calendar, _PlannerLoader, _ReferenceData, _WorkmateGraph,
+    _as_day, _read_data_file,
+    _REFERENCE_DRIVERS_SQL, _REFERENCE_EMPLOYEES_SQL,
+    _REFERENCE_FACILITIES_SQL, _REFERENCE_TECHNICIANS_SQL,
+    _REFERENCE_TRUCKS_SQL, _ROUTES_SQL
+)
+
+
+def _parse_date(value) -> dt.date:
+    """Return <value>, a date, a datetime or a date in ISO format, as a
+    date.
+    """
+    if isinstance(value, dt.date):
+        return _as_day(value)
+    return dt.date.fromisoformat(value)
+
+
+def _parse_timestamp(value) -> dt.datetime:
+    """Return <value>, a datetime or a timestamp in ISO format, as a
+    datetime.
+    """
+    if isinstance(value, dt.datetime):
+        return value
+    return dt.datetime.fromisoformat(value)
+
+
+# The columns of each table of the schema, in order, with the function that
+# converts a value read from a data file or given in a row to the type
+# psycopg2 would return for it.
+_COLUMNS = {
+    'TruckType': [('truckType', str), ('wasteType', str)],
+    'Truck': [('tID', int), ('truckType', str), ('capacity', float)],
+    'Employee': [('eID', int), ('name', str), ('hireDate', _parse_date)],
+    'Driver': [('eID', int), ('truckType', str)],
+    'Technician': [('eID', int), ('truckType', str)],
+    'Maintenance': [('tID', int), ('eID', int), ('mDATE', _parse_date)],
+    'Route': [('rID', int), ('wasteType', str), ('length', float)],
+    'Facility': [('fID', int), ('address', str), ('wasteType', str)],
+    'Trip': [('rID', int), ('tID', int), ('tTIME', _parse_timestamp),
+             ('volume', float), ('eID1', int), ('eID2', int), ('fID', int)],
+}
+
+# The positions of the columns of each key (PRIMARY KEY or UNIQUE) of each
+# table
+_KEYS = {
+    'TruckType': [(0, 1)],
+    'Truck': [(0,)],
+    'Employee': [(0,)],
+    'Driver': [(0, 1)],
+    'Technician': [(0, 1)],
+    'Maintenance': [(0, 2)],
+    'Route': [(0,)],
+    'Facility': [(0,)],
+    'Trip': [(0, 2), (1, 2)],
+}
+
+
+class LocalError(Exception):
+    """Raised when a change would break a key of the schema, or a data file
+    cannot be read. The operations that schedule trips and maintenance catch
+    it, as WasteWrangler's catch psycopg2.Error, and report the failure the
+    same way.
+    """
+
+
+class _LocalDatabase:
+    """The tables of the waste_wrangler schema, held in memory.
+
+    === Instance Attributes ===
+    tables: maps each table to its rows, as tuples in the order of its
+        columns in _COLUMNS.
+    keys: maps each table to the set of values of each of its keys in _KEYS.
+    trips_by_day: maps each day to the rows of Trip whose tTIME is on it.
+    """
+    tables: dict[str, list[tuple]]
+    keys: dict[str, list[set[tuple]]]
+    trips_by_day: dict[dt.date, list[tuple]]
+
+    def __init__(self) -> None:
+        """Initialize every table empty."""
+        self.tables = {table: [] for table in _COLUMNS}
+        self.keys = {table: [set() for _ in keys]
+                     for table, keys in _KEYS.items()}
+        self.trips_by_day = {}
+
+    def insert(self, table: str, rows: Iterable[tuple]) -> None:
+        """Add <rows> to <table>, converting their values to the types of its
+        columns. Nothing is added if any row would repeat the value of a key of
+        <table>, or repeats one itself: a LocalError is raised instead.
+        """
+        columns = _COLUMNS[table]
+        rows = [tuple(None if value is None else convert(value)
+                      for value, (_, convert) in zip(row, columns))
+                for row in rows]
+
+        for positions, seen in zip(_KEYS[table], self.keys[table]):
+            values = [tuple(row[i] for i in positions) for row in rows]
+            if len(set(values)) < len(values) or not seen.isdisjoint(values):
+                raise LocalError(f"duplicate key in {table}")
+
+        for positions, seen in zip(_KEYS[table], self.keys[table]):
+            seen.update(tuple(row[i] for i in positions) for row in rows)
+        self.tables[table].extend(rows)
+        if table == 'Trip':
+            for row in rows:
+                self.trips_by_day.setdefault(row[2].date(), []).append(row)
+
+    def trips_between(self, first_day: dt.date,
+                      end_day: dt.date) -> Iterable[tuple]:
+        """Yield the rows of Trip from <first_day> up to (not including)
+        <end_day>.
+        """
+        day = first_day
+        while day < end_day:
+            yield from self.trips_by_day.get(day, [])
+            day += dt.timedelta(days=1)
+
+    def update_trip_facilities(self, moved: dict[tuple, int]) -> None:
+        """Set the fID of the trips whose (rID, tTIME) are the keys of <moved>
+        to the corresponding value.
+        """
+        trips = self.tables['Trip']
+        for i, row in enumerate(trips):
+            if (row[0], row[2]) in moved:
+                trips[i] = row[:6] + (moved[row[0], row[2]],)
+        self.trips_by_day = {}
+        for row in trips:
+            self.trips_by_day.setdefault(row[2].date(), []).append(row)
+
+    def cursor(self) -> '_ReferenceCursor':
+        """Return a cursor that answers the queries _ReferenceData.load runs.
+        """
+        return _ReferenceCursor(self)
+
+
+class _ReferenceCursor:
+    """Answers the queries _ReferenceData.load runs, _ROUTES_SQL and the
+    _REFERENCE_*_SQL queries, over a _LocalDatabase, so that it can read the
+    tables as it reads the database.
+
+    === Private Attributes ===
+    _database: the tables queried.
+    _rows: the rows of the last query.
+    """
+    _database: _LocalDatabase
+    _rows: list[tuple]
+
+    def __init__(self, database: _LocalDatabase) -> None:
+        """Initialize a cursor over <database>."""
+        self._database = database
+        self._rows = []
+
+    def execute(self, query: str) -> None:
+        """Run <query>, one of the queries _ReferenceData.load runs."""
+        tables = self._database.tables
+        if query == _ROUTES_SQL:
+            self._rows = list(tables['Route'])
+        elif query == _REFERENCE_TRUCKS_SQL:
+            waste_types = {}
+            for truck_t, waste_t in tables['TruckType']:
+                waste_types.setdefault(truck_t, []).append(waste_t)
+            self._rows = [(tid, truck_t, capacity, waste_t)
+                          for tid, truck_t, capacity in tables['Truck']
+                          for waste_t in waste_types.get(truck_t, [])]
+        elif query == _REFERENCE_FACILITIES_SQL:
+            self._rows = [(fid, waste_t)
+                          for fid, _, waste_t in tables['Facility']]
+        elif query == _REFERENCE_EMPLOYEES_SQL:
+            self._rows = list(tables['Employee'])
+        elif query == _REFERENCE_DRIVERS_SQL:
+            self._rows = list(tables['Driver'])
+        elif query == _REFERENCE_TECHNICIANS_SQL:
+            self._rows = list(tables['Technician'])
+        else:
+            raise LocalError(f"unsupported query: {query}")
+
+    def fetchall(self) -> list[tuple]:
+        """Return the rows of the last query."""
+        return self._rows
+
+
+class _LocalLoader(_PlannerLoader):
+    """A _PlannerLoader that answers the queries from the tables of a
+    _LocalDatabase, and takes the reference tables from its reference data
+    snapshot.
+
+    === Private Attributes ===
+    _database: the tables queried.
+    """
+    _database: _LocalDatabase
+
+    def __init__(self, database: _LocalDatabase,
+                 reference: _ReferenceData) -> None:
+        """Initialize a loader over <database>, whose reference data snapshot
+        is <reference>.
+        """
+        super().__init__(reference)
+        self._database = database
+
+    def days_maintenance(self, days: list[dt.date]
+                         ) -> list[tuple[int, dt.date]]:
+        wanted = set(days)
+        return [(tid, m_date) for tid, _, m_date
+                in self._database.tables['Maintenance'] if m_date in wanted]
+
+    def days_trips(self, days: list[dt.date]) -> list[tuple]:
+        routes = self.reference.routes_by_rid
+        return [(rid, tid, t_time, routes[rid].length, eid1, eid2)
+                for day in days
+                for rid, tid, t_time, _, eid1, eid2, _
+                in self._database.trips_by_day.get(day, [])]
+
+    def due_trucks(self, since: dt.date, until: dt.date
+                   ) -> list[tuple[int, str]]:
+        tables = self._database.tables
+        maintenance = _Calendar(since, [(tid, m_date) for tid, _, m_date
+                                        in tables['Maintenance']])
+        return sorted((tid, truck_t) for tid, truck_t, _ in tables['Truck']
+                      if maintenance.is_free_between(tid, since, until))
+
+    def technician_days(self, day: dt.date, truck_types: list[str]
+                        ) -> list[tuple[int, dt.date]]:
+        eids = {eid for eid, _, _ in self.technicians(truck_types)}
+        return [(eid, m_date) for _, eid, m_date
+                in self._database.tables['Maintenance']
+                if m_date > day and eid in eids]
+
+    def truck_days(self, day: dt.date, until: dt.date, tids: list[int]
+                   ) -> list[tuple[int, dt.date]]:
+        tids = set(tids)
+        days = {(tid, m_date) for tid, _, m_date
+                in self._database.tables['Maintenance']
+                if day < m_date < until and tid in tids}
+        days.update((tid, t_time.date()) for _, tid, t_time, *_
+                    in self._database.trips_between(
+                        day + dt.timedelta(days=1), until)
+                    if tid in tids)
+        return list(days)
+
+    def closed_trips(self, fids: list[int], first_day: dt.date,
+                     end_day: dt.date) -> list[tuple]:
+        closed = set(fids)
+        waste_type = {fid: waste_t for fid, _, waste_t
+                      in self._database.tables['Facility']}
+        trucks = self.reference.trucks_by_tid
+        trips = [(rid, t_time, fid, waste_type[fid], trucks[tid].capacity)
+                 for rid, tid, t_time, _, _, _, fid
+                 in self._database.trips_between(first_day, end_day)
+                 if fid in closed]
+        trips.sort(key=lambda trip: (-trip[4], trip[1], trip[0]))
+        return trips
+
+    def open_facilities(self, fids: list[int]) -> list[tuple[int, str]]:
+        closed = set(fids)
+        return sorted((fid, waste_t) for fid, _, waste_t
+                      in self._database.tables['Facility']
+                      if fid not in closed)
+
+    def facility_load(self, fids: list[int], first_day: dt.date,
+                      end_day: dt.date) -> list[tuple[int, dt.date, float]]:
+        closed = set(fids)
+        trucks = self.reference.trucks_by_tid
+        loads = {}
+        for _, tid, t_time, _, _, _, fid in self._database.trips_between(
+                first_day, end_day):
+            if fid not in closed:
+                key = (fid, t_time.date())
+                loads[key] = loads.get(key, 0.0) + trucks[tid].capacity
+        return [(fid, day, load) for (fid, day), load in loads.items()]
+
+
+class LocalWasteWrangler:
+    """An in-process counterpart of WasteWrangler, whose tables are held in
+    memory rather than in a PostgreSQL database.
+
+    === Private Attributes ===
+    _database: the tables.
+    _reference: the reference data snapshot of <_database>, None until it is
+        first used or after Technician changes.
+
+    Representation invariants:
+    - <_database> conforms to the schema in waste_wrangler_schema.ddl.
+    """
+    _database: _LocalDatabase
+    _reference: Optional[_ReferenceData]
+
+    def __init__(self) -> None:
+        """Initialize this LocalWasteWrangler with empty tables."""
+        self._database = _LocalDatabase()
+        self._reference = None
+
+    def connect(self, dbname: str = '', username: str = '',
+                password: str = '', pool_size: int = 0) -> bool:
+        """Accept the arguments of WasteWrangler.connect, so that either class
+        can be used, and return True: there is no server to connect to.
+        """
+        return True
+
+    def disconnect(self) -> bool:
+        """Return True: there is no connection to close. The tables are kept.
+        """
+        return True
+
+    def load_data(self, file_path: str) -> None:
+        """Empty every table, then run the INSERT statements of the data file
+        at <file_path>, read as a2assignment.setup reads it. SET statements
+        are skipped; any other statement raises a LocalError.
+        """
+        names = {table.lower(): table for table in _COLUMNS}
+        tables = {table: [] for table in _COLUMNS}
+        with open(file_path, 'r') as data_file:
+            for name, statement in _read_data_file(data_file, 10000):
+                if name is None:
+                    if statement.split(None, 1)[0].upper() == 'SET':
+                        continue
+                    raise LocalError(f"unsupported statement: {statement}")
+                if name.lower() not in names:
+                    raise LocalError(f"unknown table: {name}")
+                tables[names[name.lower()]].extend(statement)
+        self.load_rows(tables)
+
+    def load_rows(self, tables: dict[str, list[tuple]]) -> None:
+        """Empty every table, then fill the tables in <tables>, each mapped to
+        its rows, with values in the order of the table's columns.
+        """
+        database = _LocalDatabase()
+        for table in _COLUMNS:
+            database.insert(table, tables.get(table, []))
+        self._database = database
+        self._reference = None
+
+    def rows(self, table: str) -> list[tuple]:
+        """Return the rows of <table>, sorted, as a query on the database
+        returns them.
+        """
+        return sorted(self._database.tables[table],
+                      key=lambda row: tuple((value is None, value)
+                                            for value in row))
+
+    def schedule_trip(self, rid: int, time: dt.datetime) -> bool:
+        """Schedule a trip on route <rid> at <time>, following the rules of
+        WasteWrangler.schedule_trip.
+
+        Return True iff a trip has been scheduled successfully.
+        """
+        return self.schedule_trip_many([(rid, time)])[0]
+
+    def schedule_trip_many(
+            self, requests: Iterable[tuple[int, dt.datetime]]) -> list[bool]:
+        """Schedule a trip for every (rid, time) pair in <requests>, as
+        WasteWrangler.schedule_trip_many does.
+        """
+        requests = list(requests)
+        trips = self.plan_trip_many(requests)
+        new_trips = [trip for trip in trips if trip is not None]
+        try:
+            self._database.insert('Trip', new_trips)
+        except LocalError:
+            return [False] * len(requests)
+        return [trip is not None for trip in trips]
+
+    def schedule_trips(self, tid: int, date: dt.date) -> int:
+        """Schedule the truck <tid> for trips on <date>, following the rules
+        of WasteWrangler.schedule_trips.
+
+        Return the number of trips that were scheduled successfully.
+        """
+        counts, _ = self.schedule_fleet(date, [tid])
+        return counts.get(tid, 0)
+
+    def schedule_fleet(self, date: dt.date, tids: Optional[Iterable[int]] = None
+                       ) -> tuple[dict[int, int], dict[str, float]]:
+        """Schedule trips on <date> for every truck in <tids>, or for every
+        truck if <tids> is None, as WasteWrangler.schedule_fleet does.
+        """
+        counts = {}
+        timings = {'load': 0.0, 'plan': 0.0, 'write': 0.0}
+        date = _as_day(date)
+
+        started = perf_counter()
+        if tids is not None:
+            tids = list(tids)
+            counts = {tid: 0 for tid in tids}
+        loader = self._loader()
+        trucks = loader.fleet_trucks(tids)
+        plan = WasteWrangler._load_day_plan(loader, date)
+        timings['load'] = perf_counter() - started
+
+        started = perf_counter()
+        planned, new_trips = plan.plan_fleet(trucks)
+        counts.update(planned)
+        timings['plan'] = perf_counter() - started
+
+        started = perf_counter()
+        try:
+            self._database.insert('Trip', new_trips)
+        except LocalError:
+            return {tid: 0 for tid in counts}, timings
+        timings['write'] = perf_counter() - started
+        return counts, timings
+
+    def update_technicians(self, qualifications_file: TextIO,
+                           chunk_size: int = 10000,
+                           commit_every: Optional[int] = None,
+                           progress: Optional[Callable[[int], None]] = None
+                           ) -> int:
+        """Record the qualifications in <qualifications_file>, following the
+        rules of WasteWrangler.update_technicians. <commit_every> is accepted
+        for compatibility: every chunk is kept as soon as it is checked.
+
+        Return the number of qualifications added.
+        """
+        tables = self._database.tables
+        eid_by_name = {}
+        for eid, name, _ in sorted(tables['Employee']):
+            eid_by_name.setdefault(name, eid)
+        truck_types = {truck_t for truck_t, _ in tables['TruckType']}
+        drivers = {eid for eid, _ in tables['Driver']}
+        qualified = self._database.keys['Technician'][0]
+
+        num_changed = processed = 0
+        for chunk in WasteWrangler._read_qualifications_file(
+                qualifications_file, chunk_size):
+            new_rows = {}
+            for fname, lname, truck_t in chunk:
+                eid = eid_by_name.get(f"{fname} {lname}")
+                if (eid is not None and truck_t in truck_types
+                        and eid not in drivers
+                        and (eid, truck_t) not in qualified):
+                    new_rows[eid, truck_t] = None
+            self._database.insert('Technician', new_rows)
+            num_changed += len(new_rows)
+
+            processed += len(chunk)
+            if progress is not None:
+                progress(2 * processed)
+
+        if num_changed:
+            self._reference = None
+        return num_changed
+
+    def workmate_sphere(self, eid: int, mode: str = 'auto') -> list[int]:
+        """Return the workmate sphere of the driver <eid>, as defined in
+        WasteWrangler.workmate_sphere. Every <mode> walks the trips in memory.
+        """
+        if mode not in ('auto', 'client', 'server', 'table'):
+            raise ValueError(f"Unknown workmate_sphere mode: {mode!r}")
+        if eid not in self._reference_data().drivers_by_eid:
+            return []
+        return self._workmates().sphere(eid)
+
+    def workmate_spheres(self, eids: Iterable[int]) -> dict[int, list[int]]:
+        """Return the workmate sphere of every eID in <eids>."""
+        drivers = self._reference_data().drivers_by_eid
+        workmates = self._workmates()
+        return {eid: workmates.sphere(eid) if eid in drivers else []
+                for eid in eids}
+
+    def workmate_components(self) -> list[list[int]]:
+        """Return every group of employees who are in each other's workmate
+        sphere, as WasteWrangler.workmate_components does.
+        """
+        return self._workmates().components()
+
+    def schedule_maintenance(self, date: dt.date,
+                             tids: Optional[Iterable[int]] = None) -> int:
+        """Schedule maintenance for the trucks due for it on <date>, among
+        <tids> if given, following the rules of
+        WasteWrangler.schedule_maintenance.
+
+        Return the number of maintenances scheduled, 0 if they break a key.
+        """
+        new_maintenance = self.plan_maintenance(date, tids)
+        try:
+            self._database.insert('Maintenance', new_maintenance)
+        except LocalError:
+            #insert adds nothing when any row fails, like a rollback
+            return 0
+        return len(new_maintenance)
+
+    def reroute_waste(self, fid: int, date: dt.date,
+                      balance: bool = False) -> int:
+        """Reroute the trips to <fid> on day <date>, following the rules of
+        WasteWrangler.reroute_waste.
+        """
+        if balance:
+            counts, _ = self.reroute_waste_balanced([fid], date, date)
+        else:
+            counts = self.reroute_waste_many([fid], date, date)
+        return counts.get(fid, 0)
+
+    def reroute_waste_balanced(
+            self, fids: Iterable[int], first_day: dt.date, last_day: dt.date
+            ) -> tuple[dict[int, int], dict[tuple[int, dt.date], float]]:
+        """Reroute the trips to any of the facilities <fids> from <first_day>
+        to <last_day>, inclusive, as WasteWrangler.reroute_waste_balanced
+        does.
+        """
+        fids = list(fids)
+        counts = {fid: 0 for fid in fids}
+        moved, projected = self._plan_reroute(fids, first_day, last_day,
+                                              True)
+        self._database.update_trip_facilities(
+            {(rid, t_time): new_fid for rid, t_time, _, new_fid in moved})
+        for _, _, fid, _ in moved:
+            counts[fid] += 1
+        return counts, projected
+
+    def reroute_waste_many(self, fids: Iterable[int], first_day: dt.date,
+                           last_day: dt.date) -> dict[int, int]:
+        """Reroute the trips to any of the facilities <fids> from <first_day>
+        to <last_day>, inclusive, as WasteWrangler.reroute_waste_many does.
+        """
+        fids = list(fids)
+        counts = {fid: 0 for fid in fids}
+        moved, _ = self._plan_reroute(fids, first_day, last_day, False)
+        self._database.update_trip_facilities(
+            {(rid, t_time): new_fid for rid, t_time, _, new_fid in moved})
+        for _, _, fid, _ in moved:
+            counts[fid] += 1
+        return counts
+
+    # ============================ Dry runs ================================== #
+    # As in WasteWrangler, each plan_* method returns the rows the scheduler
+    # of the same name would write, and changes nothing.
+
+    def plan_trip(self, rid: int, time: dt.datetime) -> Optional[tuple]:
+        """Return the Trip row schedule_trip(<rid>, <time>) would insert, or
+        None if it would fail.
+        """
+        return self.plan_trip_many([(rid, time)])[0]
+
+    def plan_trip_many(self, requests: Iterable[tuple[int, dt.datetime]]
+                       ) -> list[Optional[tuple]]:
+        """Return, for each (rid, time) in <requests>, the Trip row
+        schedule_trip_many(<requests>) would insert for it, or None.
+        """
+        requests = list(requests)
+        if not requests:
+            return []
+        resources = WasteWrangler._load_trip_resources(
+            self._loader(), sorted({rid for rid, _ in requests}),
+            sorted({time.date() for _, time in requests}))
+        return [resources.assign(rid, time) for rid, time in requests]
+
+    def plan_trips(self, tid: int, date: dt.date) -> list[tuple]:
+        """Return the Trip rows schedule_trips(<tid>, <date>) would insert."""
+        return self.plan_fleet(date, [tid])
+
+    def plan_fleet(self, date: dt.date,
+                   tids: Optional[Iterable[int]] = None) -> list[tuple]:
+        """Return the Trip rows schedule_fleet(<date>, <tids>) would insert.
+        """
+        date = _as_day(date)
+        loader = self._loader()
+        trucks = loader.fleet_trucks(None if tids is None else list(tids))
+        _, new_trips = WasteWrangler._load_day_plan(
+            loader, date).plan_fleet(trucks)
+        return new_trips
+
+    def plan_maintenance(self, date: dt.date,
+                         tids: Optional[Iterable[int]] = None
+                         ) -> list[tuple[int, int, dt.date]]:
+        """Return the Maintenance rows schedule_maintenance(<date>, <tids>)
+        would insert.
+        """
+        date = _as_day(date)
+        return WasteWrangler._plan_maintenance(self._loader(), date, tids)
+
+    def plan_reroute(self, fids: Iterable[int], first_day: dt.date,
+                     last_day: dt.date, balance: bool = False
+                     ) -> list[tuple[int, dt.datetime, int, int]]:
+        """Return the (rID, tTIME, old fID, new fID) of every trip that
+        reroute_waste_many(<fids>, <first_day>, <last_day>), or
+        reroute_waste_balanced if <balance> is True, would move.
+        """
+        moved, _ = self._plan_reroute(list(fids), first_day, last_day,
+                                      balance)
+        return moved
+
+    def _reference_data(self) -> _ReferenceData:
+        """Return the reference data snapshot of the tables, reading it if
+        there is none.
+        """
+        if self._reference is None:
+            self._reference = _ReferenceData.load(self._database.cursor())
+        return self._reference
+
+    def _workmates(self) -> _WorkmateGraph:
+        """Return the workmate components of every employee who has been on a
+        trip.
+        """
+        return _WorkmateGraph({(eid1, eid2) for *_, eid1, eid2, _
+                               in self._database.tables['Trip']})
+
+    def _loader(self) -> _LocalLoader:
+        """Return a loader that reads the planners' rows from the tables."""
+        return _LocalLoader(self._database, self._reference_data())
+
+    def _plan_reroute(self, fids: list[int], first_day: dt.date,
+                      last_day: dt.date, balance: bool
+                      ) -> tuple[list[tuple[int, dt.datetime, int, int]],
+                                 dict[tuple[int, dt.date], float]]:
+        """Helper for the reroute methods. Return the trips to the facilities
+        <fids> from <first_day> to <last_day>, inclusive, to move and the
+        projected loads, as WasteWrangler._plan_reroute does.
+        """
+        first_day = _as_day(first_day)
+        last_day = _as_day(last_day)
+        return WasteWrangler._plan_reroute(self._loader(), fids, first_day,
+                                           last_day, balance)
+
+def test_preliminary() -> None:
+    """Run the checks of a2assignment.test_preliminary on a
+    LocalWasteWrangler loaded with ./waste_wrangler_data.sql.
+    """
+    ww = LocalWasteWrangler()
+    ww.load_data('./waste_wrangler_data.sql')
+
+    scheduled_trip = ww.schedule_trip(1, dt.datetime(2023, 5, 4, 8, 0))
+    assert scheduled_trip, \
+        f"[Schedule Trip] Expected True, Got {scheduled_trip}"
+    scheduled_trip = ww.schedule_trip(1, dt.datetime(2023, 5, 4, 13, 0))
+    assert not scheduled_trip, \
+        f"[Schedule Trip] Expected False, Got {scheduled_trip}"
+
+    scheduled_trips = ww.schedule_trips(1, dt.datetime(2023, 5, 3))
+    assert scheduled_trips == 0, \
+        f"[Schedule Trips] Expected 0, Got {scheduled_trips}"
+
+    with open('qualifications.txt', 'r') as qf:
+        updated_technicians = ww.update_technicians(qf)
+    assert updated_technicians == 2, \
+        f"[Update Technicians] Expected 2, Got {updated_technicians}"
+
+    workmate_sphere = ww.workmate_sphere(2023)
+    assert len(workmate_sphere) == 0, \
+        f"[Workmate Sphere] Expected [], Got {workmate_sphere}"
+    workmate_sphere = ww.workmate_sphere(3)
+    assert set(workmate_sphere) == {1, 2}, \
+        f"[Workmate Sphere] Expected {{1, 2}}, Got {workmate_sphere}"
+
+    scheduled_maintenance = ww.schedule_maintenance(dt.date(2023, 5, 5))
+    assert scheduled_maintenance == 7, \
+        f"[Schedule Maintenance] Expected 7, Got {scheduled_maintenance}"
+
+    reroute_waste = ww.reroute_waste(1, dt.date(2023, 5, 10))
+    assert reroute_waste == 0, \
+        f"[Reroute Waste] Expected 0. Got {reroute_waste}"
+    reroute_waste = ww.reroute_waste(1, dt.date(2023, 5, 3))
+    assert reroute_waste == 1, \
+        f"[Reroute Waste] Expected 1. Got {reroute_waste}"
+
+
+if __name__ == '__main__':
+    test_preliminary()
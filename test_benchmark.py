@@ -0,0 +1,74 @@
+"""CSC343 Assignment 2 benchmark tests
+
+=== Module Description ===
+
+This file contains pytest tests of the parts of a2benchmark.py that need no
+database: the comparison of a run against a baseline, and the synthetic
+datasets. Run them as:
+    python -m pytest -q test_benchmark.py
+"""
+
+from a2benchmark import compare, generate_rows
+
+
+def _run(**methods: tuple[float, float]) -> dict[str, dict]:
+    """Return the results of a benchmark_methods run at scale '1' in which
+    each method in <methods> has the (median, statements per call) given.
+    """
+    return {'1': {'methods': {
+        method: {'median': median, 'statements_per_call': statements}
+        for method, (median, statements) in methods.items()}}}
+
+
+# ================================ compare ================================= #
+
+def test_compare_reports_a_slower_median() -> None:
+    """A median more than <tolerance> slower is a regression."""
+    assert compare(_run(schedule_trip=(0.010, 2.0)),
+                   _run(schedule_trip=(0.020, 2.0))) == [
+        "schedule_trip at 1x: median 0.0100s -> 0.0200s"]
+
+
+def test_compare_allows_slowdowns_within_the_threshold() -> None:
+    """A median at most <tolerance> slower, or at most <floor> seconds
+    slower, is not a regression.
+    """
+    baseline = _run(schedule_trip=(0.010, 2.0))
+    assert compare(baseline, _run(schedule_trip=(0.0125, 2.0))) == []
+    assert compare(baseline, _run(schedule_trip=(0.0125, 2.0)),
+                   tolerance=0.2) == [
+        "schedule_trip at 1x: median 0.0100s -> 0.0125s"]
+    assert compare(baseline, _run(schedule_trip=(0.0125, 2.0)),
+                   tolerance=0.2, floor=0.005) == []
+
+
+def test_compare_reports_more_statements() -> None:
+    """Sending more statements per call is a regression, whatever the
+    time, and sending fewer is not.
+    """
+    baseline = _run(schedule_fleet=(0.010, 4.0), reroute_waste=(0.010, 3.0))
+    assert compare(baseline, _run(schedule_fleet=(0.005, 5.0),
+                                  reroute_waste=(0.010, 2.0))) == [
+        "schedule_fleet at 1x: 4.0 -> 5.0 statements per call"]
+
+
+def test_compare_skips_missing_and_new_entries() -> None:
+    """Methods and scales in only one of the runs are not compared."""
+    baseline = _run(schedule_trip=(0.010, 2.0), reroute_waste=(0.010, 3.0))
+    results = _run(schedule_trip=(0.010, 2.0), schedule_fleet=(1.0, 50.0))
+    results['10'] = _run(schedule_trip=(1.0, 50.0))['1']
+    assert compare(baseline, results) == []
+    assert compare({}, results) == []
+
+
+# ============================= generate_rows ============================== #
+
+def test_generate_rows_is_deterministic() -> None:
+    """The same scale and seed give the same rows, and another seed does
+    not.
+    """
+    rows = generate_rows(1, 7)
+    assert generate_rows(1, 7) == rows
+    assert generate_rows(1, 8) != rows
+    assert all(rows[table] for table in ('Truck', 'Employee', 'Route',
+                                         'Trip'))
@@ -0,0 +1,473 @@
+"""CSC343 Assignment 2 planner tests
+
+=== Module Description ===
+
+This file contains pytest tests of the in-memory planners of a2assignment.py,
+run directly and through LocalWasteWrangler (a2local.py), and of its reader
+of data files, so that they need no database. Run them as:
+    python -m pytest -q test_planners.py
+"""
+
+import datetime as dt
+import io
+
+from a2assignment import (
+    _Calendar, _DayPlan, _IntervalIndex, _MaintenancePlan, _TripResources,
+    _WorkmateGraph, _balance_trips, _group_drivers, _maintenance_shards,
+    _read_data_file
+)
+from a2local import LocalWasteWrangler
+
+DAY = dt.date(2023, 6, 1)
+
+
+def _at(hour: int, minute: int = 0, day: dt.date = DAY) -> dt.datetime:
+    """Return the time <hour>:<minute> on <day>."""
+    return dt.datetime.combine(day, dt.time(hour, minute))
+
+
+def _tables(trips: list[tuple] = (),
+            maintenance: list[tuple] = ()) -> dict[str, list[tuple]]:
+    """Return a small dataset, as LocalWasteWrangler.load_rows takes it, with
+    the Trip rows <trips> and the Maintenance rows <maintenance>.
+
+    Trucks 1 and 2 (type A) carry garbage, truck 3 (B) recycling, truck 4 (C)
+    compost and truck 5 (D) garbage. Technicians 1 and 2 link types A and B,
+    technician 3 maintains C and nobody maintains D.
+    """
+    return {
+        'TruckType': [('A', 'garbage'), ('B', 'recycling'), ('C', 'compost'),
+                      ('D', 'garbage')],
+        'Truck': [(1, 'A', 10), (2, 'A', 20), (3, 'B', 10), (4, 'C', 5),
+                  (5, 'D', 5)],
+        'Employee': [(eid, f"Employee {eid}", dt.date(2010 + eid, 1, 1))
+                     for eid in range(1, 7)],
+        'Driver': [(1, 'A'), (2, 'A'), (3, 'B'), (4, 'A'), (5, 'C'),
+                   (6, 'B')],
+        'Technician': [(1, 'A'), (2, 'A'), (2, 'B'), (3, 'C')],
+        'Route': [(1, 'garbage', 10.0), (2, 'garbage', 5.0),
+                  (3, 'recycling', 10.0), (4, 'compost', 5.0)],
+        'Facility': [(1, '1 Main St', 'garbage'), (2, '2 Main St', 'garbage'),
+                     (3, '3 Main St', 'recycling'),
+                     (4, '4 Main St', 'compost')],
+        'Maintenance': list(maintenance),
+        'Trip': list(trips),
+    }
+
+
+def _local(trips: list[tuple] = (),
+           maintenance: list[tuple] = ()) -> LocalWasteWrangler:
+    """Return a LocalWasteWrangler holding _tables(<trips>, <maintenance>)."""
+    ww = LocalWasteWrangler()
+    ww.load_rows(_tables(trips, maintenance))
+    return ww
+
+
+def _day_plan(trips: list[tuple] = (),
+              maintenance: list[tuple] = ()) -> _DayPlan:
+    """Return the _DayPlan of DAY for garbage routes 1 (1 hour) and 3
+    (2 hours), recycling route 2 (1 hour) and drivers 1, 2 and 3 of type A,
+    with the (rID, tID, tTIME, length, eID1, eID2) <trips> and
+    (tID, mDATE) <maintenance>.
+    """
+    drivers = [(1, dt.date(2010, 1, 1), {'A'}),
+               (2, dt.date(2011, 1, 1), {'A'}),
+               (3, dt.date(2012, 1, 1), {'A'})]
+    return _DayPlan(DAY, [(1, 'garbage', 5.0), (2, 'recycling', 5.0),
+                          (3, 'garbage', 10.0)],
+                    drivers, {'garbage': 7, 'recycling': 8},
+                    list(trips), list(maintenance))
+
+
+def _trip_resources(tables: dict[str, list[tuple]]) -> _TripResources:
+    """Return the _TripResources of <tables>, as LocalWasteWrangler.load_rows
+    takes them, built straight from their rows.
+    """
+    capacity = {tid: capacity for tid, _, capacity in tables['Truck']}
+    waste_types = {}
+    for truck_t, waste_t in tables['TruckType']:
+        waste_types.setdefault(truck_t, []).append(waste_t)
+    trucks = [(tid, truck_t, waste_t)
+              for tid, truck_t, _ in sorted(
+                  tables['Truck'], key=lambda row: (-row[2], row[0]))
+              for waste_t in waste_types[truck_t]]
+
+    hired = {eid: hire_date for eid, _, hire_date in tables['Employee']}
+    drivers = _group_drivers(sorted((eid, hired[eid], truck_t)
+                                    for eid, truck_t in tables['Driver']))
+    facilities = {}
+    for fid, _, waste_t in sorted(tables['Facility']):
+        facilities.setdefault(waste_t, fid)
+    lengths = {rid: length for rid, _, length in tables['Route']}
+    return _TripResources(
+        [(rid, waste_t, length) for rid, waste_t, length in tables['Route']],
+        trucks, drivers, facilities,
+        [(tid, m_date) for tid, _, m_date in tables['Maintenance']],
+        [(rid, tid, t_time, lengths[rid], eid1, eid2)
+         for rid, tid, t_time, _, eid1, eid2, _ in tables['Trip']])
+
+
+# ============================== _DayPlan ================================== #
+
+def test_day_plan_lays_trips_out_from_eight() -> None:
+    """A free truck gets its routes from 8:00, 30 minutes apart, with the
+    two most experienced drivers.
+    """
+    plan = _day_plan()
+    assert plan.plan_truck(9, 'A', {'garbage'}) == [
+        (1, 9, _at(8), None, 2, 1, 7),
+        (3, 9, _at(9, 30), None, 2, 1, 7)]
+    assert plan.unscheduled == {2}
+    assert plan.busy == {1, 2}
+
+
+def test_day_plan_skips_routes_and_drivers_taken() -> None:
+    """Routes with a trip on the day are not planned again, and drivers on a
+    trip that day are not used.
+    """
+    plan = _day_plan(trips=[(1, 8, _at(8), 5.0, 2, 4)])
+    assert plan.plan_truck(9, 'A', {'garbage'}) == [
+        (3, 9, _at(8), None, 3, 1, 7)]
+
+
+def test_day_plan_needs_two_free_drivers() -> None:
+    """A truck gets no trips when fewer than two drivers are free all day."""
+    plan = _day_plan(trips=[(2, 8, _at(8), 5.0, 2, 1)])
+    assert plan.plan_truck(9, 'A', {'garbage'}) == []
+
+
+def test_day_plan_works_around_a_busy_truck() -> None:
+    """A truck already on a trip gets its new trips at least 30 minutes
+    before or after it.
+    """
+    plan = _day_plan(trips=[(2, 9, _at(9), 5.0, 3, 4)])
+    # 8:00-9:00 would end within 30 minutes of the 9:00 trip
+    assert plan.plan_truck(9, 'A', {'garbage'}) == [
+        (1, 9, _at(10, 30), None, 2, 1, 7),
+        (3, 9, _at(12), None, 2, 1, 7)]
+
+
+def test_day_plan_fits_a_trip_before_a_busy_truck() -> None:
+    """A trip that ends exactly 30 minutes before one of the truck's trips
+    fits in front of it.
+    """
+    plan = _day_plan(trips=[(2, 9, _at(12), 5.0, 3, 4)])
+    assert plan.plan_truck(9, 'A', {'garbage'}) == [
+        (1, 9, _at(8), None, 2, 1, 7),
+        (3, 9, _at(9, 30), None, 2, 1, 7)]
+
+
+def test_day_plan_skips_a_maintained_truck() -> None:
+    """A truck under maintenance on the day gets no trips, and leaves the
+    routes and drivers to the others.
+    """
+    plan = _day_plan(maintenance=[(9, DAY)])
+    assert plan.plan_truck(9, 'A', {'garbage'}) == []
+    assert plan.plan_truck(10, 'A', {'garbage'})[0][:2] == (1, 10)
+
+
+def test_schedule_fleet_works_around_a_busy_truck() -> None:
+    """schedule_trips places a truck's new trip 30 minutes after the trip it
+    already has, and does not use its drivers.
+    """
+    ww = _local(trips=[(1, 2, _at(8), None, 6, 4, 1)])
+    assert ww.schedule_trips(2, DAY) == 1
+    assert ww.rows('Trip') == [(1, 2, _at(8), None, 6, 4, 1),
+                               (2, 2, _at(10, 30), None, 2, 1, 1)]
+
+
+def test_schedule_fleet_skips_a_maintained_truck() -> None:
+    """schedule_fleet schedules nothing for a truck under maintenance, and
+    gives its routes to the next truck.
+    """
+    ww = _local(maintenance=[(1, 1, DAY)])
+    counts, _ = ww.schedule_fleet(DAY, [1, 2])
+    assert counts == {1: 0, 2: 2}
+
+
+# ============================ _TripResources ============================== #
+
+def test_trip_resources_prefers_the_biggest_truck() -> None:
+    """A trip gets the biggest free truck for its waste type, and the next
+    one once that truck is taken.
+    """
+    resources = _trip_resources(_tables())
+    assert resources.assign(1, _at(9)) == (1, 2, _at(9), None, 2, 1, 1)
+    assert resources.assign(2, _at(9)) == (2, 1, _at(9), None, 4, 3, 1)
+
+
+def test_trip_resources_breaks_capacity_ties_by_tid() -> None:
+    """Among trucks of the same capacity, the one with the lower tID is
+    picked.
+    """
+    tables = _tables()
+    tables['Truck'] = [(2, 'A', 20), (1, 'A', 20), (3, 'B', 10)]
+    assert _trip_resources(tables).assign(1, _at(9))[1] == 1
+
+
+def test_trip_resources_skips_drivers_within_the_buffer() -> None:
+    """Drivers on a trip that ends 30 minutes or less before the new one
+    starts are not free, and are again past that.
+    """
+    # drivers 1 and 2 are on route 3 from 8:00 to 10:00
+    trips = [(3, 3, _at(8), None, 2, 1, 3)]
+    assert _trip_resources(_tables(trips)).assign(1, _at(10, 30)) == (
+        1, 2, _at(10, 30), None, 4, 3, 1)
+    assert _trip_resources(_tables(trips)).assign(1, _at(10, 31)) == (
+        1, 2, _at(10, 31), None, 2, 1, 1)
+
+
+def test_trip_resources_skips_a_maintained_truck() -> None:
+    """A truck under maintenance on the day of the trip is not used."""
+    resources = _trip_resources(_tables(maintenance=[(2, 1, DAY)]))
+    assert resources.assign(1, _at(9))[1] == 1
+    resources = _trip_resources(
+        _tables(maintenance=[(2, 1, DAY + dt.timedelta(days=1))]))
+    assert resources.assign(1, _at(9))[1] == 2
+
+
+def test_trip_resources_match_local_schedule_trip() -> None:
+    """_TripResources built straight from the tables assigns the trips that
+    LocalWasteWrangler.schedule_trip schedules on the same tables.
+    """
+    trips = [(3, 3, _at(8), None, 2, 1, 3)]
+    maintenance = [(2, 1, DAY)]
+    requests = [(1, _at(8)), (2, _at(8)), (2, _at(12)), (4, _at(10, 15)),
+                (3, _at(15)), (3, _at(10, 30, DAY + dt.timedelta(days=1))),
+                (1, _at(7))]
+
+    resources = _trip_resources(_tables(trips, maintenance))
+    expected = [resources.assign(rid, time) for rid, time in requests]
+    ww = _local(trips, maintenance)
+    assert ([ww.schedule_trip(rid, time) for rid, time in requests]
+            == [trip is not None for trip in expected])
+    assert ww.rows('Trip') == sorted(
+        trips + [trip for trip in expected if trip is not None])
+
+
+# ============================== _Calendar ================================= #
+
+def test_calendar_marks_days() -> None:
+    """Days are taken once marked, and days before the start are free."""
+    calendar = _Calendar(DAY, [(1, DAY), (1, DAY + dt.timedelta(days=2)),
+                               (1, DAY - dt.timedelta(days=1))])
+    assert not calendar.is_free(1, DAY)
+    assert calendar.is_free(1, DAY + dt.timedelta(days=1))
+    assert calendar.is_free(1, DAY - dt.timedelta(days=1))
+    assert calendar.is_free(2, DAY)
+    assert calendar.taken(1) == 0b101
+
+
+def test_calendar_first_free() -> None:
+    """first_free finds the first clear day, also of bitsets combined."""
+    calendar = _Calendar(DAY, [(1, DAY), (1, DAY + dt.timedelta(days=2))])
+    calendar.mark_until(2, DAY + dt.timedelta(days=1))
+    assert calendar.taken(2) == 0b11
+
+    assert calendar.first_free(calendar.taken(1), DAY) \
+        == DAY + dt.timedelta(days=1)
+    assert calendar.first_free(calendar.taken(1), DAY + dt.timedelta(days=2)) \
+        == DAY + dt.timedelta(days=3)
+    assert calendar.first_free(calendar.taken(1) | calendar.taken(2), DAY) \
+        == DAY + dt.timedelta(days=3)
+    assert calendar.first_free(calendar.taken(1) & calendar.taken(2), DAY) \
+        == DAY + dt.timedelta(days=1)
+    assert calendar.first_free(calendar.taken(1),
+                               DAY - dt.timedelta(days=4)) \
+        == DAY - dt.timedelta(days=4)
+
+
+def test_calendar_is_free_between() -> None:
+    """is_free_between checks every day of the range, both ends included,
+    and days before the start are free.
+    """
+    calendar = _Calendar(DAY, [(1, DAY + dt.timedelta(days=3))])
+    assert calendar.is_free_between(1, DAY, DAY + dt.timedelta(days=2))
+    assert not calendar.is_free_between(1, DAY, DAY + dt.timedelta(days=3))
+    assert not calendar.is_free_between(1, DAY + dt.timedelta(days=3),
+                                        DAY + dt.timedelta(days=9))
+    assert calendar.is_free_between(1, DAY + dt.timedelta(days=4),
+                                    DAY + dt.timedelta(days=9))
+    assert calendar.is_free_between(1, DAY - dt.timedelta(days=5),
+                                    DAY - dt.timedelta(days=1))
+    assert not calendar.is_free_between(1, DAY - dt.timedelta(days=5),
+                                        DAY + dt.timedelta(days=5))
+
+
+# ============================ _IntervalIndex ============================== #
+
+def test_interval_index_bounds_are_inclusive() -> None:
+    """An interval that only touches a busy one overlaps it."""
+    index = _IntervalIndex([(1, _at(9), _at(10))])
+    assert not index.is_free(1, _at(10), _at(11))
+    assert not index.is_free(1, _at(8), _at(9))
+    assert index.is_free(1, _at(10, 1), _at(11))
+    assert index.is_free(1, _at(7), _at(8, 59))
+    assert index.is_free(2, _at(9), _at(10))
+
+
+def test_interval_index_long_interval_covers_later_ones() -> None:
+    """A long interval that starts first still blocks times after the
+    shorter intervals that start inside it, however they were added.
+    """
+    index = _IntervalIndex([(1, _at(9), _at(9, 30)), (1, _at(8), _at(12))])
+    assert not index.is_free(1, _at(10), _at(11))
+    assert index.is_free(1, _at(12, 1), _at(13))
+
+    index.add(1, _at(14), _at(15))
+    index.add(1, _at(6), _at(13, 30))
+    assert not index.is_free(1, _at(13), _at(13, 10))
+    assert index.is_free(1, _at(13, 31), _at(13, 59))
+    assert not index.is_free(1, _at(13, 31), _at(14))
+
+
+# ============================ _WorkmateGraph ============================== #
+
+def test_workmate_graph_spheres() -> None:
+    """Employees are in the sphere of everyone they are linked to by trips,
+    directly or not.
+    """
+    graph = _WorkmateGraph([(1, 2), (3, 4)])
+    assert graph.sphere(1) == [2]
+    assert graph.sphere(9) == [] and graph.root(9) is None
+    assert graph.components() == [[1, 2], [3, 4]]
+
+    graph.add(2, 3)
+    assert graph.sphere(4) == [1, 2, 3]
+    assert graph.components() == [[1, 2, 3, 4]]
+    assert len(graph) == 4
+    assert len({root for _, root in graph.roots()}) == 1
+
+
+def test_workmate_graph_add_reports_moves() -> None:
+    """add returns the employees that are new or changed root, and nothing
+    for a pair already in one tree.
+    """
+    graph = _WorkmateGraph([(1, 2)])
+    assert graph.add(1, 2) == []
+    assert graph.add(6, 7) == [(6, 6), (7, 6)]
+    # equal trees: the tree of the first employee takes the other
+    assert graph.add(7, 1) == [(1, 6), (2, 6)]
+
+
+def test_local_workmate_sphere() -> None:
+    """LocalWasteWrangler.workmate_sphere follows the trips of the data."""
+    ww = _local(trips=[(1, 1, _at(8), None, 2, 1, 1),
+                       (3, 3, _at(8), None, 6, 3, 3)])
+    assert ww.workmate_sphere(1) == [2]
+    assert ww.workmate_sphere(6) == [3]
+    assert ww.workmate_sphere(5) == []
+
+
+# =========================== _MaintenancePlan ============================= #
+
+def test_maintenance_plan_picks_first_free_day() -> None:
+    """Each truck is maintained on the first day after the plan's day on
+    which it and a technician hired before it are free, by the technician
+    with the lowest eID.
+    """
+    day1, day2, day3 = (DAY + dt.timedelta(days=offset)
+                        for offset in range(1, 4))
+    plan = _MaintenancePlan(DAY, [(1, 'A'), (2, 'A'), (3, 'Z')],
+                            [(5, 'A', dt.date(2000, 1, 1)), (6, 'A', day2)],
+                            [(5, day1)], [(1, day2)])
+    # technician 6 can only work from day3, and technician 5 is busy on day1
+    assert plan.plan_truck(1, 'A') == (1, 5, day3)
+    assert plan.plan_truck(2, 'A') == (2, 5, day2)
+    assert plan.plan_truck(3, 'Z') is None
+    assert not plan.taken_trucks.is_free(1, day3)
+    assert not plan.taken_technicians.is_free(5, day2)
+
+
+def test_maintenance_plan_all() -> None:
+    """plan_all plans every truck in order, leaving out those no technician
+    can maintain.
+    """
+    plan = _MaintenancePlan(DAY, [(1, 'A'), (2, 'Z'), (3, 'A')],
+                            [(5, 'A', dt.date(2000, 1, 1)),
+                             (6, 'A', dt.date(2000, 1, 1))], [], [])
+    day1 = DAY + dt.timedelta(days=1)
+    assert plan.plan_all() == [(1, 5, day1), (3, 6, day1)]
+
+
+def test_local_schedule_maintenance() -> None:
+    """LocalWasteWrangler.schedule_maintenance schedules every truck some
+    technician can maintain and that is not maintained recently.
+    """
+    ww = _local(maintenance=[(1, 1, DAY - dt.timedelta(days=10))])
+    assert ww.schedule_maintenance(DAY) == 3
+    assert {tid for tid, _, _ in ww.rows('Maintenance')} == {1, 2, 3, 4}
+
+
+
+def test_local_plan_maintenance_past_the_horizon() -> None:
+    """A truck taken on every day that is read at first is maintained on
+    its first free day after them.
+    """
+    trips = [(4, 4, _at(8, day=DAY + dt.timedelta(days=days)), None, 5, 3, 4)
+             for days in range(1, 41)]
+    assert _local(trips).plan_maintenance(DAY, [4]) == [
+        (4, 3, DAY + dt.timedelta(days=41))]
+
+
+# ============================= _balance_trips ============================= #
+
+def test_balance_trips_picks_least_loaded_facility() -> None:
+    """Each trip goes to the facility with the lowest load on its day, the
+    lowest fID among equals, and trips with no facility are left out.
+    """
+    day2 = DAY + dt.timedelta(days=1)
+    facilities = [(1, 'garbage'), (2, 'garbage'), (3, 'recycling')]
+    trips = [(1, _at(8), 9, 'garbage', 5), (2, _at(9), 9, 'garbage', 5),
+             (3, _at(10), 9, 'garbage', 20), (4, _at(11), 9, 'compost', 5),
+             (5, _at(8, day=day2), 9, 'garbage', 5)]
+    moved, projected = _balance_trips(trips, facilities, [(1, DAY, 10)])
+    assert moved == [(1, _at(8), 9, 2), (2, _at(9), 9, 2),
+                     (3, _at(10), 9, 1), (5, _at(8, day=day2), 9, 1)]
+    assert projected == {(1, DAY): 30, (2, DAY): 10, (1, day2): 5,
+                         (2, day2): 0}
+
+
+
+def test_local_reroute_waste_many() -> None:
+    """LocalWasteWrangler moves the trips to a closed facility to the
+    smallest open fID that takes the same waste, biggest truck first, and
+    leaves those with no such facility where they are.
+    """
+    ww = _local(trips=[(1, 1, _at(8), None, 1, 2, 1),
+                       (2, 2, _at(10), None, 1, 2, 1),
+                       (4, 4, _at(8), None, 5, 3, 4)])
+    assert ww.plan_reroute([1, 4], DAY, DAY) == [(2, _at(10), 1, 2),
+                                                 (1, _at(8), 1, 2)]
+    assert ww.reroute_waste_many([1, 4], DAY, DAY) == {1: 2, 4: 0}
+    assert [row[6] for row in ww.rows('Trip')] == [2, 2, 4]
+
+
+# =========================== _maintenance_shards ========================== #
+
+def test_maintenance_shards() -> None:
+    """Trucks whose types share a technician are in one shard, and trucks no
+    technician can maintain are in none.
+    """
+    reference = _local()._reference_data()
+    assert _maintenance_shards(reference) == [[1, 2, 3], [4]]
+
+
+# ============================ _read_data_file ============================= #
+
+def test_read_data_file_drops_comments() -> None:
+    """-- comments are dropped wherever they are outside of a string, even
+    with a quote in them, and kept as text within one.
+    """
+    data_file = io.StringIO(
+        "-- the employees' table\n"
+        "INSERT INTO Employee VALUES (1, 'Ann -- O''Neil', '2020-01-01');"
+        " -- Ann's row\n"
+        "INSERT INTO Route VALUES\n"
+        "    (1, 'garbage', 10), -- the first route's\n"
+        "    (2, 'compost', 5);\n"
+        "SET search_path TO waste_wrangler; -- don't\n")
+    assert list(_read_data_file(data_file, 10)) == [
+        ('Employee', [('1', "Ann -- O'Neil", '2020-01-01')]),
+        ('Route', [('1', 'garbage', '10'), ('2', 'compost', '5')]),
+        (None, 'SET search_path TO waste_wrangler;\n')]